@@ -54,6 +54,8 @@ except IOError:
                   % _f)
 
 
+import sys
+import types
 import numpy as N
 
 import pyjmi
@@ -65,25 +67,56 @@ try:
     ipopt_present = pyjmi.environ['IPOPT_HOME']
 except:
     ipopt_present = False
-    
-#Import the model class allowing for users to type: from pyjmi import CasadiModel
-try:
-    import casadi
-    casadi_present = True
-except ImportError:
-    casadi_present = False
-if casadi_present:
+
+# The submodules in __all__, the CasADi interface and the casadi_present and
+# modelicacasadi_present flags are loaded when they are first accessed, see
+# _LazyModule, so that importing pyjmi is cheap in processes that do not use
+# them, such as worker processes.
+_casadi_interface_names = ['OptimizationProblem',
+                           'transfer_to_casadi_interface',
+                           'transfer_optimization_problem',
+                           'transfer_model',
+                           'CasadiModel']
+
+def _probe_casadi(module):
+    """
+    Set casadi_present and modelicacasadi_present of module by trying to
+    import casadi and modelicacasadi_wrapper.
+    """
     try:
-        import modelicacasadi_wrapper
-        modelicacasadi_present = True
+        import casadi
+        module.casadi_present = True
     except ImportError:
-        modelicacasadi_present = False
-    if modelicacasadi_present:
-        from casadi_interface import (OptimizationProblem,
-                                      transfer_to_casadi_interface,
-                                      transfer_optimization_problem,
-                                      transfer_model,
-                                      CasadiModel)
+        module.casadi_present = False
+    module.modelicacasadi_present = False
+    if module.casadi_present:
+        try:
+            import modelicacasadi_wrapper
+            module.modelicacasadi_present = True
+        except ImportError:
+            pass
+
+class _LazyModule(types.ModuleType):
+    
+    """
+    Module type of pyjmi, which loads attributes on demand.
+    """
+    
+    def __getattr__(self, name):
+        if name in ('casadi_present', 'modelicacasadi_present'):
+            _probe_casadi(self)
+        elif name in _casadi_interface_names:
+            #Allows for users to type: from pyjmi import CasadiModel
+            if self.modelicacasadi_present:
+                from pyjmi import casadi_interface
+                for n in _casadi_interface_names:
+                    setattr(self, n, getattr(casadi_interface, n))
+        elif name in __all__:
+            __import__(self.__name__ + '.' + name)
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
 
 def get_files_path():
     """Get the absolute path to the example files directory."""
@@ -92,3 +125,10 @@ def get_files_path():
                                " JMODELICA_HOME environment" \
                                " variable."
     return os.path.join(jmhome, 'Python', 'pyjmi', 'examples', 'files')
+
+# Replace this module by a _LazyModule with the same contents. The original
+# module is kept alive since its globals are cleared when it is deleted.
+_module = _LazyModule(__name__, __doc__)
+_module.__dict__.update(globals())
+_module._original_module = sys.modules[__name__]
+sys.modules[__name__] = _module
@@ -330,6 +330,11 @@ class LocalDAECollocationAlg(AlgorithmBase):
         if self.order != "default" and not self.write_scaled_result:
             raise NotImplementedError("Reordering is only supported with enabled write_scaled_result.")
         
+        # Check validity of result_handling
+        if self.result_handling not in ["file", "binary", "memory"]:
+            raise ValueError('Unknown result handling %s.' %
+                             self.result_handling)
+        
         # Solver options
         if self.solver == "IPOPT":
             self.solver_options = self.IPOPT_options
@@ -627,6 +632,22 @@ class LocalDAECollocationAlgOptions(OptionBase):
             Type: str
             Default: ""
         
+        result_handling --
+            Specifies how the result is stored.
+            
+            Possible values: "file", "binary" and "memory"
+            
+            "file": The result is written to a textual Dymola result file.
+            
+            "binary": The result is written to a binary (Matlab) Dymola
+            result file, which is considerably faster for large problems.
+            
+            "memory": The result is not written to file but kept in memory.
+            The result object then has no result file.
+            
+            Type: str
+            Default: "file"
+        
         result_mode --
             Specifies the output format of the optimization result.
             
@@ -775,6 +796,7 @@ class LocalDAECollocationAlgOptions(OptionBase):
                 'nominal_traj': None,
                 'nominal_traj_mode': {"_default_mode": "linear"},
                 'result_file_name': "",
+                'result_handling': "file",
                 'write_scaled_result': False,
                 'print_condition_numbers': False,
                 'result_mode': "collocation_points",
@@ -20,12 +20,14 @@ Module for writing optimization and simulation results to file.
 from operator import itemgetter
 import array
 import codecs
+import struct
 
 import numpy as N
 import scipy.io
 
 import jmi
-from pyjmi.common.io import ResultWriter
+from pyjmi.common.io import ResultWriter, JIOError, Trajectory
+from pyjmi.common.io import VariableNotFoundError, VariableNotTimeVarying
 from pyjmi.common import xmlparser
 
 def export_result_dymola(model, data, file_name='', format='txt', scaled=False):
@@ -283,17 +285,15 @@ class ResultWriterDymolaSensitivity(ResultWriter):
                 A FMUModel object.
             format  --
                 A text string equal either to 'txt for textual format
-                or 'mat' for binary Matlab format.
+                or 'mat' for binary Matlab format. In binary format, each 
+                point is appended to the file as one row of float64 data.
                 Defaults: txt
-                
-        Limitations::
-        
-            Currently only textual format is supported.
         """
         self.model = model
         
-        if format!='txt':
+        if format not in ('txt', 'mat'):
             raise JIOError('The format is currently not supported.')
+        self._format = format
         
         #Internal values
         self._file_open = False
@@ -316,18 +316,7 @@ class ResultWriterDymolaSensitivity(ResultWriter):
         """
         model = self.model
         if file_name=='':
-            file_name=model.get_identifier() + '_result.txt'
-
-        # Open file
-        f = codecs.open(file_name,'w','utf-8')
-        self._file_open = True
-
-        # Write header
-        f.write('#1\n')
-        f.write('char Aclass(3,11)\n')
-        f.write('Atrajectory\n')
-        f.write('1.1\n')
-        f.write('\n')
+            file_name=model.get_identifier() + '_result.' + self._format
         
         # Retrieve the xml-file
         md = model._get_XMLDoc()
@@ -405,68 +394,14 @@ class ResultWriterDymolaSensitivity(ResultWriter):
             tuple(variabilities)), 
             key=itemgetter(0))
         
-        # sort in value reference order (must match order in data)
-        #names = sorted(md.get_variable_names(), key=itemgetter(0))
-        #aliases = sorted(md.get_variable_aliases(), key=itemgetter(0))
-        #descriptions = sorted(md.get_variable_descriptions(), key=itemgetter(0))
-        #variabilities = sorted(md.get_variable_variabilities(), key=itemgetter(0))
-        
-        num_vars = len(names)+len(sens_names)
-        
-        # Find the maximum name and description length
-        max_name_length = len('Time')
-        max_desc_length = len('Time in [s]')
-        
-        for i in range(len(names)):
-            name = names[i][1]
-            desc = descriptions[i][1]
-            
-            if (len(name)>max_name_length):
-                max_name_length = len(name)
-                
-            if (len(desc)>max_desc_length):
-                max_desc_length = len(desc)
-        
-        for i in range(len(sens_names)):
-            
-            if (len(sens_names[i])>max_name_length):
-                max_name_length = len(sens_names[i])
-                
-            if (len(sens_desc[i])>max_desc_length):
-                max_desc_length = len(sens_desc[i])
-        
-        f.write('char name(%d,%d)\n' % (num_vars + 1, max_name_length))
-        f.write('time\n')
-        
         self._rescale = (model.get_scaling_method() == jmi.JMI_SCALING_VARIABLES) and (not scaled)
 
-        for name in names:
-            f.write(name[1] +'\n')
-        for name in sens_names:
-            f.write(name+'\n')
-
-        f.write('\n')
-
-        # Write descriptions       
-        f.write('char description(%d,%d)\n' % (num_vars + 1, max_desc_length))
-        f.write('Time in [s]\n')
-
-        # write descriptions
-        for desc in descriptions:
-            f.write(desc[1]+'\n')
-            
-        # Write sensitivity descriptions
-        for desc in sens_desc:
-            f.write(desc+'\n')
-            
-        f.write('\n')
-
-        # Write data meta information
+        # Data meta information, one (data set, column) pair per variable.
+        # The column is negative for negated aliases.
         offs = model.get_offsets()
         n_parameters = offs[12] # offs[12] = offs_dx
         self._n_parameters = n_parameters
-        f.write('int dataInfo(%d,%d)\n' % (num_vars + 1, 4))
-        f.write('0 1 0 -1 # time\n')
+        data_info = [(0, 1)] # time
 
         cnt_1 = 1
         cnt_2 = 1
@@ -477,19 +412,19 @@ class ResultWriterDymolaSensitivity(ResultWriter):
             if int(ref) < n_parameters: # Put parameters in data set
                 if aliases[i][1] == 0: # no alias
                     cnt_1 = cnt_1 + 1
-                    f.write('1 %d 0 -1 # ' % cnt_1 + name[1]+'\n')
+                    data_info.append((1, cnt_1))
                 elif aliases[i][1] == 1: # alias
-                    f.write('1 %d 0 -1 # ' % cnt_1 + name[1]+'\n')
+                    data_info.append((1, cnt_1))
                 else: # negated alias
-                    f.write('1 -%d 0 -1 # ' % cnt_1 + name[1] +'\n')
+                    data_info.append((1, -cnt_1))
             else:
                 if aliases[i][1] == 0: # noalias
                     cnt_2 = cnt_2 + 1   
-                    f.write('2 %d 0 -1 # ' % cnt_2 + name[1] +'\n')
+                    data_info.append((2, cnt_2))
                 elif aliases[i][1] == 1: # alias
-                    f.write('2 %d 0 -1 # ' % cnt_2 + name[1] +'\n')
+                    data_info.append((2, cnt_2))
                 else: #neg alias
-                    f.write('2 -%d 0 -1 # ' % cnt_2 + name[1] +'\n')
+                    data_info.append((2, -cnt_2))
         
         self._nvariables_without_sens = cnt_2
         
@@ -501,7 +436,7 @@ class ResultWriterDymolaSensitivity(ResultWriter):
         sens_param_res = []
         self._sens_sc = [] #Sensitivity scaling factors
         
-        #Write sensitivity variables into the table (No alias, no parameters)
+        #Sensitivity variables in the table (No alias, no parameters)
         for i,name in enumerate(sens_names):
             name_split = name.split('/')
             param = name_split[1][1:]
@@ -511,7 +446,7 @@ class ResultWriterDymolaSensitivity(ResultWriter):
             
             if int(ref_var) < n_parameters: # Put parameters in data set
                 cnt_1 = cnt_1 + 1
-                f.write('1 %d 0 -1 # ' % cnt_1 + name +'\n')
+                data_info.append((1, cnt_1))
                 
                 if ref_param == ref_var:
                     if model.is_negated_alias(var):
@@ -524,32 +459,89 @@ class ResultWriterDymolaSensitivity(ResultWriter):
                 if not md.is_alias(var):
                     cnt_2 = cnt_2+1
                     self._sens_sc += [self._sc[ref_var]/self._sc[ref_param]]
-                    f.write('2 %d 0 -1 # ' % cnt_2 + name + '\n')
+                    data_info.append((2, cnt_2))
                 elif md.is_negated_alias(var):
-                    f.write('2 -%d 0 -1 # ' % cnt_2 + name + '\n')
+                    data_info.append((2, -cnt_2))
                 else:
-                    f.write('2 %d 0 -1 # ' % cnt_2 + name + '\n')
+                    data_info.append((2, cnt_2))
 
         self._nvariables_total = cnt_2 #Store the number of variables
+        
+        # Data set 1, without time
+        if self._rescale:
+            data_1 = [z[ref]*sc[ref] for ref in range(n_parameters)]
+        else:
+            data_1 = [z[ref] for ref in range(n_parameters)]
+        data_1_sens = sens_param_res[:cnt_1-1-n_parameters]
+        
+        all_names = ['time'] + [name[1] for name in names] + sens_names
+        all_descs = ['Time in [s]'] + [desc[1] for desc in descriptions] + \
+                    sens_desc
+        
+        if self._format == 'txt':
+            self._write_header_txt(file_name, all_names, all_descs, data_info,
+                                   data_1, data_1_sens)
+        else:
+            # Scaling factors for a whole row of data set 2
+            nvars = self._nvariables_without_sens
+            if self._rescale:
+                self._row_scale = N.hstack(([1.0],
+                                            sc[n_parameters:n_parameters+nvars-1],
+                                            self._sens_sc))
+            self._write_header_mat(file_name, all_names, all_descs, data_info,
+                                   data_1 + data_1_sens)
+        
+    def _write_header_txt(self, file_name, names, descriptions, data_info,
+                          data_1, data_1_sens):
+        """
+        Opens the file and writes the header in textual format.
+        """
+        # Open file
+        f = codecs.open(file_name,'w','utf-8')
+        self._file_open = True
+
+        # Write header
+        f.write('#1\n')
+        f.write('char Aclass(3,11)\n')
+        f.write('Atrajectory\n')
+        f.write('1.1\n')
         f.write('\n')
+        
+        # Find the maximum name and description length
+        max_name_length = max([len(name) for name in names])
+        max_desc_length = max([len(desc) for desc in descriptions])
+        
+        f.write('char name(%d,%d)\n' % (len(names), max_name_length))
+        for name in names:
+            f.write(name+'\n')
 
+        f.write('\n')
+
+        # Write descriptions       
+        f.write('char description(%d,%d)\n' % (len(descriptions), max_desc_length))
+        for desc in descriptions:
+            f.write(desc+'\n')
+            
+        f.write('\n')
+
+        # Write data meta information
+        f.write('int dataInfo(%d,%d)\n' % (len(names), 4))
+        for (name, (data_set, column)) in zip(names, data_info):
+            f.write('%d %d 0 -1 # ' % (data_set, column) + name + '\n')
+        f.write('\n')
 
         # Write data
         # Write data set 1
-        f.write('float data_1(%d,%d)\n' % (2, cnt_1))
+        f.write('float data_1(%d,%d)\n' % (2, len(data_1) + len(data_1_sens) + 1))
         
         str_text = ''
-        for ref in range(n_parameters):
-            if self._rescale:
-                str_text += " %.14E" % (z[ref]*sc[ref])
-            else:
-                str_text += " %.14E" % (z[ref])
+        for value in data_1:
+            str_text += " %.14E" % value
         
         # Write sensitivity data set 1
-        for i in range(cnt_1-1-n_parameters):
-            str_text += " %.14E " % sens_param_res[i]
+        for value in data_1_sens:
+            str_text += " %.14E " % value
         
-        #f.write("%.14E" % data[0,0])
         self._point_first_t = f.tell()
         f.write("%s" % ' '*28)
         f.write(str_text)
@@ -567,6 +559,32 @@ class ResultWriterDymolaSensitivity(ResultWriter):
         
         self._file = f
         
+    def _write_header_mat(self, file_name, names, descriptions, data_info,
+                          data_1):
+        """
+        Opens the file and writes the header in binary Matlab v4 format. 
+        The matrices are stored transposed (Dymola's 'binTrans' format) so 
+        that each point of data set 2 is a contiguous block in the file.
+        """
+        f = open(file_name, 'wb')
+        self._file_open = True
+        
+        _write_mat4_meta(f, names, descriptions, data_info)
+        
+        # Data set 1, the start and final times are filled in by 
+        # write_finalize
+        _write_mat4_header(f, 'data_1', 0, len(data_1) + 1, 2)
+        column = N.hstack(([0.0], data_1)).astype('<f8').tostring()
+        self._point_first_t = f.tell()
+        f.write(column)
+        self._point_last_t = f.tell()
+        f.write(column)
+        
+        # Data set 2, the number of points is filled in by write_finalize
+        self._point_npoints = f.tell() + 8
+        _write_mat4_header(f, 'data_2', 0, self._nvariables_total, 0)
+        
+        self._file = f
         
     def write_point(self, data=None):
         """ Writes the current status of the model to file. If the header
@@ -582,13 +600,22 @@ class ResultWriterDymolaSensitivity(ResultWriter):
         """
         f = self._file
         rescale = self._rescale
-        sc = self._sc
-        sens_sc = self._sens_sc
-        n_parameters = self._n_parameters
 
         if self._npoints == 0:
             self._tstart = data[0]
         
+        if self._format == 'mat':
+            row = N.asarray(data[:self._nvariables_total], dtype=float)
+            if rescale:
+                row = row*self._row_scale
+            f.write(row.astype('<f8').tostring())
+            self._npoints += 1
+            return
+        
+        sc = self._sc
+        sens_sc = self._sens_sc
+        n_parameters = self._n_parameters
+        
         #Write the point
         str_text = (" %.14E" % data[0])
         for j in xrange(self._nvariables_without_sens-1):
@@ -614,7 +641,21 @@ class ResultWriterDymolaSensitivity(ResultWriter):
         time (in data set 1). Also closes the file.
         """
         #If open, finalize and close
-        if self._file_open:
+        if self._file_open and self._format == 'mat':
+            
+            f = self._file
+            
+            f.seek(self._point_first_t)
+            f.write(struct.pack('<d', self._tstart))
+            f.seek(self._point_last_t)
+            f.write(struct.pack('<d', self.model.t))
+            f.seek(self._point_npoints)
+            f.write(struct.pack('<i', self._npoints))
+            
+            f.close()
+            self._file_open = False
+            
+        elif self._file_open:
             
             f = self._file
             
@@ -634,3 +675,167 @@ class ResultWriterDymolaSensitivity(ResultWriter):
             f.write('\n')
             f.close()
             self._file_open = False
+
+class ResultDymolaMemory(object):
+    """
+    A result in Dymola's result format which is kept in memory instead of 
+    being written to file. The variable trajectories are accessed in the 
+    same way as for ResultDymolaTextual and ResultDymolaBinary.
+    """
+    def __init__(self, names, descriptions, data_info, data_1, data_2):
+        """
+        Create the result. The arguments are the same as for 
+        write_result_dymola_binary.
+        """
+        self.name = list(names)
+        self.description = list(descriptions)
+        self.dataInfo = N.zeros((len(data_info), 4), dtype=int)
+        self.dataInfo[:,:2] = data_info
+        self.dataInfo[:,3] = -1
+        self.data = [N.asarray(data_1, dtype=float),
+                     N.asarray(data_2, dtype=float)]
+        self._index = dict([(name, i) for (i, name) in enumerate(self.name)])
+
+    def get_variable_index(self, name):
+        """
+        Get the index of a variable in the list of names.
+        """
+        name = name.replace(" ", "")
+        if name == 'Time':
+            name = 'time'
+        try:
+            return self._index[name]
+        except KeyError:
+            raise VariableNotFoundError("Cannot find variable " + name +
+                                        " in data file.")
+
+    def get_variable_data(self, name):
+        """
+        Retrieve the data sequence for a variable with a given name.
+
+        Parameters::
+
+            name --
+                The name of the variable.
+
+        Returns::
+
+            A Trajectory object containing the time vector and the data 
+            vector of the variable.
+        """
+        ind = self.get_variable_index(name)
+        (data_set, column) = self.dataInfo[ind,:2]
+        factor = -1 if column < 0 else 1
+        data = self.data[0] if data_set == 1 else self.data[1]
+        return Trajectory(data[:,0], factor*data[:,abs(column)-1])
+
+    def is_variable(self, name):
+        """
+        Returns True if the given name corresponds to a time-varying 
+        variable.
+        """
+        return self.dataInfo[self.get_variable_index(name),0] != 1
+
+    def is_negated(self, name):
+        """
+        Returns True if the given name corresponds to a negated alias.
+        """
+        return self.dataInfo[self.get_variable_index(name),1] < 0
+
+    def get_column(self, name):
+        """
+        Returns the column number in the data matrix where the values of 
+        the time-varying variable are stored.
+        """
+        if not self.is_variable(name):
+            raise VariableNotTimeVarying("Variable " + name +
+                                         " is not time-varying.")
+        return abs(self.dataInfo[self.get_variable_index(name),1]) - 1
+
+    def get_data_matrix(self):
+        """
+        Returns the data matrix of the time-varying variables.
+        """
+        return self.data[1]
+
+def write_result_dymola_binary(file_name, names, descriptions, data_info,
+                               data_1, data_2):
+    """
+    Write a result to file in Dymola's binary result file format (Matlab 
+    v4, with transposed matrices).
+
+    Parameters::
+
+        file_name --
+            The name of the result file.
+
+        names --
+            A list of the variable names, starting with 'time'.
+
+        descriptions --
+            A list of the variable descriptions, in the same order as names.
+
+        data_info --
+            A list with one (data set, column) pair for each variable, in 
+            the same order as names. The column is negative for negated 
+            aliases.
+
+        data_1 --
+            A two dimensional array with the start and final time in the 
+            first column and the parameter values in the following columns.
+
+        data_2 --
+            A two dimensional array with the time points in the first column 
+            and the trajectories of the time-varying variables in the 
+            following columns.
+    """
+    f = open(file_name, 'wb')
+    try:
+        _write_mat4_meta(f, names, descriptions, data_info)
+        for (name, data) in [('data_1', data_1), ('data_2', data_2)]:
+            data = N.asarray(data, dtype='<f8')
+            _write_mat4_header(f, name, 0, data.shape[1], data.shape[0])
+            f.write(data.tostring())
+    finally:
+        f.close()
+
+def _write_mat4_meta(f, names, descriptions, data_info):
+    """
+    Write the Aclass, name, description and dataInfo matrices of a binary 
+    Dymola result file.
+    """
+    _write_mat4_char(f, 'Aclass', ['Atrajectory', '1.1', '', 'binTrans'],
+                     transpose=False)
+    _write_mat4_char(f, 'name', names)
+    _write_mat4_char(f, 'description', descriptions)
+    info = N.zeros((len(data_info), 4), dtype='<i4')
+    info[:,:2] = data_info
+    info[:,3] = -1
+    _write_mat4_header(f, 'dataInfo', 20, 4, len(data_info))
+    f.write(info.tostring())
+
+def _write_mat4_header(f, name, type, mrows, ncols):
+    """
+    Write the header of a Matlab v4 matrix. type is the MOPT code of the 
+    matrix, e.g. 0 for float64, 20 for int32 and 51 for text, all little 
+    endian.
+    """
+    f.write(struct.pack('<5i', type, mrows, ncols, 0, len(name) + 1))
+    f.write(name + '\0')
+
+def _write_mat4_char(f, name, strings, transpose=True):
+    """
+    Write a list of strings as a Matlab v4 text matrix, padded with blanks. 
+    If transpose is True, each string is stored as a column.
+    """
+    strings = [s.encode('utf-8') if isinstance(s, unicode) else s
+               for s in strings]
+    length = max([len(s) for s in strings])
+    chars = N.array([list(s.ljust(length)) for s in strings], dtype='S1')
+    if length == 0:
+        chars = chars.reshape((len(strings), 0))
+    if transpose:
+        chars = chars.T
+    _write_mat4_header(f, name, 51, chars.shape[0], chars.shape[1])
+    # Matlab matrices are stored column-wise
+    f.write(chars.T.tostring())
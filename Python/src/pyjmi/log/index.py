@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2014 Modelon AB
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Persisted index for querying large JModelica FMU logs
+"""
+
+import os
+from collections import deque
+from xml import sax
+import numpy as np
+from tree import *
+from parser import ContentHandler, create_parser, take_completed_nodes
+from parser import jmi_log_contents, jmi_log_header, jmi_log_footer
+
+index_version = 1
+
+class IndexContentHandler(ContentHandler):
+    """
+    ContentHandler that records where in the log file each top level node
+    starts.
+
+    Attributes:
+    line_offsets -- (line number, byte offset) of the most recently fed lines
+    starts       -- (byte offset, column) of each started top level node
+    """
+    def __init__(self):
+        ContentHandler.__init__(self)
+        self.line_offsets = deque(maxlen=64)
+        self.starts = []
+
+    def startElement(self, type, attrs):
+        if len(self.nodes) == 2 and type not in ('value', 'vector', 'matrix'):
+            line = self._locator.getLineNumber()
+            for (line_number, offset) in self.line_offsets:
+                if line_number == line:
+                    self.starts.append((offset, self._locator.getColumnNumber()))
+                    break
+            else:
+                raise sax.SAXException('Lost track of the position in the JMI log.')
+        ContentHandler.startElement(self, type, attrs)
+
+def node_types(node, types=None):
+    """Return the set of types of node and all nodes in it."""
+    if types is None:
+        types = set()
+    if isinstance(node, Node):
+        types.add(node.type)
+        for child in node.nodes:
+            node_types(child, types)
+    return types
+
+def find_in_node(node, types):
+    """Like Node.find, but also return node itself if it has one of the types."""
+    if node.type in types:
+        return [node]
+    return node.find(types)
+
+class JMILogIndex(object):
+    """
+    Index of the top level nodes in a JMI log, which is used to parse only
+    the parts of the log that a query needs.
+
+    The index holds, for each top level node, the byte offset of the node in
+    the log file, its type, its time (the value t, or nan if the node has
+    none) and the types of all nodes in it. It is created in a single
+    streaming pass over the log and is stored in index_file, from which it
+    is loaded as long as the log file is unchanged.
+
+    Attributes:
+    filename -- the log file name
+    types    -- an array with the type of each top level node
+    times    -- an array with the time of each top level node
+    """
+    def __init__(self, filename, modulename = 'Model', index_file = None,
+                 rebuild = False):
+        """
+        Load the index of the JMI log filename, or create it.
+
+        modulename selects the module as recorded in the beginning of each
+        line by FMI Library. index_file defaults to filename + '.index'. If
+        rebuild is True, the index is created even if index_file is valid.
+        """
+        self.filename = filename
+        self.modulename = modulename
+        if index_file is None:
+            index_file = filename + '.index'
+        self.index_file = index_file
+        if rebuild or not self._load():
+            self._build()
+            self._save()
+
+    def _log_stamp(self):
+        stat = os.stat(self.filename)
+        return np.array([stat.st_size, stat.st_mtime])
+
+    def _load(self):
+        if not os.path.isfile(self.index_file):
+            return False
+        try:
+            with open(self.index_file, 'rb') as f:
+                data = np.load(f)
+                if (int(data['version']) != index_version or
+                    str(data['modulename']) != self.modulename or
+                    not np.array_equal(data['log_stamp'], self._log_stamp())):
+                    return False
+                self._type_names = list(data['type_names'])
+                self._offsets = data['offsets']
+                self._columns = data['columns']
+                self._type_inds = data['type_inds']
+                self.times = data['times']
+                self._contained_ptr = data['contained_ptr']
+                self._contained = data['contained']
+        except (IOError, ValueError, KeyError):
+            return False
+        self.types = np.array(self._type_names)[self._type_inds]
+        return True
+
+    def _save(self):
+        try:
+            with open(self.index_file, 'wb') as f:
+                np.savez(f, version=index_version, modulename=self.modulename,
+                         log_stamp=self._log_stamp(),
+                         type_names=np.array(self._type_names),
+                         offsets=self._offsets, columns=self._columns,
+                         type_inds=self._type_inds, times=self.times,
+                         contained_ptr=self._contained_ptr,
+                         contained=self._contained)
+        except IOError as e:
+            print 'Warning: Failed to save JMI log index:\n', e
+
+    def _build(self):
+        type_names = {}
+        type_inds = []
+        times = []
+        contained_ptr = [0]
+        contained = []
+
+        def add(node):
+            if not isinstance(node, Node):
+                return
+            for type in node_types(node):
+                contained.append(type_names.setdefault(type, len(type_names)))
+            contained_ptr.append(len(contained))
+            type_inds.append(type_names[node.type])
+            t = node.dict.get('t')
+            times.append(t if isinstance(t, (int, float)) else np.nan)
+
+        parser = sax.make_parser()
+        handler = IndexContentHandler()
+        parser.setContentHandler(handler)
+        # The parser is only fed, so it does not set the locator itself
+        handler.setDocumentLocator(parser)
+        line_number = jmi_log_header.count('\n')
+        with open(self.filename, 'rb') as f:
+            parser.feed(jmi_log_header)
+            for (offset, text) in jmi_log_contents(f, self.modulename):
+                line_number += 1
+                handler.line_offsets.append((line_number, offset))
+                parser.feed(text)
+                for node in take_completed_nodes(handler):
+                    add(node)
+            parser.feed(jmi_log_footer)
+        parser.close()
+        for node in take_completed_nodes(handler):
+            add(node)
+
+        self._type_names = [None] * len(type_names)
+        for (type, i) in type_names.iteritems():
+            self._type_names[i] = type
+        starts = np.array(handler.starts, dtype=np.int64).reshape(-1, 2)
+        self._offsets = starts[:, 0]
+        self._columns = starts[:, 1]
+        self._type_inds = np.array(type_inds, dtype=np.int32)
+        self.times = np.array(times, dtype=float)
+        self._contained_ptr = np.array(contained_ptr, dtype=np.int64)
+        self._contained = np.array(contained, dtype=np.int32)
+        self.types = np.array(self._type_names)[self._type_inds]
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def select(self, types = None, t_start = None, t_end = None):
+        """
+        Return the indices of the top level nodes that contain nodes with
+        the given type(s) and whose time is in [t_start, t_end].
+
+        types may be a string, list of strings or None (all types). Nodes
+        without time are only selected if neither t_start nor t_end is given.
+        """
+        selected = np.ones(len(self), dtype=bool)
+        if types is not None:
+            if isinstance(types, basestring):
+                types = [types]
+            type_inds = [i for (i, type) in enumerate(self._type_names) if type in types]
+            owners = np.repeat(np.arange(len(self)), np.diff(self._contained_ptr))
+            has_type = np.zeros(len(self), dtype=bool)
+            has_type[owners[np.in1d(self._contained, type_inds)]] = True
+            selected &= has_type
+        with np.errstate(invalid='ignore'): # nan compares as False
+            if t_start is not None:
+                selected &= self.times >= t_start
+            if t_end is not None:
+                selected &= self.times <= t_end
+        return np.flatnonzero(selected)
+
+    def get_node(self, i, f = None):
+        """Parse and return top level node number i."""
+        if f is None:
+            with open(self.filename, 'rb') as f:
+                return self.get_node(i, f)
+        f.seek(self._offsets[i])
+        text = f.readline().decode('utf-8')[self._columns[i]:].encode('utf-8')
+        parser, handler = create_parser()
+        parser.feed(jmi_log_header)
+        contents = jmi_log_contents(f, self.modulename)
+        while True:
+            parser.feed(text)
+            for node in take_completed_nodes(handler):
+                if isinstance(node, Node):
+                    return node
+            try:
+                (offset, text) = contents.next()
+            except StopIteration:
+                raise Exception('Failed to parse node %d of JMI log %s' % (i, self.filename))
+
+    def iter_nodes(self, types = None, t_start = None, t_end = None):
+        """
+        Yield the top level nodes selected as for select, parsing only
+        those nodes.
+        """
+        with open(self.filename, 'rb') as f:
+            for i in self.select(types, t_start, t_end):
+                yield self.get_node(i, f)
+
+    def find(self, types, t_start = None, t_end = None):
+        """
+        Return a list of nodes with the given type(s), in order, like
+        Node.find on the root node of the log. Only the top level nodes whose
+        time is in [t_start, t_end] are searched, see select.
+        """
+        if isinstance(types, basestring):
+            types = [types]
+        nodes = []
+        for node in self.iter_nodes(types, t_start, t_end):
+            nodes.extend(find_in_node(node, types))
+        return nodes
@@ -163,6 +163,56 @@ def parse_xml_log(filename, accept_errors=False):
 
 # Support routines to parse JMI logs
 
+def iterparse_jmi_log(filename, modulename = 'Model', accept_errors=False):
+    """
+    Parse the XML contents of a JMI log and yield its top level nodes, in
+    order, as soon as each of them has been parsed.
+
+    Only the node that is currently being parsed is kept in memory, so this
+    can be used for logs that are too large for parse_jmi_log.
+    modulename and accept_errors are as for parse_jmi_log.
+    """
+    parser, handler = create_parser()
+    try:
+        with open(filename, 'r') as f:
+            parser.feed(jmi_log_header)
+            for (offset, text) in jmi_log_contents(f, modulename):
+                parser.feed(text)
+                for node in take_completed_nodes(handler):
+                    yield node
+            parser.feed(jmi_log_footer)
+
+        parser.close()
+    except sax.SAXException as e:
+        if accept_errors:
+            print 'Warning: Failure during parsing of XML JMI log:\n', e
+            print 'Parsed log will be incomplete'
+        else:
+            raise Exception('Failed to parse XML JMI log:\n' + repr(e))
+
+    for node in take_completed_nodes(handler):
+        yield node
+
+def take_completed_nodes(handler):
+    """
+    Remove the top level nodes that have been completely parsed from the
+    log being parsed by handler, and return them as a list.
+    """
+    root = handler.nodes[0]
+    if len(root.nodes) == 0:
+        return []
+    log = root.nodes[0]
+    n = len(log.nodes)
+    if len(handler.nodes) > 2:
+        n -= 1 # The last node is still being parsed
+    nodes = log.nodes[:n]
+    for key in log.keys[:n]:
+        if key is not None:
+            log.dict.pop(key, None)
+    del log.nodes[:n]
+    del log.keys[:n]
+    return nodes
+
 def parse_jmi_log(filename, modulename = 'Model', accept_errors=False):
     """
     Parse the XML contents of a JMI log and return the root node.
@@ -197,16 +247,31 @@ def extract_jmi_log(destfilename, filename, modulename = 'Model'):
         with open(destfilename, 'w') as destfile:
             filter_jmi_log(destfile.write, sourcefile, modulename)
 
+jmi_log_header = '<?xml version="1.0" encoding="UTF-8"?>\n<JMILog category="info">\n'
+jmi_log_footer = '</JMILog>\n'
+
 def filter_jmi_log(write, sourcefile, modulename = 'Model'):
-    write('<?xml version="1.0" encoding="UTF-8"?>\n<JMILog category="info">\n')
+    write(jmi_log_header)
+    for (offset, text) in jmi_log_contents(sourcefile, modulename):
+        write(text)
+    write(jmi_log_footer)
 
+def jmi_log_contents(sourcefile, modulename = 'Model'):
+    """
+    Yield the XML contents of each line of a JMI log that belongs to the
+    module modulename, together with the byte offset of the contents in
+    sourcefile, counted from the current position.
+    """
+    prefix = 'FMIL: module = ' + modulename + ', log level = '
     pre_re = r'FMIL: module = ' + modulename + r', log level = ([0-9]+): \[([^]]+)\]\[FMU status:([^]]+)\] '
     pre_pattern = re.compile(pre_re)
 
+    offset = 0
     for line in sourcefile:
-        m = pre_pattern.match(line)
-        if m is not None:
-            # log_level, category, fmu_status = m.groups()
-            write(line[m.end():])
-
-    write('</JMILog>\n')
+        # Only lines from the module need to be matched
+        if line.startswith(prefix):
+            m = pre_pattern.match(line)
+            if m is not None:
+                # log_level, category, fmu_status = m.groups()
+                yield (offset + m.end(), line[m.end():])
+        offset += len(line)
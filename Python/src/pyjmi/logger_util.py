@@ -18,136 +18,431 @@
 Utility functions for extracting and filtering FMU logs
 """
 
-def get_structured_fmu_log(log_file):
-    
-    f = open(log_file)
+import re
+import array
+import numpy as N
 
-    l = f.readline()
+# Messages of [NLE_ITERS] lines, in the order in which they are handled
+_ITERS_MESSAGES = ('Model equations evaluation invoked at time:', 'Newton solver invoked',
+                   'Iteration', 'Residuals', 'Limitation', 'Max', 'Initial guess',
+                   'Variable nominal', 'Min', 'Newton solver finished with exit flag',
+                   'Newton solver finished', 'Model equations evaluation finished')
+# The longer message must come first, since the matches can't overlap
+_ITERS_PATTERN = re.compile('|'.join(re.escape(m) for m in sorted(_ITERS_MESSAGES, key=len,
+                                                                      reverse=True)))
+_ITERS_ORDER = dict((m, i) for (i, m) in enumerate(_ITERS_MESSAGES))
 
-    d = []
+# Per block solve vectors, see NonlinearSolverLog
+_BLOCK_VECTORS = {'Max': 'max', 'Min': 'min', 'Initial guess': 'initial_guess',
+                  'Variable nominal': 'variable_nominal'}
 
-    jacs = {}
-    jacs_updated = {}
-    jac_parsing_in_progress = False
+class _Column(object):
+    """
+    A column of values that is read from a log. Numbers are stored compactly
+    in an array.array, strings in a list, until the column is converted to
+    a NumPy array.
+    """
+    _typecodes = {float: 'd', int: 'l', bool: 'b'}
 
-    scalings = {}
-    scalings_updated = {}
+    def __init__(self, dtype):
+        self.dtype = dtype
+        if dtype in self._typecodes:
+            self._data = array.array(self._typecodes[dtype])
+        else:
+            self._data = []
+        self.append = self._data.append
+        self.extend = self._data.extend
 
-    while l != '':
-        #print l
+    def __len__(self):
+        return len(self._data)
 
-        if l.find('[NLE_JAC]')>=0:
-            ll = l.split(';')
-            if not jac_parsing_in_progress:
-                jacs[int(ll[1])] = []
-                jacs_updated[int(ll[1])] = True
-                jac_parsing_in_progress = True
-            jacs[int(ll[1])].append([])
-            for v in ll[5:-1]:
-                jacs[int(ll[1])][-1].append(float(v))
-
-        if l.find('[NLE_JAC]')==-1:
-            jac_parsing_in_progress = False
-
-        if l.find('[NLE_SCALING]')>=0 and l.find('Updating')>=0:
-            ll = l.split(';')
-            scalings[int(ll[1])] = []
-            scalings_updated[int(ll[1])] = True
-            for v in ll[5:-1]:
-                scalings[int(ll[1])].append(float(v))
-
-        if l.find('[NLE_ITERS]')>=0:
-            # Detect a solve has started
-            if l.find('Model equations evaluation invoked at time:')>=0:
-                s = {}
-                ll = l.split(';')
-                s['time'] = float(ll[-1])
-                s['block_solves'] = [] 
+    def array(self):
+        if self.dtype in self._typecodes:
+            return N.frombuffer(self._data, dtype=self._data.typecode).astype(self.dtype)
+        return N.array(self._data, dtype=str)
 
-            if l.find('Newton solver invoked')>=0:
-                bl = {}
-                bl['names'] = []
-                bl['iterations'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['names'].append(ll[i])
-                bl['block_index'] = int(ll[1])
-                bl['initial_residual_scaling'] = scalings[int(ll[1])]
-                bl['initial_residual_scaling_updated'] = scalings_updated[int(ll[1])]
-                if scalings_updated[int(ll[1])]:
-                    scalings_updated[int(ll[1])] = False
-				
-            if l.find('Iteration')>=0:
-                iteration = {}
-                bl['iterations'].append(iteration)
-                iteration['iteration_variables'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    iteration['iteration_variables'].append(float(ll[i]))
-
-                if len(jacs)>0:
-                    iteration['jacobian'] = jacs[int(ll[1])]
-                    iteration['jacobian_updated'] = jacs_updated[int(ll[1])]
-                    if jacs_updated[int(ll[1])]:
-                        jacs_updated[int(ll[1])] = False
-
-                iteration['residual_scaling'] = scalings[int(ll[1])]
-                iteration['residual_scaling_updated'] = scalings_updated[int(ll[1])]
-                if scalings_updated[int(ll[1])]:
-                    scalings_updated[int(ll[1])] = False
-                    
-            if l.find('Residuals')>=0:
-                iteration['residuals'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    iteration['residuals'].append(float(ll[i]))
-                iteration['scaled_residual_norm'] = float(ll[3])
-                
-            if l.find('Limitation')>=0:
-                iteration['at_bound'] = []
-                l2 = l.split(';')
-                for i in range(5,len(l2)-1):
-                    iteration['at_bound'].append(tuple(l2[i].split()))
-                
-            if l.find('Max')>=0:
-                bl['max'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['max'].append(float(ll[i]))
+class _RaggedColumn(object):
+    """
+    A sequence of vectors of different lengths, stored as one data column and
+    one column with the start index of each vector.
+    """
+    def __init__(self, dtype):
+        self.data = _Column(dtype)
+        self.ptr = _Column(int)
+        self.ptr.append(0)
 
-            if l.find('Initial guess')>=0:
-                bl['initial_guess'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['initial_guess'].append(float(ll[i]))
+    def append(self, values):
+        self.data.extend(values)
+        self.ptr.append(len(self.data))
 
-            if l.find('Variable nominal')>=0:
-                bl['variable_nominal'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['variable_nominal'].append(float(ll[i]))
+    def __len__(self):
+        return len(self.ptr) - 1
 
-            if l.find('Min')>=0:
-                bl['min'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['min'].append(float(ll[i]))
+    def arrays(self):
+        return (self.data.array(), self.ptr.array())
 
-            if l.find('Newton solver finished with exit flag')>=0:
-                ll = l.split(';')
-                bl['kinsol_exit_flag'] = ll[3]
+def _values(fields):
+    """The values of a split log line."""
+    return map(float, fields[5:-1])
+
+class NonlinearSolverLog(object):
+    """
+    Nonlinear solver information from an FMU log, stored in columns.
+
+    The log consists of solves (model equations evaluations), block solves
+    (Newton solver invocations) and iterations. Solve i contains the block
+    solves solve_block_ptr[i]:solve_block_ptr[i+1] and block solve j
+    contains the iterations block_iteration_ptr[j]:block_iteration_ptr[j+1].
+    The vectors of varying length, such as residuals, are stored as a data
+    array and a ptr array with the start index of each vector in the data,
+    and are retrieved with get_vector.
+
+    Columns::
+
+        solve_time --
+            The time of each solve.
+
+        block_index, block_exit_flag, block_initial_scaling,
+        block_initial_scaling_updated --
+            The block, the exit flag of the Newton solver, the index of the
+            initial residual scaling (-1 if none) and whether the scaling
+            was updated, of each block solve.
+
+        iteration_jacobian, iteration_jacobian_updated,
+        iteration_scaling, iteration_scaling_updated,
+        iteration_scaled_residual_norm --
+            The index of the Jacobian (-1 if none) and whether it was
+            updated, the index of the residual scaling (-1 if none) and
+            whether it was updated, and the scaled residual norm (nan if
+            none), of each iteration.
+
+        jacobian_rows --
+            The number of rows of each Jacobian.
+
+    Vectors::
+
+        names, max, min, initial_guess, variable_nominal --
+            Per block solve.
+
+        iteration_variables, residuals, at_bound --
+            Per iteration.
+
+    The optional vectors max, min, initial_guess, variable_nominal and
+    at_bound also have a column name + '_present' that tells whether the
+    vector was given in the log.
 
+        jacobians, scalings --
+            The Jacobians, row by row, and the residual scalings.
+    """
 
-            if l.find('Newton solver finished')>=0:
+    _vectors = ('names', 'max', 'min', 'initial_guess', 'variable_nominal',
+                'iteration_variables', 'residuals', 'at_bound', 'jacobians', 'scalings')
+    _optional_vectors = ('max', 'min', 'initial_guess', 'variable_nominal', 'at_bound')
+
+    def __init__(self, columns):
+        """
+        Create the log from a dict of columns, see parse_fmu_log and
+        load_fmu_log.
+        """
+        for (name, value) in columns.iteritems():
+            setattr(self, name, value)
+
+    def get_vector(self, name, i):
+        """
+        Return vector name of block solve, iteration, Jacobian or scaling i.
+        """
+        data = getattr(self, name)
+        ptr = getattr(self, name + '_ptr')
+        return data[ptr[i]:ptr[i+1]]
+
+    def get_jacobian(self, i):
+        """Return Jacobian i as a 2-D array."""
+        return self.get_vector('jacobians', i).reshape(self.jacobian_rows[i], -1)
+
+    def save(self, file_name):
+        """
+        Save the log in a compact columnar file, which is read by
+        load_fmu_log.
+        """
+        with open(file_name, 'wb') as f:
+            N.savez(f, **self._columns())
+
+    def _columns(self):
+        columns = {}
+        for name in ('solve_time', 'solve_block_ptr', 'block_index', 'block_exit_flag',
+                     'block_initial_scaling', 'block_initial_scaling_updated',
+                     'block_iteration_ptr', 'iteration_jacobian',
+                     'iteration_jacobian_updated', 'iteration_scaling',
+                     'iteration_scaling_updated', 'iteration_scaled_residual_norm',
+                     'jacobian_rows'):
+            columns[name] = getattr(self, name)
+        for name in self._vectors:
+            columns[name] = getattr(self, name)
+            columns[name + '_ptr'] = getattr(self, name + '_ptr')
+        for name in self._optional_vectors:
+            columns[name + '_present'] = getattr(self, name + '_present')
+        return columns
+
+    def select_block_solves(self, blocks=None, t_start=None, t_end=None):
+        """
+        Return the indices of the block solves of the given block(s) in the
+        solves with time in [t_start, t_end].
+        """
+        solve_of_block = N.repeat(N.arange(len(self.solve_time)), N.diff(self.solve_block_ptr))
+        selected = N.ones(len(self.block_index), dtype=bool)
+        if blocks is not None:
+            selected &= N.in1d(self.block_index, N.atleast_1d(blocks))
+        if t_start is not None:
+            selected &= self.solve_time[solve_of_block] >= t_start
+        if t_end is not None:
+            selected &= self.solve_time[solve_of_block] <= t_end
+        return N.flatnonzero(selected)
+
+    def to_structured(self, blocks=None, t_start=None, t_end=None):
+        """
+        Return the log in the format of get_structured_fmu_log, for the
+        block solves selected as for select_block_solves. Solves without
+        selected block solves are left out if blocks is given.
+        """
+        selected = N.zeros(len(self.block_index), dtype=bool)
+        selected[self.select_block_solves(blocks, t_start, t_end)] = True
+        # Slicing Python lists is much faster than creating lists from
+        # slices of arrays, so all columns are converted at once
+        columns = {}
+        def column(name):
+            if name not in columns:
+                columns[name] = getattr(self, name).tolist()
+            return columns[name]
+        def vector(name, i):
+            ptr = column(name + '_ptr')
+            return column(name)[ptr[i]:ptr[i+1]]
+        jacobians = {}
+        def jacobian(k):
+            if k not in jacobians:
+                jacobians[k] = self.get_jacobian(k).tolist()
+            return jacobians[k]
+        scalings = {}
+        def scaling(k):
+            if k not in scalings:
+                scalings[k] = vector('scalings', k)
+            return scalings[k]
+
+        solve_time = column('solve_time')
+        solve_block_ptr = column('solve_block_ptr')
+        block_index = column('block_index')
+        block_exit_flag = column('block_exit_flag')
+        block_initial_scaling = column('block_initial_scaling')
+        block_initial_scaling_updated = column('block_initial_scaling_updated')
+        block_iteration_ptr = column('block_iteration_ptr')
+        iteration_jacobian = column('iteration_jacobian')
+        iteration_jacobian_updated = column('iteration_jacobian_updated')
+        iteration_scaling = column('iteration_scaling')
+        iteration_scaling_updated = column('iteration_scaling_updated')
+        iteration_scaled_residual_norm = column('iteration_scaled_residual_norm')
+        at_bound_present = column('at_bound_present')
+
+        d = []
+        for i in xrange(len(solve_time)):
+            block_range = range(solve_block_ptr[i], solve_block_ptr[i+1])
+            if blocks is not None and not selected[block_range].any():
+                continue
+            if (t_start is not None and solve_time[i] < t_start or
+                t_end is not None and solve_time[i] > t_end):
+                continue
+            s = {'time': solve_time[i], 'block_solves': []}
+            for j in block_range:
+                if not selected[j]:
+                    continue
+                bl = {'names': vector('names', j), 'iterations': [],
+                      'block_index': block_index[j]}
+                if block_initial_scaling[j] >= 0:
+                    bl['initial_residual_scaling'] = scaling(block_initial_scaling[j])
+                    bl['initial_residual_scaling_updated'] = block_initial_scaling_updated[j]
+                for name in _BLOCK_VECTORS.itervalues():
+                    if column(name + '_present')[j]:
+                        bl[name] = vector(name, j)
+                if block_exit_flag[j] != '':
+                    bl['kinsol_exit_flag'] = block_exit_flag[j]
+                for k in xrange(block_iteration_ptr[j], block_iteration_ptr[j+1]):
+                    iteration = {'iteration_variables': vector('iteration_variables', k)}
+                    if iteration_jacobian[k] >= 0:
+                        iteration['jacobian'] = jacobian(iteration_jacobian[k])
+                        iteration['jacobian_updated'] = iteration_jacobian_updated[k]
+                    if iteration_scaling[k] >= 0:
+                        iteration['residual_scaling'] = scaling(iteration_scaling[k])
+                        iteration['residual_scaling_updated'] = iteration_scaling_updated[k]
+                    if iteration_scaled_residual_norm[k] == iteration_scaled_residual_norm[k]:
+                        # Not nan
+                        iteration['residuals'] = vector('residuals', k)
+                        iteration['scaled_residual_norm'] = iteration_scaled_residual_norm[k]
+                    if at_bound_present[k]:
+                        iteration['at_bound'] = [tuple(v.split()) for v in vector('at_bound', k)]
+                    bl['iterations'].append(iteration)
                 s['block_solves'].append(bl)
+            d.append(s)
+        return d
+
+def parse_fmu_log(log_file):
+    """
+    Parse the nonlinear solver information in an FMU log and return it as
+    a NonlinearSolverLog.
+
+    The log is read once, line by line, and each line is classified once.
+    Only the solve that is being read is kept in Python objects, all other
+    data is stored in compact arrays, which are converted to NumPy arrays
+    when the log has been read.
+    """
+    columns = dict((name, _Column(dtype)) for (name, dtype) in [
+        ('solve_time', float), ('solve_block_ptr', int), ('block_index', int),
+        ('block_exit_flag', str), ('block_initial_scaling', int),
+        ('block_initial_scaling_updated', bool), ('block_iteration_ptr', int),
+        ('iteration_jacobian', int), ('iteration_jacobian_updated', bool),
+        ('iteration_scaling', int), ('iteration_scaling_updated', bool),
+        ('iteration_scaled_residual_norm', float), ('jacobian_rows', int)])
+    for name in ('max', 'min', 'initial_guess', 'variable_nominal', 'at_bound'):
+        columns[name + '_present'] = _Column(bool)
+    vectors = dict((name, _RaggedColumn(str if name in ('names', 'at_bound') else float))
+                   for name in NonlinearSolverLog._vectors)
+    columns['solve_block_ptr'].append(0)
+    columns['block_iteration_ptr'].append(0)
 
-            # Detect a solve has ended
-            if l.find('Model equations evaluation finished')>=0:
-                d.append(s)
+    jacobian = {} # Block -> (Jacobian index, updated)
+    jacobian_rows = None # Rows of the Jacobian being read
+    scaling = {} # Block -> (scaling index, updated)
+    s = None
+    bl = None
+    iteration = None
 
-        l = f.readline()
+    def add_solve(s):
+        columns['solve_time'].append(s['time'])
+        for bl in s['block_solves']:
+            columns['block_index'].append(bl['block_index'])
+            columns['block_exit_flag'].append(bl.get('kinsol_exit_flag', ''))
+            (k, updated) = bl.get('initial_residual_scaling', (-1, False))
+            columns['block_initial_scaling'].append(k)
+            columns['block_initial_scaling_updated'].append(updated)
+            vectors['names'].append(bl['names'])
+            for name in _BLOCK_VECTORS.itervalues():
+                columns[name + '_present'].append(name in bl)
+                vectors[name].append(bl.get(name, []))
+            for iteration in bl['iterations']:
+                (k, updated) = iteration.get('jacobian', (-1, False))
+                columns['iteration_jacobian'].append(k)
+                columns['iteration_jacobian_updated'].append(updated)
+                (k, updated) = iteration.get('residual_scaling', (-1, False))
+                columns['iteration_scaling'].append(k)
+                columns['iteration_scaling_updated'].append(updated)
+                columns['iteration_scaled_residual_norm'].append(
+                    iteration.get('scaled_residual_norm', N.nan))
+                vectors['iteration_variables'].append(iteration['iteration_variables'])
+                vectors['residuals'].append(iteration.get('residuals', []))
+                columns['at_bound_present'].append('at_bound' in iteration)
+                vectors['at_bound'].append(iteration.get('at_bound', []))
+            columns['block_iteration_ptr'].append(len(vectors['iteration_variables']))
+        columns['solve_block_ptr'].append(len(columns['block_index']))
 
-    return d
+    def take(state, block):
+        # Return the index of the Jacobian or scaling of block and whether it
+        # has been updated since it was last taken
+        (k, updated) = state[block]
+        state[block] = (k, False)
+        return (k, updated)
+
+    with open(log_file) as f:
+        for l in f:
+            i = l.find('[NLE_')
+            tag = l[i:l.find(']', i) + 1] if i >= 0 else None
+
+            if tag == '[NLE_JAC]':
+                ll = l.split(';')
+                if jacobian_rows is None:
+                    jacobian_block = int(ll[1])
+                    jacobian_rows = []
+                jacobian_rows.append(_values(ll))
+                continue
+            if jacobian_rows is not None:
+                jacobian[jacobian_block] = (len(vectors['jacobians']), True)
+                vectors['jacobians'].append([v for row in jacobian_rows for v in row])
+                columns['jacobian_rows'].append(len(jacobian_rows))
+                jacobian_rows = None
+
+            if tag == '[NLE_SCALING]':
+                if 'Updating' in l:
+                    ll = l.split(';')
+                    scaling[int(ll[1])] = (len(vectors['scalings']), True)
+                    vectors['scalings'].append(_values(ll))
+                continue
+            if tag != '[NLE_ITERS]':
+                continue
+
+            found = _ITERS_PATTERN.findall(l)
+            if 'Newton solver finished with exit flag' in found:
+                found.append('Newton solver finished')
+            if len(found) > 1:
+                found = sorted(set(found), key=_ITERS_ORDER.get)
+            ll = l.split(';')
+            for message in found:
+                if message == 'Model equations evaluation invoked at time:':
+                    s = {'time': float(ll[-1]), 'block_solves': []}
+                elif message == 'Newton solver invoked':
+                    block = int(ll[1])
+                    bl = {'names': ll[5:-1], 'iterations': [], 'block_index': block}
+                    if block in scaling:
+                        bl['initial_residual_scaling'] = take(scaling, block)
+                elif message == 'Iteration':
+                    block = int(ll[1])
+                    iteration = {'iteration_variables': _values(ll)}
+                    bl['iterations'].append(iteration)
+                    if block in jacobian:
+                        iteration['jacobian'] = take(jacobian, block)
+                    if block in scaling:
+                        iteration['residual_scaling'] = take(scaling, block)
+                elif message == 'Residuals':
+                    iteration['residuals'] = _values(ll)
+                    iteration['scaled_residual_norm'] = float(ll[3])
+                elif message == 'Limitation':
+                    iteration['at_bound'] = ll[5:-1]
+                elif message in _BLOCK_VECTORS:
+                    bl[_BLOCK_VECTORS[message]] = _values(ll)
+                elif message == 'Newton solver finished with exit flag':
+                    bl['kinsol_exit_flag'] = ll[3]
+                elif message == 'Newton solver finished':
+                    s['block_solves'].append(bl)
+                elif message == 'Model equations evaluation finished':
+                    add_solve(s)
+
+    log_columns = dict((name, column.array()) for (name, column) in columns.iteritems())
+    for (name, vector) in vectors.iteritems():
+        (data, ptr) = vector.arrays()
+        log_columns[name] = data
+        log_columns[name + '_ptr'] = ptr
+    return NonlinearSolverLog(log_columns)
+
+def load_fmu_log(file_name):
+    """
+    Load a NonlinearSolverLog saved with NonlinearSolverLog.save.
+    """
+    with open(file_name, 'rb') as f:
+        data = N.load(f)
+        return NonlinearSolverLog(dict((name, data[name]) for name in data.files))
+
+def get_structured_fmu_log(log_file, blocks=None, t_start=None, t_end=None):
+    """
+    Return the nonlinear solver information in an FMU log as a list of
+    solves. Each solve is a dict with the time and a list of block solves,
+    and each block solve is a dict with, among others, a list of
+    iterations.
+
+    Only the block solves of the given block(s) in solves with time in
+    [t_start, t_end] are included, see NonlinearSolverLog.to_structured.
+    log_file may also be a file saved with NonlinearSolverLog.save, which
+    is much faster to read.
+    """
+    if log_file.endswith('.npz'):
+        log = load_fmu_log(log_file)
+    else:
+        log = parse_fmu_log(log_file)
+    return log.to_structured(blocks, t_start, t_end)
        
 def FMU_write_log_to_file(log_file, tags=[], file_name='fmu_log.txt'):
     
@@ -20,14 +20,29 @@ simulation package Assimulo.
 """
 
 
+import os
+import multiprocessing
 import numpy as N
 import pylab as P
+import scipy.sparse as sp
 from scipy.optimize import slsqp
 
 try:
     from openopt import NLP
 except ImportError:
     print "Could not load OpenOpt."
+
+try:
+    from assimulo.problem import Explicit_Problem
+    from assimulo.solvers import CVode
+except ImportError:
+    print "Could not load Assimulo."
+
+# The simulators used by the worker processes of a Multiple_Shooting. They are
+# set before the workers are forked, so that each worker gets its own copy of
+# the simulators and their model.
+_worker_simulator = None
+_worker_sens = None
     
 
 class Multiple_Shooting_Exception(Exception):
@@ -38,9 +53,23 @@ class Multiple_Shooting_Exception(Exception):
 
 class Multiple_Shooting(object):
     
-    def __init__(self, simulator, gridsize, initial_u):
+    def __init__(self, simulator, gridsize, initial_u, nbr_workers=1,
+                 sensitivities=False):
         """
         Initiates the shooting algorithm.
+        
+        If nbr_workers is greater than 1, the shooting intervals are 
+        simulated concurrently in a pool of worker processes, each with its 
+        own copy of the simulator. The copies are made when the pool is 
+        created, at the first evaluation of f or h, and the pool is kept 
+        until close is called.
+        
+        If sensitivities is True, the intervals are simulated by CVode 
+        together with the forward sensitivities of the states with respect 
+        to the inputs and initial values of the interval, see 
+        Interval_Sensitivities. The gradient of f and the Jacobian of h, 
+        df and dh, are then computed from the sensitivities and given to 
+        the optimizer, which then needs no finite differences.
         """
         #Set default parameters
         self.set_default_param()
@@ -48,6 +77,7 @@ class Multiple_Shooting(object):
         
         self.simulator = simulator
         self.model = simulator._problem._model
+        self._rhs = _get_rhs(simulator._problem)
         self.gridsize = gridsize
         
         self.nbr_us = len(self.model.real_u)
@@ -59,6 +89,21 @@ class Multiple_Shooting(object):
         self.initial_u = initial_u
         self.initial_y = self.model.real_x.copy()
         
+        self.nbr_workers = nbr_workers
+        self._pool = None
+        
+        if sensitivities:
+            self._sens = Interval_Sensitivities(simulator, self.nbr_us)
+        else:
+            self._sens = None
+        
+        #The simulated end values of all intervals for the last evaluated p,
+        #and their sensitivities with respect to the inputs and the initial
+        #values of the intervals
+        self._p_intervals = None
+        self._y_intervals = N.empty((self.gridsize, self.nbr_ys))
+        self._S_intervals = N.empty((self.gridsize, self.nbr_us+self.nbr_ys, self.nbr_ys))
+        
         #Sets the verbosity, default=NORMAL
         self.verbosity = Multiple_Shooting.NORMAL
     
@@ -71,6 +116,7 @@ class Multiple_Shooting(object):
         self.optMethod = 'scipy_slsqp'
         self.ftol = 1e-6
         self.maxTime = 700
+        self.sparse_jacobian = False
     
     def check_initial_u(self):
         """
@@ -122,8 +168,8 @@ class Multiple_Shooting(object):
         Creates a grid of the problem and returns the parameters to
         be optimized over.
         """
-        y = N.array([])
         u = self.check_initial_u();
+        y = N.empty((self.gridsize-1, self.nbr_ys))
         
 
         self.simulator.reset() #Reset the simulator before creating the initial guess for the ys
@@ -138,9 +184,9 @@ class Multiple_Shooting(object):
             self.model.real_u = u[self.nbr_us*(i+1):self.nbr_us*(i+2)]
             self.simulator.re_init(final_time,ys[-1]) #Re initiates the solver to the new values
 
-            y = N.append(y,ys[-1].flatten())
+            y[i] = ys[-1].flatten()
 
-        return N.append(u,y)
+        return N.append(u,y.flatten())
 
     
     def split_p(self, p):
@@ -168,32 +214,83 @@ class Multiple_Shooting(object):
             print 'Input u:', u[-1]
             print 'Input y: ', y[-1,:-1]
         
-        start_time = (self.final_time-self.start_time)/self.gridsize*(self.gridsize-1)
+        #The end values of the last interval, simulated together with the
+        #intervals of the constraints
+        y_end = self._simulate_intervals(p)[-1]
+        cost = self._eval_cost(u[-1], y_end)
+        
+        if  self.verbosity >= Multiple_Shooting.WHISPER:
+            print 'Evaluating cost:', cost
+        #if  self.verbosity >= Multiple_Shooting.SCREAM:
+        #    print 'Evaluating cost: (u, y) = ', u[-1], ys[-1]
 
+        return cost
+    
+    def _eval_cost(self, u_last, y_end):
+        """
+        Evaluates the cost function for the inputs of the last interval and
+        the values of the states at the final time.
+        """
         try:
-            self.model.real_u = u[-1]
-            self.simulator.re_init(start_time,y[-1]) #Re initiates the solver to the new values
-            [ts, ys] = self.simulator(self.final_time,1) #Run the simulation to final time
+            if N.isnan(y_end).any():
+                raise Multiple_Shooting_Exception('Simulation failed.')
             
-            self.model.real_u = u[-1]
-            self.model.real_x = ys[-1]
+            self.model.real_u = u_last
+            #The derivatives at the final time. They are evaluated here,
+            #since the intervals may have been simulated by the workers.
+            dx_end = N.array(self._rhs(self.final_time, y_end), 
+                             dtype=float).flatten()
+            self.model.real_x = y_end
             
             #Set values for calculation of the cost function
-            self.model.set_real_x_p(ys[-1], 0)
-            self.model.set_real_dx_p(self.model.real_dx, 0)
-            self.model.set_real_u_p(u[-1], 0)
+            self.model.set_real_x_p(y_end, 0)
+            self.model.set_real_dx_p(dx_end, 0)
+            self.model.set_real_u_p(u_last, 0)
             
             cost = self.model.opt_eval_J() #Evaluate the cost function
         except:
             cost = N.array(N.nan)
-        
-        if  self.verbosity >= Multiple_Shooting.WHISPER:
-            print 'Evaluating cost:', cost
-        #if  self.verbosity >= Multiple_Shooting.SCREAM:
-        #    print 'Evaluating cost: (u, y) = ', u[-1], ys[-1]
-
         return cost
     
+    def _eval_cost_gradient(self, u_last, y_end):
+        """
+        Returns the gradients of the cost function with respect to the 
+        inputs of the last interval and the values of the states at the 
+        final time. The cost function does not involve any simulation, so 
+        they are computed with forward differences.
+        """
+        v = N.append(u_last, y_end)
+        J = self._eval_cost(u_last, y_end)
+        grad = N.empty(len(v))
+        for j in range(len(v)):
+            step = N.sqrt(N.finfo(float).eps)*max(1., abs(v[j]))
+            v_step = v.copy()
+            v_step[j] += step
+            J_step = self._eval_cost(v_step[:self.nbr_us], v_step[self.nbr_us:])
+            grad[j] = (J_step - J)/step
+        return [grad[:self.nbr_us], grad[self.nbr_us:]]
+    
+    def df(self, p):
+        """
+        The gradient of the cost function f, computed from the 
+        sensitivities of the last interval.
+        """
+        [u, y] = self.split_p(p)
+        y_end = self._simulate_intervals(p, True)[-1]
+        S = self._S_intervals[-1]
+        [dJdu, dJdy] = self._eval_cost_gradient(u[-1], y_end)
+        
+        #The cost depends directly on the inputs of the last interval, and
+        #through the final values of the states on the inputs and initial 
+        #values of the last interval
+        grad = N.zeros(len(p))
+        nu = self.nbr_us
+        grad[nu*(self.gridsize-1):nu*self.gridsize] = dJdu + S[:nu].dot(dJdy)
+        if self.gridsize > 1:
+            start = nu*self.gridsize + self.nbr_ys*(self.gridsize-2)
+            grad[start:start+self.nbr_ys] = S[nu:].dot(dJdy)
+        return grad
+    
     def h(self, p):
         """
         These are the equility constraints that arises from optimizing
@@ -206,23 +303,7 @@ class Multiple_Shooting(object):
             print 'Input u:', u
             print 'Input y: ', y
         
-        y_calc = N.array([])
-
-        for i in range(self.gridsize-1):
-            
-            start_time = (self.final_time-self.start_time)/self.gridsize*i
-            final_time = (self.final_time-self.start_time)/self.gridsize*(i+1)
-            
-            self.model.real_u = u[i]
-            self.simulator.re_init(start_time, y[i])
-            try:
-                [t, y_sol] = self.simulator(final_time, 1)
-            except:
-                y_sol = [N.array([N.nan]*self.nbr_ys)]
-                
-            y_calc = N.append(y_calc,y_sol[-1].flatten())
-            
-        y_calc = y_calc.reshape(self.gridsize-1,self.nbr_ys)
+        y_calc = self._simulate_intervals(p)[:-1]
             
         cons = y[1:,:]-y_calc[:,:]
         cons = cons.flatten()
@@ -231,7 +312,147 @@ class Multiple_Shooting(object):
             print 'Equility constraints: ', cons.sum()
 
         return cons
+    
+    def dh(self, p):
+        """
+        The Jacobian of the equality constraints h, computed from the 
+        sensitivities of the intervals. 
+        
+        The constraints of interval i only depend on the inputs and initial
+        values of interval i and the initial values of interval i+1, so the
+        Jacobian is block sparse. It is returned as a scipy.sparse matrix if
+        the attribute sparse_jacobian is True, otherwise as an array.
+        """
+        self._simulate_intervals(p, True)
+        nu = self.nbr_us
+        ny = self.nbr_ys
+        u_start = 0
+        y_start = nu*self.gridsize
+        
+        #Row and column indices of the blocks, in row major order
+        (u_rows, u_cols) = N.mgrid[0:ny, 0:nu]
+        (y_rows, y_cols) = N.mgrid[0:ny, 0:ny]
+        rows = []
+        cols = []
+        vals = []
+        for i in range(self.gridsize-1):
+            S = self._S_intervals[i]
+            #The final values of interval i with respect to its inputs
+            rows.append(i*ny + u_rows.ravel())
+            cols.append(u_start + i*nu + u_cols.ravel())
+            vals.append(-S[:nu].T.ravel())
+            #... and to its initial values, which are free if i > 0
+            if i > 0:
+                rows.append(i*ny + y_rows.ravel())
+                cols.append(y_start + (i-1)*ny + y_cols.ravel())
+                vals.append(-S[nu:].T.ravel())
+            #The initial values of interval i+1
+            rows.append(i*ny + N.arange(ny))
+            cols.append(y_start + i*ny + N.arange(ny))
+            vals.append(N.ones(ny))
+        
+        shape = ((self.gridsize-1)*ny, len(p))
+        if len(rows) == 0:
+            jac = sp.csr_matrix(shape)
+        else:
+            jac = sp.csr_matrix((N.concatenate(vals), 
+                                 (N.concatenate(rows), N.concatenate(cols))),
+                                shape=shape)
+        if self.sparse_jacobian:
+            return jac
+        return jac.toarray()
+        
+    def _get_interval_times(self):
+        """
+        Returns the start and final times of the shooting intervals.
+        """
+        times = []
+        for i in range(self.gridsize):
+            start_time = (self.final_time-self.start_time)/self.gridsize*i
+            final_time = (self.final_time-self.start_time)/self.gridsize*(i+1)
+            times.append((start_time, final_time))
+        #The last interval ends at the final time, see f
+        times[-1] = (times[-1][0], self.final_time)
+        return times
+    
+    def _get_pool(self):
+        """
+        Returns the pool of worker processes used to simulate the intervals,
+        or None if the intervals should be simulated in this process.
+        """
+        global _worker_simulator, _worker_sens
+        if self.nbr_workers <= 1 or self.gridsize == 1:
+            return None
+        if not hasattr(os, 'fork'):
+            print 'Parallel simulation of the intervals requires fork, simulating in the current process'
+            self.nbr_workers = 1
+            return None
+        if self._pool is None:
+            _worker_simulator = self.simulator
+            _worker_sens = self._sens
+            self._pool = multiprocessing.Pool(self.nbr_workers)
+        return self._pool
+    
+    def close(self):
+        """
+        Terminates the worker processes used to simulate the intervals, if
+        any.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+    
+    def _simulate_intervals(self, p, sens=False):
+        """
+        Simulates all shooting intervals from the inputs and initial values
+        in p, and returns an array with the values of the states at the end
+        of each interval. The values of an interval whose simulation failed
+        are nan.
+        
+        If sensitivities are enabled, the sensitivities of the values at the
+        end of each interval are stored in the attribute _S_intervals, see
+        Interval_Sensitivities.simulate. They are then always computed, so 
+        that f, h, df and dh only need one simulation of each interval for 
+        each p. sens must be True for the methods that use the 
+        sensitivities.
+        
+        The result for the last p is kept, so that f and h only simulate the
+        intervals once for each p.
+        """
+        if sens and self._sens is None:
+            raise Multiple_Shooting_Exception('Sensitivities are not enabled.')
+        p = N.asarray(p, dtype=float)
+        if self._p_intervals is not None and N.array_equal(p, self._p_intervals):
+            return self._y_intervals
+        
+        [u, y] = self.split_p(p)
+        args = [(u[i], y[i], start_time, final_time)
+                for (i, (start_time, final_time)) in enumerate(self._get_interval_times())]
+        pool = self._get_pool()
+        if self._sens is not None:
+            if pool is None:
+                results = [self._sens.simulate(*a) for a in args]
+            else:
+                results = pool.map(_simulate_interval_sens_worker, args)
+        else:
+            if pool is None:
+                results = [(_simulate_interval(self.simulator, *a), None) for a in args]
+            else:
+                results = [(y_end, None) for y_end in
+                           pool.map(_simulate_interval_worker, args)]
         
+        for (i, (y_end, S)) in enumerate(results):
+            if y_end is None:
+                self._y_intervals[i] = N.nan
+                self._S_intervals[i] = N.nan
+            else:
+                self._y_intervals[i] = y_end
+                if S is not None:
+                    self._S_intervals[i] = S
+        self._p_intervals = p.copy()
+        return self._y_intervals
+    
     def run(self, plot=True):
         """
         Solves the optimization problem.
@@ -263,6 +484,12 @@ class Multiple_Shooting(object):
         if self.gridsize > 1:
             p_solve.h  = self.h
         
+        #Derivatives from the sensitivities
+        if self._sens is not None:
+            p_solve.df = self.df
+            if self.gridsize > 1:
+                p_solve.dh = self.dh
+        
         if plot:
             p_solve.plot = 1
 
@@ -407,3 +634,107 @@ class Multiple_Shooting(object):
         
     verbositydocstring = 'Determine the output level from the optimization.'
     verbosity = property(_get_verbosity, _set_verbosity,doc=verbositydocstring)
+
+def _get_rhs(problem):
+    """
+    Returns the right hand side function rhs(t, y) of an assimulo problem.
+    """
+    rhs = getattr(problem, 'rhs', None)
+    if rhs is None:
+        rhs = problem.f
+    return rhs
+
+def _simulate_interval(simulator, u_i, y_i, start_time, final_time):
+    """
+    Simulates one shooting interval with the inputs u_i and the initial 
+    values y_i, and returns the values of the states at final_time, or None 
+    if the simulation failed.
+    """
+    simulator._problem._model.real_u = u_i
+    try:
+        simulator.re_init(start_time, y_i)
+        [t, y_sol] = simulator(final_time, 1)
+    except:
+        return None
+    return N.array(y_sol[-1]).flatten()
+
+def _simulate_interval_worker(args):
+    """
+    Simulates one shooting interval with the simulator of a worker process.
+    """
+    return _simulate_interval(_worker_simulator, *args)
+
+def _simulate_interval_sens_worker(args):
+    """
+    Simulates one shooting interval with sensitivities in a worker process.
+    """
+    return _worker_sens.simulate(*args)
+
+class Interval_Sensitivities(object):
+    """
+    Simulates shooting intervals with CVode, together with the forward 
+    sensitivities of the states with respect to the inputs and the initial
+    values of the interval.
+    
+    The problem of the given simulator is extended with one parameter per
+    input, which is added to the input, and one parameter per state, which
+    the right hand side does not depend on. The initial sensitivities with 
+    respect to the latter are unit vectors, which makes their sensitivities
+    the sensitivities with respect to the initial values.
+    """
+    
+    def __init__(self, simulator, nbr_us):
+        """
+        Creates the CVode simulator with sensitivities. The relative and
+        absolute tolerances are taken from simulator, if it has them.
+        """
+        problem = simulator._problem
+        self.model = problem._model
+        self.nbr_us = nbr_us
+        self.u = N.zeros(nbr_us)
+        
+        #The right hand side of the original problem, which uses the inputs 
+        #set in the model
+        rhs = _get_rhs(problem)
+        def sens_rhs(t, y, p):
+            self.model.real_u = self.u + p[:nbr_us]
+            return rhs(t, y)
+        
+        y0 = N.array(self.model.real_x, dtype=float)
+        nbr_ys = len(y0)
+        nbr_ps = nbr_us + nbr_ys
+        sens_problem = Explicit_Problem(sens_rhs, y0, 0.0, p0=N.zeros(nbr_ps))
+        sens_problem.yS0 = N.vstack((N.zeros((nbr_us, nbr_ys)), N.eye(nbr_ys)))
+        sens_problem.pbar = N.ones(nbr_ps)
+        
+        self.simulator = CVode(sens_problem)
+        self.simulator.rtol = getattr(simulator, 'rtol', 1e-6)
+        self.simulator.atol = getattr(simulator, 'atol', 1e-6)
+        self.simulator.report_continuously = False
+        self.simulator.verbosity = 50
+    
+    def simulate(self, u_i, y_i, start_time, final_time):
+        """
+        Simulates one shooting interval with the inputs u_i and the initial
+        values y_i.
+        
+        Returns::
+        
+            y_end --
+                The values of the states at final_time, or None if the 
+                simulation failed.
+            
+            S --
+                An array where S[j,k] is the sensitivity of state k at 
+                final_time with respect to input j for j < nbr_us, and with 
+                respect to the initial value of state j-nbr_us otherwise, or
+                None if the simulation failed.
+        """
+        self.u = N.array(u_i, dtype=float)
+        try:
+            self.simulator.re_init(start_time, N.array(y_i, dtype=float))
+            [t, y_sol] = self.simulator.simulate(final_time, 1)
+            S = N.array(self.simulator.interpolate_sensitivity(final_time, 0))
+        except:
+            return (None, None)
+        return (N.array(y_sol[-1]).flatten(), S.reshape(len(self.u)+len(y_i), -1))
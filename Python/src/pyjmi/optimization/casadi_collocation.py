@@ -29,7 +29,12 @@ import copy
 import types
 import math
 import os
-from os import system, path
+import stat
+import getpass
+import hashlib
+import subprocess
+import tempfile
+from os import path
 from operator import sub
 from collections import OrderedDict, Iterable
 from scipy.sparse import csc_matrix, csr_matrix
@@ -65,7 +70,8 @@ except ImportError:
                              pymodelicaVariableNotFoundError)
 
 from pyjmi.common.algorithm_drivers import JMResultBase
-from pyjmi.common.io import ResultDymolaTextual
+from pyjmi.common.io import ResultDymolaTextual, ResultDymolaBinary
+from pyjmi.jmi_io import ResultDymolaMemory, write_result_dymola_binary
 
 class CasadiCollocatorException(Exception):
     """
@@ -502,14 +508,18 @@ class CasadiCollocator(object):
         return (input_names, self._create_input_interpolator(self._xi, self._ti, self._hi))
 
     def _create_input_interpolator(self, xi, ti, hi):
+        hi = N.asarray(hi, dtype=float)
         def _input_interpolator(t):
-            i = N.clip(N.searchsorted(ti, t), 1, self.n_e)
-            tau = (t - ti[i - 1]) / hi[i]
-
-            x = 0
-            for k in xrange(self.n_cp):
-                x += xi[i - 1, k, :] * self.pol.eval_basis(k + 1, tau, False)
-            return x
+            # t may be a scalar or an array of time points, all inputs are
+            # evaluated at all time points at once
+            t = N.asarray(t, dtype=float)
+            t_flat = t.reshape(-1)
+            i = N.clip(N.searchsorted(ti, t_flat), 1, self.n_e)
+            tau = (t_flat - ti[i - 1]) / hi[i]
+
+            basis = self.pol.eval_basis_matrix(tau, False)
+            x = N.sum(basis[:, :, N.newaxis] * xi[i - 1], axis=1)
+            return x.reshape(t.shape + (xi.shape[2],))
         return _input_interpolator
 
     def get_solver_statistics(self):
@@ -977,6 +987,12 @@ class LocalDAECollocator(CasadiCollocator):
             raise CasadiCollocatorException("Unknown discretization scheme %s."
                                             % self.discr)
         self.warm_start = False
+        
+        # Free parameters that are fixed through their bounds, and offsets
+        # of path constraint bounds, see OptimizationSolver
+        self._fixed_p_opt = {}
+        self._path_bound_offsets = {}
+        
         # Get to work
         self._create_nlp()
 
@@ -995,9 +1011,23 @@ class LocalDAECollocator(CasadiCollocator):
         t0 = time.clock()
         # todo: account for preprocessing time within solve_nlp separately?
         self.times['sol'] = self.solve_nlp()
-        self.result_file_name = self.export_result_dymola(self.result_file_name)
+        self.write_result()
         self.times['post_processing'] = time.clock() - t0 - self.times['sol'] - self.extra_update
 
+    def write_result(self):
+        """
+        Store the result of the last optimization in memory, or write it to 
+        a binary or textual file, depending on the result_handling option. 
+        The result can then be loaded with get_result_object.
+        """
+        if self.result_handling == "memory":
+            self._result_data = self.get_result_data()
+        elif self.result_handling == "binary":
+            self.result_file_name = self.export_result_dymola(
+                self.result_file_name, format='mat')
+        else:
+            self.result_file_name = self.export_result_dymola(self.result_file_name)
+
     def get_result_object(self, include_init = True):
         """ 
         Load result data saved in e.g. solve_and_write_result and create a LocalDAECollocationAlgResult object.
@@ -1007,8 +1037,15 @@ class LocalDAECollocator(CasadiCollocator):
             The LocalDAECollocationAlgResult object.
         """
         t0 = time.clock()
-        resultfile = self.result_file_name
-        res = ResultDymolaTextual(resultfile)
+        if self.result_handling == "memory":
+            resultfile = None
+            res = self._result_data
+        elif self.result_handling == "binary":
+            resultfile = self.result_file_name
+            res = ResultDymolaBinary(resultfile)
+        else:
+            resultfile = self.result_file_name
+            res = ResultDymolaTextual(resultfile)
 
         # Get optimized element lengths
         h_opt = self.get_h_opt()
@@ -3026,15 +3063,19 @@ class LocalDAECollocator(CasadiCollocator):
         g_i = []
         self.path_eq_orig = []
         self.path_ineq_orig = []
+        self.path_orig_map = [] # (eqtype, index) for each path constraint
         for (res, cnstr) in itertools.izip(self.path, self.op.getPathConstraints()):
             if cnstr.getType() == cnstr.EQ:
                 g_e.append(res)
+                self.path_orig_map.append(('path_eq', len(self.path_eq_orig)))
                 self.path_eq_orig.append(cnstr)
             elif cnstr.getType() == cnstr.LEQ:
                 g_i.append(res)
+                self.path_orig_map.append(('path_ineq', len(self.path_ineq_orig)))
                 self.path_ineq_orig.append(cnstr)
             elif cnstr.getType() == cnstr.GEQ:
                 g_i.append(-res)
+                self.path_orig_map.append(('path_ineq', len(self.path_ineq_orig)))
                 self.path_ineq_orig.append(cnstr)
 
         # Create path constraint functions
@@ -4482,16 +4523,52 @@ class LocalDAECollocator(CasadiCollocator):
         """
         Evaluate initial value of Variable var at a given collocation point.
 
+        self._create_initial_trajectories() must have been called first.
+        """
+        return self._eval_initial_points([var], [(i, k)])[0, 0]
+
+    def _eval_initial_points(self, variables, points):
+        """
+        Evaluate initial values of Variables at collocation points, given as
+        a list of (i, k) pairs.
+
+        Returns a matrix with one row per point and one column per variable.
+
         self._create_initial_trajectories() must have been called first.
         """
         if self.init_traj is None:
-            return self.op.get_attr(var, "initialGuess")
-        else:
-            time = self.time_points[i][k]
-            if self._normalize_min_time:
-                time = (self._denorm_t0_init +
-                        (self._denorm_tf_init - self._denorm_t0_init) * time)
-            return self.init_traj_interp[var].eval(time)
+            init = [self.op.get_attr(var, "initialGuess") for var in variables]
+            return N.tile(N.array(init, dtype=float), (len(points), 1))
+        time = N.array([self.time_points[i][k] for (i, k) in points])
+        if self._normalize_min_time:
+            time = (self._denorm_t0_init +
+                    (self._denorm_tf_init - self._denorm_t0_init) * time)
+        values = N.empty([len(points), len(variables)])
+        for (j, var) in enumerate(variables):
+            values[:, j] = self.init_traj_interp[var].eval(time).reshape(-1)
+        return values
+
+    def _get_affine_scaling_points(self, variables, points):
+        """
+        Get the affine scalings (d, e) of Variables at collocation points,
+        given as a list of (i, k) pairs, see _get_affine_scaling.
+
+        Returns two matrices with one row per point and one column per
+        variable.
+        """
+        d = N.ones([len(points), len(variables)])
+        e = N.zeros([len(points), len(variables)])
+        if self.variable_scaling:
+            for (j, var) in enumerate(variables):
+                name = var.getName()
+                if self._using_variant_variable_scaling(name):
+                    (d[:, j], e[:, j]) = zip(*[
+                        self._get_affine_scaling(name, i, k)
+                        for (i, k) in points])
+                else:
+                    (d[:, j], e[:, j]) = self._get_affine_scaling(
+                        name, -1, -1)
+        return (d, e)
 
     def _compute_bounds_and_init(self):
         """
@@ -4538,73 +4615,49 @@ class LocalDAECollocator(CasadiCollocator):
                     else: 
                         var_init = data.x[0] 
             p_init[var_index] = var_init / sf
+            
+            # Fix the parameter through its bounds
+            if name in self._fixed_p_opt:
+                p_min[var_index] = p_max[var_index] = p_init[var_index] = \
+                        self._fixed_p_opt[name] / sf
         xx_lb[self.var_indices['p_opt']] = p_min
         xx_ub[self.var_indices['p_opt']] = p_max
         xx_init[self.var_indices['p_opt']] = p_init
 
-        # Manipulate initial trajectories
-        if self.init_traj is not None:
-            n = len(self.init_traj.get_data_matrix()[:, 0])
-            traj = {}
-
-            for vt in ["dx", "x", "w", "unelim_u"]:
-                traj[vt] = {}
-                for var in mvar_vectors[vt]:
-                    name = var.getName()
-                    (var_index, _) = name_map[name]
-                    if name == "startTime":
-                        abscissae = N.array([0])
-                        ordinates = N.array([[self._denorm_t0_init]])
-                    elif name == "finalTime":
-                        abscissae = N.array([0])
-                        ordinates = N.array([[self._denorm_tf_init]])
-                    else:
-                        try:
-                            data = self.init_traj.get_variable_data(name)
-                        except VariableNotFoundError:
-                            if self.options['verbosity'] >= 2:
-                                print("Warning: Could not find initial " +
-                                      "trajectory for variable " + name +
-                                      ". Using initialGuess attribute value " +
-                                      "instead.")
-                            ordinates = N.array([[
-                                op.get_attr(var, "initialGuess")]])
-                            abscissae = N.array([0])
-                        else:
-                            abscissae = N.asarray(data.t)
-                            ordinates = N.asarray(data.x).reshape([-1, 1])
-                        traj[vt][var_index] = TrajectoryLinearInterpolation(
-                            abscissae, ordinates)
-
         # Denormalize time for minimum time problems
         if self._normalize_min_time:
             t0 = self._denorm_t0_init
             tf = self._denorm_tf_init
 
-        # Set bounds and initial guesses
+        # Set bounds and initial guesses, for all collocation points and
+        # all variables of each type at once
+        points = [(i, k) for i in xrange(1, self.n_e + 1)
+                  for k in self.time_points[i].keys()]
         for vt in ['dx', 'x', 'w', 'unelim_u']:
-            for var in mvar_vectors[vt]:
-                name = var.getName()
-                v_min = op.get_attr(var, "min")
-                v_max = op.get_attr(var, "max")
-                (var_idx, _) = name_map[name]
-                
-                for i in xrange(1, self.n_e + 1):
-                    for k in self.time_points[i].keys():
-                        
-                        #Get scaling factors
-                        d, e = self._get_affine_scaling(name, i, k)
-                        
-                        #Scale bounds and init
-                        v_init = self._eval_initial(var, i, k)
-                        if self._normalize_min_time and vt == "dx":
-                            if N.isfinite([v_min, v_max]).any():
-                                return NotImplementedError('State derivative bounds are not supported for problems ' +
-                                                           'with free time horizons.')
-                            v_init *= (tf - t0)
-                        xx_lb[self.var_indices[vt][i][k][var_idx]] = (v_min - e) / d
-                        xx_ub[self.var_indices[vt][i][k][var_idx]] = (v_max - e) / d
-                        xx_init[self.var_indices[vt][i][k][var_idx]] = (v_init - e) / d
+            variables = mvar_vectors[vt]
+            if len(variables) == 0:
+                continue
+            var_idx = [name_map[var.getName()][0] for var in variables]
+            xx_idx = N.array([self.var_indices[vt][i][k] for (i, k) in points],
+                             dtype=int)[:, var_idx]
+            v_min = N.array([op.get_attr(var, "min") for var in variables],
+                            dtype=float)
+            v_max = N.array([op.get_attr(var, "max") for var in variables],
+                            dtype=float)
+
+            #Get scaling factors
+            d, e = self._get_affine_scaling_points(variables, points)
+
+            #Scale bounds and init
+            v_init = self._eval_initial_points(variables, points)
+            if self._normalize_min_time and vt == "dx":
+                if N.isfinite(N.hstack([v_min, v_max])).any():
+                    return NotImplementedError('State derivative bounds are not supported for problems ' +
+                                               'with free time horizons.')
+                v_init *= (tf - t0)
+            xx_lb[xx_idx] = (v_min - e) / d
+            xx_ub[xx_idx] = (v_max - e) / d
+            xx_init[xx_idx] = (v_init - e) / d
 
         # Set bounds and initial guesses for continuity variables
         if not self.eliminate_cont_var:
@@ -4635,8 +4688,15 @@ class LocalDAECollocator(CasadiCollocator):
         n_g = self.get_inequality_constraint().numel()
         gub = n_g * [0]
         glb = n_g * [self.LOWER]
-        self.glub = N.array(hublb + gub)
-        self.gllb = N.array(hublb + glb)
+        self.glub = N.array(hublb + gub, dtype=float)
+        self.gllb = N.array(hublb + glb, dtype=float)
+
+        # Offset the bounds of path constraints with changed right hand sides
+        for ((eqtype, j), offset) in self._path_bound_offsets.iteritems():
+            (c_inds, _, _) = self.get_nlp_constraint_indices(eqtype)
+            self.glub[c_inds[:, j]] = offset
+            if eqtype == 'path_eq':
+                self.gllb[c_inds[:, j]] = offset
 
     def _assemble_back_tracking_info(self):
         # Finalize and sort recorded tracking info
@@ -5194,174 +5254,184 @@ class LocalDAECollocator(CasadiCollocator):
             used_file_name --
                 The actual file name used to write the result file.
                 Equals file_name unless file_name is empty.
+        """
+        if format not in ['txt', 'mat']:
+            raise NotImplementedError('Export on Dymola result files in ' +
+                                      'format %s is not supported.' % format)
+        (names, descriptions, data_info, data_1, data) = \
+            self._get_result_dymola_data(result)
+        if file_name == '':
+            file_name = self.op.getIdentifier() + '_result.' + format
+
+        if format == 'mat':
+            write_result_dymola_binary(file_name, names, descriptions,
+                                       data_info, data_1, data)
+            return file_name
 
-        Limitations::
+        f = codecs.open(file_name, 'w', 'utf-8')
+
+        # Write header
+        f.write('#1\n')
+        f.write('char Aclass(3,11)\n')
+        f.write('Atrajectory\n')
+        f.write('1.1\n')
+        f.write('\n')
+
+        num_vars = len(names)
+        max_name_length = max([len(name) for name in names])
+        max_desc_length = max([len(desc) for desc in descriptions])
+
+        # Write names
+        f.write('char name(%d,%d)\n' % (num_vars, max_name_length))
+        f.write(''.join(['%s\n' % name for name in names]))
+        f.write('\n')
+
+        # Write descriptions
+        f.write('char description(%d,%d)\n' % (num_vars, max_desc_length))
+        f.write(''.join(['%s\n' % desc for desc in descriptions]))
+        f.write('\n')
+
+        # Write dataInfo
+        f.write('int dataInfo(%d,%d)\n' % (num_vars, 4))
+        for (name, (data_set, column)) in zip(names, data_info):
+            f.write('%d %d 0 -1 # %s\n' % (data_set, column, name))
+        f.write('\n')
+
+        # Write data_1
+        n_parameters = data_1.shape[1] - 1
+        f.write('float data_1(%d,%d)\n' % (2, n_parameters + 1))
+        par_val_str = ' %.14E'*n_parameters % tuple(data_1[0, 1:]) + '\n'
+        f.write("%.14E" % data_1[0, 0])
+        f.write(par_val_str)
+        f.write("%.14E" % data_1[1, 0])
+        f.write(par_val_str)
+        f.write('\n')
+
+        # Write data_2, formatting one row at a time
+        (n_points, n_vars) = data.shape
+        f.write('float data_2(%d,%d)\n' % (n_points, n_vars))
+        row_format = ' %.14E'*n_vars + '\n'
+        f.write(''.join([row_format % tuple(row) for row in data]))
+
+        # Close file
+        f.write('\n')
+        f.close()
+
+        return file_name
+
+    def get_result_data(self, result=None):
+        """
+        Get an optimization or simulation result in Dymolas result format 
+        without writing it to file.
 
-            Currently only textual format is supported.
-        """
-        if result is None:
-            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = self.get_result()
-            data = N.hstack((t,dx_opt,x_opt,u_opt,w_opt,elim_vars))
-        else:
-            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = result
-            data = N.hstack((t,dx_opt,x_opt,u_opt,w_opt,elim_vars))
+        Parameters::
 
-        if (format=='txt'):
-            op = self.op
-            name_map = self.name_map
-            mvar_vectors = self.mvar_vectors
-            variable_list = reduce(list.__add__,
-                                   [list(mvar_vectors[vt]) for
-                                    vt in ['p_opt', 'p_fixed',
-                                           'dx', 'x', 'u', 'w']])
-            if result is None:
-                for v in op.getEliminatedVariables():
-                    variable_list.append(v) 
-
-            # Map variable to aliases
-            alias_map = {}
-            for var in variable_list:
-                alias_map[var.getName()] = []
-            for alias_var in op.getAliases():
-                alias = alias_var.getModelVariable()
-                alias_map[alias.getName()].append(alias_var)
-
-            # Set up sections
-            # Put exactly one entry per variable in name_section etc
-            # - its length is used to determine num_vars
-            name_section = ['time\n']
-            description_section = ['Time in [s]\n']
-            data_info_section = ['0 1 0 -1 # time\n']
-
-            # Collect meta information
-            n_variant = 1
-            n_invariant = 1
-            max_name_length = len('Time')
-            max_desc_length = len('Time in [s]')
-            for var in variable_list:
-                # Name
-                name = var.getName()
-                name_section.append('%s\n' % name)
-                if len(name) > max_name_length:
-                    max_name_length = len(name)
+            result --
+                The result to use, see export_result_dymola.
+                Default: None
 
-                # Description
-                description = op.get_attr(var, "comment")
-                description_section.append('%s\n' % description)
-                if len(description) > max_desc_length:
-                    max_desc_length = len(description)
+        Returns::
 
-                # Data info
-                variability = var.getVariability()
-                if variability in [var.PARAMETER, var.CONSTANT]:
-                    n_invariant += 1
-                    data_info_section.append('1 %d 0 -1 # %s\n' %
-                                             (n_invariant, name))
-                else:
-                    n_variant += 1
-                    data_info_section.append('2 %d 0 -1 # %s\n' %
-                                             (n_variant, name))
-
-                # Handle alias variables
-                for alias_var in alias_map[var.getName()]:
-                    # Name
-                    name = alias_var.getName()
-                    name_section.append('%s\n' % name)
-                    if len(name) > max_name_length:
-                        max_name_length = len(name)
-
-                    # Description
-                    description = op.get_attr(alias_var, "comment")
-                    description_section.append('%s\n' % description)
-                    if len(description) > max_desc_length:
-                        max_desc_length = len(description)
-
-                    # Data info
-                    if alias_var.isNegated():
-                        neg = -1
-                    else:
-                        neg = 1
-                    if variability in [alias_var.PARAMETER, alias_var.CONSTANT]:
-                        data_info_section.append('1 %d 0 -1 # %s\n' %
-                                                 (neg*n_invariant, name))
-                    else:
-                        data_info_section.append('2 %d 0 -1 # %s\n' %
-                                                 (neg*n_variant, name))
+            A ResultDymolaMemory object, which can be used in place of a 
+            ResultDymolaTextual object.
+        """
+        return ResultDymolaMemory(*self._get_result_dymola_data(result))
 
-            # Collect parameter data (data_1)
-            data_1 = []
-            for par in mvar_vectors['p_opt']:
-                name = par.getName()
-                (ind, _) = name_map[name]
-                data_1.append(" %.14E" % p_opt[ind])
+    def _get_result_dymola_data(self, result=None):
+        """
+        Collect the names, descriptions, data information and data matrices 
+        of a result in Dymolas result format.
 
-            for par_val in p_fixed:
-                data_1.append(" %.14E" % par_val)
+        Returns::
 
-            # Open file
-            if file_name == '':
-                file_name = self.op.getIdentifier() + '_result.txt'
-            f = codecs.open(file_name, 'w', 'utf-8')
+            names --
+                A list of the variable names, starting with 'time'.
 
-            # Write header
-            f.write('#1\n')
-            f.write('char Aclass(3,11)\n')
-            f.write('Atrajectory\n')
-            f.write('1.1\n')
-            f.write('\n')
+            descriptions --
+                A list of the variable descriptions.
 
-            num_vars = len(name_section)
+            data_info --
+                A list with one (data set, column) pair per variable.
 
-            # Write names
-            f.write('char name(%d,%d)\n' % (num_vars, max_name_length))
-            for name in name_section:
-                f.write(name)
-            f.write('\n')
+            data_1 --
+                The start and final time and the parameter values.
 
-            # Write descriptions
-            f.write('char description(%d,%d)\n' % (num_vars, max_desc_length))
-            for description in description_section:
-                f.write(description)
-            f.write('\n')
+            data_2 --
+                The time points and the trajectories of the time-varying 
+                variables.
+        """
+        if result is None:
+            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = self.get_result()
+        else:
+            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = result
+        data = N.hstack((t,dx_opt,x_opt,u_opt,w_opt,elim_vars))
 
-            # Write dataInfo
-            f.write('int dataInfo(%d,%d)\n' % (num_vars, 4))
-            for data_info in data_info_section:
-                f.write(data_info)
-            f.write('\n')
+        op = self.op
+        name_map = self.name_map
+        mvar_vectors = self.mvar_vectors
+        variable_list = reduce(list.__add__,
+                               [list(mvar_vectors[vt]) for
+                                vt in ['p_opt', 'p_fixed',
+                                       'dx', 'x', 'u', 'w']])
+        if result is None:
+            for v in op.getEliminatedVariables():
+                variable_list.append(v) 
+
+        # Map variable to aliases
+        alias_map = {}
+        for var in variable_list:
+            alias_map[var.getName()] = []
+        for alias_var in op.getAliases():
+            alias = alias_var.getModelVariable()
+            alias_map[alias.getName()].append(alias_var)
+
+        # Put exactly one entry per variable in names etc
+        names = ['time']
+        descriptions = ['Time in [s]']
+        data_info = [(0, 1)]
+
+        # Collect meta information
+        n_variant = 1
+        n_invariant = 1
+        for var in variable_list:
+            names.append(var.getName())
+            descriptions.append(op.get_attr(var, "comment"))
+
+            # Data info
+            variability = var.getVariability()
+            if variability in [var.PARAMETER, var.CONSTANT]:
+                n_invariant += 1
+                data_info.append((1, n_invariant))
+            else:
+                n_variant += 1
+                data_info.append((2, n_variant))
 
-            # Write data_1
-            n_parameters = (len(mvar_vectors['p_opt']) +
-                            len(mvar_vectors['p_fixed']))
-            f.write('float data_1(%d,%d)\n' % (2, n_parameters + 1))
-            par_val_str = ''
-            for par_val in data_1:
-                par_val_str += par_val
-            par_val_str += '\n'
-            f.write("%.14E" % data[0,0])
-            f.write(par_val_str)
-            f.write("%.14E" % data[-1,0])
-            f.write(par_val_str)
-            f.write('\n')
+            # Handle alias variables
+            for alias_var in alias_map[var.getName()]:
+                names.append(alias_var.getName())
+                descriptions.append(op.get_attr(alias_var, "comment"))
 
-            # Write data_2
-            n_vars = len(data[0, :])
-            n_points = len(data[:, 0])
-            f.write('float data_2(%d,%d)\n' % (n_points, n_vars))
-            for i in range(n_points):
-                str_text = ''
-                for ref in range(n_vars):
-                    str_text = str_text + (" %.14E" % data[i, ref])
-                f.write(str_text + '\n')
+                # Data info
+                if alias_var.isNegated():
+                    neg = -1
+                else:
+                    neg = 1
+                if variability in [alias_var.PARAMETER, alias_var.CONSTANT]:
+                    data_info.append((1, neg*n_invariant))
+                else:
+                    data_info.append((2, neg*n_variant))
 
-            # Close file
-            f.write('\n')
-            f.close()
+        # Collect parameter data (data_1)
+        par_vals = []
+        for par in mvar_vectors['p_opt']:
+            name = par.getName()
+            (ind, _) = name_map[name]
+            par_vals.append(p_opt[ind])
+        par_vals.extend(p_fixed)
+        data_1 = N.array([[data[0,0]] + par_vals, [data[-1,0]] + par_vals],
+                         dtype=float)
 
-            return file_name
-        else:
-            raise NotImplementedError('Export on binary Dymola result files ' +
-                                      'not yet supported.')
+        return (names, descriptions, data_info, data_1, data)
 
     def get_opt_input(self):
         """
@@ -5804,7 +5874,7 @@ class LocalDAECollocator(CasadiCollocator):
         
         return (inds, i, k)
 
-    def enable_codegen(self, name=None):
+    def enable_codegen(self, name=None, cache_dir=None, cache_size=100):
         """
         Enables use of generated C code for the collocator. Generates and
         compiles code for the NLP, gradient of f, Jacobian of g, and Hessian
@@ -5821,9 +5891,27 @@ class LocalDAECollocator(CasadiCollocator):
                 by the solver rather than generating new code. If any of the
                 files don't exist, new files are generated with the above
                 names.
+
+                If name is None, the compiled functions are stored in
+                cache_dir, identified by a hash of the generated code, and
+                are reused by all later collocators with the same structure.
                 Default: None
+
+            cache_dir --
+                The directory for cached compiled functions, used if name
+                is None. The directory must not be owned by or writable by
+                other users.
+                Default: None (the environment variable
+                JMODELICA_CODEGEN_CACHE if it is set, otherwise
+                jmodelica_codegen_cache_<user id> in the temporary
+                directory)
+
+            cache_size --
+                The maximum number of compiled functions kept in cache_dir.
+                The least recently used functions are removed first.
+                Default: 100
         """
-        enable_codegen(self, name)
+        enable_codegen(self, name, cache_dir, cache_size)
 
 
 def _add_help_fcns(filename):
@@ -5859,6 +5947,68 @@ def _add_help_fcns(filename):
                     if add_sign:
                         outfile.write('\nd sign(d x) { return x<0 ? -1 : x>0 ? 1 : x;}\n')
 
+def _codegen_flags():
+    """
+    Returns the compiler command, without input and output files, used to
+    compile generated code. Help function to enable_codegen.
+    """
+    bitness_flag = '-m32' if struct.calcsize('P') == 4 else '-m64'
+    return ['gcc', bitness_flag, '-fPIC', '-shared', '-O3']
+
+def _generate_code(fcn, filename):
+    """
+    Generates C code for a Function object using its generateCode member
+    function. Help function to enable_codegen.
+
+    Parameters::
+
+        fcn --
+            The Function object for which to generate code.
+
+        filename --
+            The name of the .c file to generate, including file extension.
+    """
+    fcn.generateCode(filename)
+    _add_help_fcns(filename)
+
+def _compile_code(jobs):
+    """
+    Compiles generated C code into shared libraries. All files are compiled
+    concurrently, in one compiler process each. Each library is first
+    written to a temporary file which is then renamed, so that other
+    processes never load a partially written library. Help function to
+    enable_codegen.
+
+    Parameters::
+
+        jobs --
+            A list of tuples (c_file, lib_file) with the names of the C
+            files to compile and of the libraries to create.
+
+    Returns::
+
+        A list of booleans, one for each job, telling whether the
+        compilation succeeded.
+    """
+    flags = _codegen_flags()
+    processes = []
+    for (c_file, lib_file) in jobs:
+        tmp_file = '%s.%d.tmp' % (lib_file, os.getpid())
+        processes.append((subprocess.Popen(flags + [c_file, '-o', tmp_file]),
+                          tmp_file, lib_file))
+    success = []
+    for (process, tmp_file, lib_file) in processes:
+        if process.wait() == 0:
+            if os.name == 'nt' and path.isfile(lib_file):
+                os.remove(lib_file)
+            os.rename(tmp_file, lib_file)
+            success.append(True)
+        else:
+            if path.isfile(tmp_file):
+                os.remove(tmp_file)
+            success.append(False)
+    return success
+
 def _to_external_function(fcn, name, use_existing=False):
     """
     Generates C code for a Function object using its generateCode member
@@ -5880,22 +6030,199 @@ def _to_external_function(fcn, name, use_existing=False):
             as an ExternalFunction object.
             Default: False
     """
+    [fcn_e] = _to_external_functions([fcn], [name], use_existing)
+    return fcn_e
+
+def _to_external_functions(fcns, names, use_existing=False):
+    """
+    Generates C code for Function objects, compiles the generated code
+    concurrently and returns the compiled functions as ExternalFunction
+    objects. Help function to enable_codegen.
+
+    Parameters::
+
+        fcns --
+            A list of Function objects for which to generate code.
+
+        names --
+            A list with the file name to be used for the generated code of
+            each function, without file extension.
+
+        use_existing --
+            A boolean that if it is set, doesn't generate new code and
+            just returns name.so for each name as ExternalFunction objects.
+            Default: False
+
+    Returns::
+
+        A list with one ExternalFunction object for each function. If the
+        compilation of a function fails, the uncompiled function is used
+        instead.
+    """
     if os.name == 'nt':
         ext = '.dll'
     else:
         ext = '.so'
-    if not use_existing:
-        print 'Generating code for', name
-        fcn.generateCode(name + '.c')
-        _add_help_fcns(name + '.c')
-        bitness_flag = '-m32' if struct.calcsize('P') == 4 else '-m64'
-        exit_code = system('gcc ' + bitness_flag + ' -fPIC -shared -O3 ' + name + '.c -o ' + name + ext)
-        if exit_code != 0:
-            return fcn # fall back to uncompiled version
-    fcn_e = casadi.ExternalFunction('./' + name + ext)
-    return fcn_e
+    if use_existing:
+        success = len(fcns) * [True]
+    else:
+        for (fcn, name) in itertools.izip(fcns, names):
+            print 'Generating code for', name
+            _generate_code(fcn, name + '.c')
+        success = _compile_code([(name + '.c', name + ext) for name in names])
+    fcns_e = []
+    for (fcn, name, compiled) in itertools.izip(fcns, names, success):
+        if compiled:
+            fcns_e.append(casadi.ExternalFunction('./' + name + ext))
+        else:
+            fcns_e.append(fcn) # fall back to uncompiled version
+    return fcns_e
+
+def _default_codegen_cache_dir():
+    """
+    Returns the default directory for cached generated code, which is the
+    value of the environment variable JMODELICA_CODEGEN_CACHE if it is set
+    and otherwise the directory jmodelica_codegen_cache_<user> in the
+    temporary directory, where <user> is the user id, or the user name on
+    platforms without user ids.
+    """
+    cache_dir = os.environ.get('JMODELICA_CODEGEN_CACHE')
+    if cache_dir is None:
+        if hasattr(os, 'getuid'):
+            user = str(os.getuid())
+        else:
+            user = getpass.getuser()
+        cache_dir = path.join(tempfile.gettempdir(),
+                              'jmodelica_codegen_cache_' + user)
+    return cache_dir
+
+def _create_codegen_cache_dir(cache_dir):
+    """
+    Creates a code generation cache directory, accessible only by the
+    current user, if it doesn't exist. Since the libraries in the cache are
+    loaded into the process, an existing directory is refused if it is owned
+    by another user or is writable by other users. Help function to
+    enable_codegen.
+    """
+    if not path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir, 0700)
+        except OSError:
+            # Another process may have created it
+            if not path.isdir(cache_dir):
+                raise
+    if hasattr(os, 'getuid'):
+        st = os.stat(cache_dir)
+        if st.st_uid != os.getuid():
+            raise CasadiCollocatorException(
+                "The code generation cache directory %s is owned by "
+                "another user." % cache_dir)
+        if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise CasadiCollocatorException(
+                "The code generation cache directory %s is writable by "
+                "other users." % cache_dir)
+
+def _to_cached_external_functions(fcns, prefixes, cache_dir, cache_size):
+    """
+    Returns compiled versions of Function objects as ExternalFunction
+    objects, using libraries in a cache directory when possible. Help
+    function to enable_codegen.
+
+    The libraries are identified by a hash of the generated code, the
+    compiler command and the CasADi version, so a library is reused by any
+    later problem with the same structure, and is never reused for a
+    problem whose generated code differs. Libraries that are missing from
+    the cache are compiled concurrently. When the cache holds more than
+    cache_size libraries, the least recently used ones are removed.
+
+    Parameters::
+
+        fcns --
+            A list of Function objects to compile.
+
+        prefixes --
+            A list with a file name prefix for each function.
+
+        cache_dir --
+            The cache directory. It is created if it doesn't exist, see
+            _create_codegen_cache_dir.
+
+        cache_size --
+            The maximum number of libraries to keep in the cache.
+
+    Returns::
+
+        A list with one ExternalFunction object for each function. If the
+        compilation of a function fails, the uncompiled function is used
+        instead.
+    """
+    if os.name == 'nt':
+        ext = '.dll'
+    else:
+        ext = '.so'
+    cache_dir = path.abspath(cache_dir)
+    _create_codegen_cache_dir(cache_dir)
+    salt = ' '.join(_codegen_flags()) + getattr(casadi, '__version__', '')
+
+    lib_files = []
+    jobs = []
+    for (fcn, prefix) in itertools.izip(fcns, prefixes):
+        c_file = path.join(cache_dir, '%s_%d.c' % (prefix, os.getpid()))
+        _generate_code(fcn, c_file)
+        with open(c_file, 'r') as f:
+            digest = hashlib.sha1(salt + f.read()).hexdigest()
+        base = path.join(cache_dir, prefix + '_' + digest)
+        lib_files.append(base + ext)
+        if path.isfile(base + ext):
+            os.remove(c_file)
+            os.utime(base + ext, None) # Mark as recently used
+        else:
+            print 'Generating code for', prefix
+            if os.name == 'nt' and path.isfile(base + '.c'):
+                os.remove(base + '.c')
+            os.rename(c_file, base + '.c')
+            jobs.append((base + '.c', base + ext))
+    success = dict(itertools.izip([lib_file for (c_file, lib_file) in jobs],
+                                  _compile_code(jobs)))
+
+    fcns_e = []
+    for (fcn, lib_file) in itertools.izip(fcns, lib_files):
+        if success.get(lib_file, True):
+            fcns_e.append(casadi.ExternalFunction(lib_file))
+        else:
+            fcns_e.append(fcn) # fall back to uncompiled version
+    _evict_codegen_cache(cache_dir, cache_size, ext, keep=lib_files)
+    return fcns_e
+
+def _evict_codegen_cache(cache_dir, cache_size, ext, keep=[]):
+    """
+    Removes the least recently used libraries, and their C files, from a
+    code generation cache until it holds at most cache_size libraries.
+    Libraries in keep are never removed. Help function to enable_codegen.
+    """
+    libs = []
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(ext):
+            lib_file = path.join(cache_dir, file_name)
+            try:
+                libs.append((os.stat(lib_file).st_mtime, lib_file))
+            except OSError:
+                pass # Removed by another process
+    libs.sort()
+    n_remove = len(libs) - cache_size
+    for (mtime, lib_file) in libs:
+        if n_remove <= 0:
+            break
+        if lib_file in keep:
+            continue
+        for file_name in [lib_file, lib_file[:-len(ext)] + '.c']:
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass # Removed by another process or in use
+        n_remove -= 1
     
-def enable_codegen(coll, name=None):
+def enable_codegen(coll, name=None, cache_dir=None, cache_size=100):
     """
     Enables use of generated C code for a collocator. Generates and compiles
     code for the NLP, gradient of f, Jacobian of g, and Hessian of the
@@ -5915,7 +6242,24 @@ def enable_codegen(coll, name=None):
             by the solver rather than generating new code. If any of the
             files don't exist, new files are generated with the above
             names.
+
+            If name is None, the compiled functions are stored in
+            cache_dir, identified by a hash of the generated code, and are
+            reused by all later collocators with the same structure.
             Default: None
+
+        cache_dir --
+            The directory for cached compiled functions, used if name is
+            None.
+            The directory must not be owned by or writable by other users.
+            Default: None (the environment variable JMODELICA_CODEGEN_CACHE
+            if it is set, otherwise jmodelica_codegen_cache_<user id> in
+            the temporary directory)
+
+        cache_size --
+            The maximum number of compiled functions kept in cache_dir. The
+            least recently used functions are removed first.
+            Default: 100
     """
     if os.name == 'nt':
         ext = '.dll'
@@ -5933,21 +6277,18 @@ def enable_codegen(coll, name=None):
     hess_lag = old_solver.hessLag()
     hess_lag.init()
     
-    existing = False
-    if name == None:
-        enable_codegen.times += 1
-        name = str(enable_codegen.times)
+    fcns = [nlp, grad_f, jac_g, hess_lag]
+    prefixes = ['nlp', 'grad_f', 'jac_g', 'hess_lag']
+    if name is None:
+        if cache_dir is None:
+            cache_dir = _default_codegen_cache_dir()
+        [nlp, grad_f, jac_g, hess_lag] = _to_cached_external_functions(
+            fcns, prefixes, cache_dir, cache_size)
     else:
-        if (path.isfile('nlp_'+name+ext) and
-            path.isfile('grad_f_'+name+ext) and
-            path.isfile('jac_g_'+name+ext) and
-            path.isfile('hess_lag_'+name+ext)):
-            existing = True
-    
-    nlp = _to_external_function(nlp, 'nlp_' + name, existing)
-    grad_f = _to_external_function(grad_f, 'grad_f_' + name, existing)
-    jac_g = _to_external_function(jac_g, 'jac_g_' + name, existing)
-    hess_lag = _to_external_function(hess_lag, 'hess_lag_' + name, existing)
+        names = [prefix + '_' + name for prefix in prefixes]
+        existing = all(path.isfile(fname + ext) for fname in names)
+        [nlp, grad_f, jac_g, hess_lag] = _to_external_functions(
+            fcns, names, existing)
     
     solver_cg = casadi.NlpSolver('ipopt', nlp)
     
@@ -5976,8 +6317,6 @@ def enable_codegen(coll, name=None):
     solver_cg.setInput(p, 'p')
     
     coll.solver_object = solver_cg
-    
-enable_codegen.times = 0
 
 
 class MeasurementData(object):
@@ -6134,6 +6473,7 @@ class OptimizationSolver(object):
         self.init_traj_set = False
         self.nominal_traj_updated = False
         self.solver_options_changed = False
+        self.bounds_changed = False
         self.extra_update = 0
 
     def set(self, name, value):
@@ -6240,8 +6580,9 @@ class OptimizationSolver(object):
         """Solve the optimization problem with the current settings, and return the result."""
         t0 = time.clock()
         
-        if self.init_traj_set or self.nominal_traj_updated:
+        if self.init_traj_set or self.nominal_traj_updated or self.bounds_changed:
             self.collocator._compute_bounds_and_init() #Update the lower / upper bounds and init
+            self.bounds_changed = False
         
         self.collocator._recalculate_model_parameters()
 
@@ -6268,6 +6609,107 @@ class OptimizationSolver(object):
        
         return self.collocator.get_result_object(include_init=False)
 
+    def set_variable_bounds(self, name, min=None, max=None):
+        """
+        Change the bounds of a model variable for the next optimization.
+
+        The bounds of the NLP variables are recomputed, the NLP itself is
+        not recreated.
+
+        Parameters::
+
+            name --
+                Name of the variable.
+
+            min --
+                New lower bound. Not changed if None.
+                Default: None
+
+            max --
+                New upper bound. Not changed if None.
+                Default: None
+        """
+        var = self.collocator.op.getVariable(name)
+        if var is None:
+            raise CasadiCollocatorException("Unknown variable %s." % name)
+        if min is not None:
+            var.setAttribute('min', min)
+        if max is not None:
+            var.setAttribute('max', max)
+        self.bounds_changed = True
+
+    def set_path_constraint_bound(self, index, value):
+        """
+        Change the right hand side of a path constraint for the next
+        optimization.
+
+        The right hand side of the constraint must be a constant. The change
+        is applied to the bounds of the corresponding NLP constraints, the
+        NLP itself is not recreated.
+
+        Parameters::
+
+            index --
+                Index of the constraint in the list returned by
+                getPathConstraints of the OptimizationProblem.
+
+            value --
+                New value of the right hand side.
+        """
+        cnstr = self.collocator.op.getPathConstraints()[index]
+        rhs = cnstr.getRhs()
+        if not rhs.isConstant():
+            raise CasadiCollocatorException(
+                "The right hand side of path constraint %d is not constant."
+                % index)
+        offset = value - rhs.getValue()
+        if cnstr.getType() == cnstr.GEQ:
+            offset = -offset
+        self.collocator._path_bound_offsets[
+            self.collocator.path_orig_map[index]] = offset
+        self.bounds_changed = True
+
+    def fix_parameter(self, name, value=None):
+        """
+        Fix a free parameter for the next optimization.
+
+        The parameter remains an NLP variable but its lower and upper bounds
+        are both set to value. Only parameters that were free when the
+        solver was created can be fixed.
+
+        Parameters::
+
+            name --
+                Name of the parameter.
+
+            value --
+                Value to fix the parameter to. If None, the current value
+                of the parameter in the OptimizationProblem is used.
+                Default: None
+        """
+        if name not in self.collocator.name_map or \
+                self.collocator.name_map[name][1] != 'p_opt':
+            raise CasadiCollocatorException(
+                "%s was not a free parameter when the solver was created." %
+                name)
+        if value is None:
+            value = self.collocator.op.get(name)
+        self.collocator._fixed_p_opt[name] = value
+        self.bounds_changed = True
+
+    def release_parameter(self, name):
+        """
+        Release a parameter that has been fixed with fix_parameter, so that
+        it is free in the next optimization.
+
+        Parameters::
+
+            name --
+                Name of the parameter.
+        """
+        if self.collocator._fixed_p_opt.pop(name, None) is not None:
+            self.bounds_changed = True
+
     def set_warm_start(self, warm_start):
         """
         Set whether warm start is enabled for the optimization
@@ -6992,7 +7434,7 @@ class OptimizationSolver(object):
         print "---------------------------"
         self.print_jacobian_entries(self.find_nonfinite_jacobian_entries(point))
     
-    def enable_codegen(self, name):
+    def enable_codegen(self, name=None, cache_dir=None, cache_size=100):
         """
         Enables use of generated C code for the solver's collocator.
         Generates and compiles code for the NLP, gradient of f, Jacobian of g,
@@ -7009,6 +7451,24 @@ class OptimizationSolver(object):
                 by the solver rather than generating new code. If any of the
                 files don't exist, new files are generated with the above
                 names.
+
+                If name is None, the compiled functions are stored in
+                cache_dir, identified by a hash of the generated code, and
+                are reused by all later collocators with the same structure.
                 Default: None
-        """
-        self.collocator.enable_codegen(name)
+
+            cache_dir --
+                The directory for cached compiled functions, used if name
+                is None. The directory must not be owned by or writable by
+                other users.
+                Default: None (the environment variable
+                JMODELICA_CODEGEN_CACHE if it is set, otherwise
+                jmodelica_codegen_cache_<user id> in the temporary
+                directory)
+
+            cache_size --
+                The maximum number of compiled functions kept in cache_dir.
+                The least recently used functions are removed first.
+                Default: 100
+        """
+        self.collocator.enable_codegen(name, cache_dir, cache_size)
@@ -425,7 +425,8 @@ def nelme_modified(func,xstart,lb=None,ub=None,h=0.3,x_tol=1e-3,f_tol=1e-6,
 
 def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
           plot_conv=False,x_tol=1e-3,f_tol=1e-6,max_iters=500,max_fevals=5000,
-          disp=True,nbr_cores=None,debug=False):
+          disp=True,nbr_cores=None,debug=False,max_worker_fevals=100,
+          speculative=False):
     """
     Minimize a function of one or more variables using the 
     Nelder-Mead simplex method. Handles box bound constraints rather well 
@@ -438,6 +439,17 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
     In that case, this feature is quite useful. The feature is applied if the
     user provides the objective function (func) as a file name (of a file 
     containing the definition of the function) instead of a function.
+    The file is executed once in each of nbr_cores worker processes, which 
+    are then reused for the function evaluations and replaced by new 
+    processes after max_worker_fevals evaluations each.
+    
+    In speculative mode, the reflection, expansion and contraction points 
+    are evaluated concurrently in each iteration, the new vertices of a 
+    shrunk simplex are evaluated concurrently and the function values at 
+    the vertices are kept between iterations. An iteration then costs one 
+    function evaluation in wall-clock time if nbr_cores >= 4, while the 
+    default mode evaluates all vertices of the simplex again in each 
+    iteration.
     
     NB: If the function is provided this way and an FMU is loaded inside the
         function, then the FMU file name must be preceded by "../" when
@@ -540,6 +552,22 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
             separate process when using multiprocessing.
             Default: False
             
+        max_worker_fevals --
+            int
+            The number of function evaluations after which a worker 
+            process is replaced by a new one when using multiprocessing. 
+            Set to None to never replace the worker processes.
+            Default: 100
+            
+        speculative --
+            bool
+            Set to True to evaluate the reflection, expansion and 
+            contraction points, and the vertices of a shrunk simplex, 
+            concurrently on nbr_cores processes. If func is a callable it 
+            is evaluated with multiprocessing and must then be picklable, 
+            i.e., defined at the top level of a module.
+            Default: False
+            
     Returns::
     
         x_opt --
@@ -579,10 +607,43 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
             raise ValueError, 'xstart must be smaller than ub.'
     
     # Check that nbr of cores is provided if multithreading is to be used
+    pool = None
+    func_pool = None
+    evaluate = None
     if type(func).__name__ != 'function':
         if nbr_cores is None:
             raise ValueError, 'The number of processor cores used must be provided.'
+        pool = tf.FevalPool(func,nbr_cores,max_worker_fevals=max_worker_fevals,
+                            debug=debug)
+        evaluate = pool.feval
+    elif speculative:
+        if nbr_cores is None:
+            nbr_cores = multiprocessing.cpu_count()
+        if nbr_cores > 1:
+            func_pool = multiprocessing.Pool(nbr_cores)
+            evaluate = lambda points: N.array(func_pool.map(func,list(points)))
+        else:
+            evaluate = lambda points: N.array([func(x) for x in points])
     
+    # Stop the worker processes also if the optimization fails
+    try:
+        return _nelme(func,xstart,lb,ub,h,plot_con,plot_sim,plot_conv,x_tol,
+                      f_tol,max_iters,max_fevals,disp,nbr_cores,speculative,
+                      pool,evaluate,t0)
+    finally:
+        if pool is not None:
+            pool.close()
+        if func_pool is not None:
+            func_pool.terminate()
+            func_pool.join()
+
+def _nelme(func,xstart,lb,ub,h,plot_con,plot_sim,plot_conv,x_tol,f_tol,
+           max_iters,max_fevals,disp,nbr_cores,speculative,pool,evaluate,t0):
+    """
+    The Nelder-Mead simplex method, see nelme. The functions are evaluated 
+    with pool if func is a file name and with evaluate if speculative is 
+    True.
+    """
     # Convert xstart to float type array and flatten it so that 
     # len(xstart) can be used even if xstart is a scalar
     xstart = N.asfarray(xstart).flatten()   
@@ -635,7 +696,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
                 for j in range(l):
                     points.append(N.array([x_grid[i,j],y_grid[i,j]]))
             # Evaluate function in these points     
-            f_values = tf.feval(func,points,debug)
+            f_values = pool.feval(points)
             for i in range(l):
                 z[i] = f_values[i*l:(i+1)*l]
     
@@ -695,16 +756,28 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
     F_val = []
     Shiftfv = []
     Ssize = []
+    f_val = None
+    shrunk = False
     while k < max_iters and nbr_fevals < max_fevals:
         
         # Function values at the vertices of the current simplex
-        if type(func).__name__ == 'function':
+        if speculative:
+            # Only the vertices which have changed since the last iteration
+            # are evaluated
+            if f_val is None:
+                f_val = evaluate(X)
+                nbr_fevals += (n+1)
+            elif shrunk:
+                f_val[1:] = evaluate(X[1:])
+                nbr_fevals += n
+                shrunk = False
+        elif type(func).__name__ == 'function':
             f_val = N.zeros(n+1)
             for i in range(n+1):
                 f_val[i] = func(X[i])
                 nbr_fevals += 1
         else:
-            f_val = tf.feval(func,X,debug)
+            f_val = pool.feval(X)
             nbr_fevals += (n+1)
         
         # Order all vertices s.t f(x0) <= f(x1) <= ... <= f(xn)
@@ -792,7 +865,10 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
                 xc1[ind] = lb[ind] + 1e-6
         
         # Evaluate function in the four ponits      
-        if type(func).__name__ == 'function':
+        if speculative:
+            fr,fe,fc1,fc2 = evaluate(N.vstack([xr,xe,xc1,xc2]))
+            nbr_fevals += 4
+        elif type(func).__name__ == 'function':
             fr = func(xr)
             fe = func(xe)
             fc1 = func(xc1)
@@ -801,7 +877,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
         else:
             if nbr_cores >= 4:
                 x_values = N.vstack([xr,xe,xc1,xc2])
-                f_values = tf.feval(func,x_values,debug)
+                f_values = pool.feval(x_values)
                 fr = f_values[0]
                 fe = f_values[1]
                 fc1 = f_values[2]
@@ -809,43 +885,46 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
                 nbr_fevals += 4
             elif nbr_cores == 3:
                 x_values = N.vstack([xr,xe,xc1])
-                f_values = tf.feval(func,x_values,debug)
+                f_values = pool.feval(x_values)
                 fr = f_values[0]
                 fe = f_values[1]
                 fc1 = f_values[2]
                 nbr_fevals += 3
             elif nbr_cores == 2:
                 x_values = N.vstack([xr,xe])
-                f_values = tf.feval(func,x_values,debug)
+                f_values = pool.feval(x_values)
                 fr = f_values[0]
                 fe = f_values[1]
                 nbr_fevals += 2
             elif nbr_cores == 1:
                 # This is completely unnecessary but we must compute the
                 # function value in a separate process to avoid memory problems
-                fr = tf.feval(func,xr,debug)
+                fr = pool.feval(xr)
                 nbr_fevals += 1
         
         # Reflection
         if f_val[0] <= fr and fr < f_val[n-1]:
             X[n] = xr
+            f_val[n] = fr
             # Go to next iteration
             k += 1
             continue
         
         # Expansion 
         elif fr < f_val[0]:
-            if type(func).__name__ != 'function':
+            if type(func).__name__ != 'function' and not speculative:
                 if nbr_cores == 1:
-                    fe = tf.feval(func,xe,debug)
+                    fe = pool.feval(xe)
                     nbr_fevals += 1
             if fe < fr:
                 X[n] = xe
+                f_val[n] = fe
                 # Go to next iteration
                 k += 1
                 continue
             else:
                 X[n] = xr
+                f_val[n] = fr
                 # Go to next iteration
                 k += 1
                 continue
@@ -854,38 +933,45 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
         elif f_val[n-1] <= fr:
             # Outside contraction
             if fr < f_val[n]:
-                if type(func).__name__ != 'function':
+                if type(func).__name__ != 'function' and not speculative:
                     if nbr_cores == 1 or nbr_cores == 2:
-                        fc1 = tf.feval(func,xc1,debug)
+                        fc1 = pool.feval(xc1)
                         nbr_fevals += 1
                 if fc1 <= fr:
                     X[n] = xc1
+                    f_val[n] = fc1
                     # Go to next iteration
                     k += 1
                     continue
             # Inside contraction
             else:
-                if type(func).__name__ != 'function':
+                if type(func).__name__ != 'function' and not speculative:
                     if nbr_cores == 1 or nbr_cores == 2 or nbr_cores == 3:
-                        fc2 = tf.feval(func,xc2,debug)
+                        fc2 = pool.feval(xc2)
                         nbr_fevals += 1
                 if fc2 < f_val[n]:
                     X[n] = xc2
+                    f_val[n] = fc2
                     # Go to next iteration
                     k += 1
                     continue
             # Shrink simplex toward x0
             for i in range(1,n+1):
                 X[i] = X[0] + delta*(X[i]-X[0])
+            shrunk = True
             k += 1
             
     # Optimal point and objective function value        
     x_opt = X[0]
-    if type(func).__name__ == 'function':
-            f_opt = func(x_opt)
+    if speculative and f_val is not None:
+        # The function value at X[0] is already known, also after a shrink
+        f_opt = f_val[0]
+    elif type(func).__name__ == 'function':
+        f_opt = func(x_opt)
+        nbr_fevals += 1
     else:
-        f_opt = tf.feval(func,x_opt,debug)
-    nbr_fevals += 1
+        f_opt = pool.feval(x_opt)
+        nbr_fevals += 1
     
     # Number of iterations
     nbr_iters = k
@@ -1480,7 +1566,7 @@ def galileo(f,lb,ub,plot=False,x_tol=1e-6,f_tol=1e-6,max_iters=1000,
 
 def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
          x_tol=1e-6,f_tol=1e-6,max_iters=1000,max_fevals=10000,disp=True,
-         nbr_cores=None,debug=False):
+         nbr_cores=None,debug=False,speculative=False):
     """
     Minimize a function of one or more variables using a derivative-free 
     method which can be chosen from the following alternatives: 
@@ -1625,6 +1711,12 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
             separate process when using Nelder-Mead with multiprocessing.
             Default: False
     
+        speculative --
+            bool
+            Set to True to evaluate the trial points of each Nelder-Mead
+            iteration concurrently on nbr_cores processes, see nelme.
+            Default: False
+    
     Returns::
     
         x_opt --
@@ -1684,7 +1776,8 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
                                                                max_iters=max_iters,
                                                                max_fevals=max_fevals,
                                                                disp=disp,nbr_cores=nbr_cores,
-                                                               debug=debug)
+                                                               debug=debug,
+                                                               speculative=speculative)
     elif alg == 2:
         x_opt,f_opt,nbr_iters,nbr_fevals,solve_time = seqbar(func,xstart,lb=lb,ub=ub,
                                                                 plot=plot,x_tol=x_tol,
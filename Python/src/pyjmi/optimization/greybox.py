@@ -15,8 +15,15 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from pyjmi.optimization.casadi_collocation import ExternalData
+from pyjmi.optimization.casadi_collocation import LocalDAECollocationAlgResult
+from pyjmi.jmi_algorithm_drivers import LocalDAECollocationAlgOptions
+from pyjmi.common.io import ResultDymolaTextual, ResultDymolaBinary
 
+import os
 import time, types
+import logging
+import itertools
+import multiprocessing
 import numpy as np
 import casadi
 
@@ -46,6 +53,15 @@ except ImportError:
     VariableNotFoundError = (jmiVariableNotFoundError,
                              pymodelicaVariableNotFoundError)
 
+# The _PreparedRelease used by the worker processes of 
+# Identification.release_each. It is set before the workers are forked, so 
+# that each worker gets its own copy of the prepared optimization problem.
+_worker_release = None
+
+# Numbers the calls to Identification.release_each, for unique result file 
+# names
+_release_each_calls = itertools.count()
+
 
 class GreyBox(object):
 
@@ -116,6 +132,9 @@ class GreyBox(object):
         self.prefix = "GreyBox_"
         self.free_parameters = set()
         
+        # Identification objects for each frozenset of free parameters
+        self.identifications = {}
+        
         # if non-constant sample period for measurements
         if hs:
             diffTimePoints = np.diff(time)
@@ -306,6 +325,8 @@ class GreyBox(object):
         """
         Sets the parameters to be free in the optimization and solves the optimization problem.
         If the solver fails to converge the cost returned will be Inf.
+        The Identification object is also stored in the dict identifications, 
+        with the frozenset of free parameters as key.
         
         Parameters::
             free_parameters --
@@ -321,15 +342,10 @@ class GreyBox(object):
         print self.free_parameters
         res = self.op.optimize(options=self.options)
         
-        # optimize
-        returnStatus = res.solver.get_solver_statistics()[0]
-        if (returnStatus == 'Solve_Succeeded') or (returnStatus=='Solved_To_Acceptable_Level'):
-            cost = res.solver.get_solver_statistics()[2]
-        else:
-            cost = Inf
-        
         # return identification object
-        return Identification(self, frozenset(self.free_parameters), res, cost)
+        identification = Identification(self, frozenset(self.free_parameters), res, _get_cost(res))
+        self.identifications[identification.free_parameters] = identification
+        return identification
         
     def _set_free_parameters(self, parameters):
         """
@@ -361,12 +377,16 @@ class GreyBox(object):
         
     def set_initial_trajectory(self, result):
         """
-        Sets the initial guess to use for optimizations.
+        Sets the initial guess to use for optimizations. If the initial guess 
+        is changed, the dict identifications is cleared, since its 
+        Identification objects were computed with another initial guess.
         
         Parameters::
             res --
                 Result object to use as initial guess.     
         """    
+        if self.options.get('init_traj') is not result:
+            self.identifications.clear()
         self.options['init_traj'] = result
     
     def set_options(self, option, value):  
@@ -387,6 +407,7 @@ class GreyBox(object):
                 print('You are not allowed to change this option')
         else:
             self.options[option] = value
+            self.identifications.clear()
 
     def set_variable_attribute(self, name, attribute, value):
         """
@@ -402,6 +423,7 @@ class GreyBox(object):
         """ 
         var = self.op.getVariable(name)
         var.setAttribute(attribute,value)
+        self.identifications.clear()
         
     def extract_parameter_values(self, result, parameters):
         """
@@ -509,6 +531,100 @@ class Identification(object):
         
         return self.greybox.identify(param)
     
+    def release_each(self, candidates, nbr_workers=None):
+        """
+        Releases each of the candidates separately, as release does, and 
+        compares the results to this Identification object with compare.
+        
+        The optimization problem is prepared once, with the parameters of all 
+        candidates free. In each optimization the parameters of the other 
+        candidates are fixed with OptimizationSolver.fix_parameter, so the 
+        NLP is only created once. The optimizations are solved concurrently 
+        in worker processes, each using the result of this Identification 
+        object as initial guess. Optimizations with a set of free parameters 
+        that has already been identified by the GreyBox object with the same 
+        initial guess are not solved again, see GreyBox.identifications. 
+        
+        Parameters::
+            candidates --
+                A list with the parameters to release in each optimization. 
+                Each item is a parameter name or a set of parameter names.
+            nbr_workers --
+                The number of worker processes. If 1, or if the platform 
+                does not support forking processes, the optimizations are 
+                solved in the current process.
+                Default: None (the number of CPUs)
+                
+        Returns::
+            identifications --
+                A list of Identification objects, in the same order as 
+                candidates.
+            results --
+                The comparison of identifications to this Identification 
+                object, see compare.
+        """
+        global _worker_release
+        greybox = self.greybox
+        
+        # set initial guess, the cached identifications are cleared if it 
+        # is changed
+        greybox.set_initial_trajectory(self.result)
+        
+        keys = []
+        for parameters in candidates:
+            if isinstance(parameters, basestring):
+                parameters = [parameters]
+            keys.append(self.free_parameters.union(parameters))
+        unsolved = [key for (i, key) in enumerate(keys) 
+                    if key not in greybox.identifications and key not in keys[:i]]
+        
+        if nbr_workers is None:
+            nbr_workers = multiprocessing.cpu_count()
+        if nbr_workers > 1 and not hasattr(os, 'fork'):
+            logging.warning('Parallel identification requires fork, ' +
+                            'solving all optimizations in the current process.')
+            nbr_workers = 1
+        
+        if len(unsolved) > 0:
+            # Prepare the optimization with the parameters of all candidates 
+            # free
+            greybox._set_free_parameters(set().union(*unsolved))
+            release = _PreparedRelease(greybox, self.free_parameters, 
+                                       self.result)
+            
+            # The result files are unique for each process and call, so that 
+            # concurrent calls do not overwrite each others results
+            prefix = greybox.op.getIdentifier()
+            options = LocalDAECollocationAlgOptions(greybox.options)
+            if options['result_handling'] == "binary":
+                extension = 'mat'
+            else:
+                extension = 'txt'
+            call = _release_each_calls.next()
+            args = [(key, '%s_greybox_%d_%d_%d_result.%s' % 
+                     (prefix, os.getpid(), call, i, extension))
+                    for (i, key) in enumerate(unsolved)]
+            
+            if nbr_workers == 1 or len(unsolved) == 1:
+                for (key, result_file_name) in args:
+                    greybox.identifications[key] = release.identify(
+                        key, result_file_name)
+            else:
+                _worker_release = release
+                pool = multiprocessing.Pool(min(nbr_workers, len(unsolved)))
+                try:
+                    outputs = pool.map(_identify_worker, args)
+                finally:
+                    pool.terminate()
+                    pool.join()
+                    _worker_release = None
+                for output in outputs:
+                    identification = _create_identification(greybox, *output)
+                    greybox.identifications[identification.free_parameters] = identification
+        
+        identifications = [greybox.identifications[key] for key in keys]
+        return (identifications, self.compare(identifications))
+    
     def compare(self, idObj):
         """
         Calculates cost reduction and risk from this Identification object 
@@ -597,3 +713,93 @@ class Identification(object):
         """  
           
         return self.result
+
+
+def _get_cost(res):
+    """
+    Returns the cost of an optimization result, Inf if the solver failed to 
+    converge.
+    """
+    stats = res.get_solver_statistics()
+    if stats[0] in ('Solve_Succeeded', 'Solved_To_Acceptable_Level'):
+        return stats[2]
+    return np.inf
+
+class _PreparedRelease(object):
+    
+    """
+    The optimization problem of a GreyBox prepared for 
+    Identification.release_each, with the parameters of all candidates free. 
+    The released parameters that are not free in an optimization are fixed 
+    with OptimizationSolver.fix_parameter.
+    """
+    
+    def __init__(self, greybox, free_parameters, init_traj):
+        """
+        Prepares the optimization problem of greybox with its current free 
+        parameters.
+        
+        Parameters::
+            greybox --
+                The GreyBox object.
+            free_parameters --
+                The parameters that are free in all optimizations.
+            init_traj --
+                The result to use as initial guess in all optimizations.
+        """
+        self.greybox = greybox
+        self.released = greybox.free_parameters.difference(free_parameters)
+        self.init_traj = init_traj
+        self.solver = greybox.op.prepare_optimization(options=greybox.options)
+        
+    def identify(self, free_parameters, result_file_name):
+        """
+        Solves the optimization with the parameters in free_parameters free.
+        
+        Returns::
+            identification --
+                An Identification object with the results.
+        """
+        for name in self.released:
+            if name in free_parameters:
+                self.solver.release_parameter(name)
+            else:
+                self.solver.fix_parameter(name)
+        self.solver.set_init_traj(self.init_traj)
+        self.solver.collocator.result_file_name = result_file_name
+        res = self.solver.optimize()
+        return Identification(self.greybox, frozenset(free_parameters), res, 
+                              _get_cost(res))
+
+def _identify_worker(args):
+    """
+    Identifies with the free parameters in args with _worker_release, see 
+    Identification.release_each. Returns the data needed to create the 
+    Identification object in the parent process.
+    """
+    (free_parameters, result_file_name) = args
+    identification = _worker_release.identify(free_parameters, result_file_name)
+    res = identification.result
+    options = LocalDAECollocationAlgOptions(_worker_release.greybox.options)
+    if options['result_handling'] == "memory":
+        return (free_parameters, None, res.result_data, identification.cost,
+                res.get_solver_statistics(), res.times, res.h_opt)
+    return (free_parameters, result_file_name, None, identification.cost,
+            res.get_solver_statistics(), res.times, res.h_opt)
+
+def _create_identification(greybox, free_parameters, result_file_name, 
+                           result_data, cost, stats, times, h_opt):
+    """
+    Creates an Identification object from the output of _identify_worker. 
+    The result does not hold a reference to a solver.
+    """
+    options = LocalDAECollocationAlgOptions(greybox.options)
+    if result_data is None:
+        if options['result_handling'] == "binary":
+            result_data = ResultDymolaBinary(result_file_name)
+        else:
+            result_data = ResultDymolaTextual(result_file_name)
+    res = LocalDAECollocationAlgResult(greybox.op, result_file_name, None, 
+                                       result_data, options, times, h_opt)
+    res.solver_statistics = stats
+    return Identification(greybox, free_parameters, res, cost)
@@ -16,8 +16,10 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as N
 from collections import Iterable, OrderedDict
+import casadi
 from casadi import MX
 from pyjmi.optimization.casadi_collocation import ExternalData
+from pyjmi.jmi_algorithm_drivers import LocalDAECollocationAlg
 from pyjmi.common.algorithm_drivers import OptionBase
 import modelicacasadi_wrapper as mc
 
@@ -177,6 +179,9 @@ class MHE(object):
         self._opts["IPOPT_options"] = self.MHE_opts['IPOPT_options']
         ###Dirty flag indicating change of the parameters
         self._dirty = False
+        #The collocation algorithm that is kept between samples once the 
+        #horizon is full, if the persistent_collocator option is set
+        self._alg = None
             
          
     def _create_alias_dict(self, x_0_guess):
@@ -1060,20 +1065,135 @@ class MHE(object):
         self.op.set('finalTime',finalTime)
         #Number of elements
         n_e = (len(self._time_vector) - 1)
-        self._opts['n_e'] = n_e
-        self._opts['blocking_factors'] = [1] * (n_e)
-        t_interval = self._time_vector
-        y_interval = self.y
-        u_interval = self.u
-        external_data = self._create_external_data(t_interval, 
-                                                   y_interval, 
-                                                   u_interval)
-        self._opts['external_data'] = external_data
-        res = self.op.optimize(options = self._opts)
+        if self.MHE_opts['persistent_collocator'] and n_e == self.horizon:
+            res = self._solve_persistent(startTime)
+        else:
+            self._opts['n_e'] = n_e
+            self._opts['blocking_factors'] = [1] * (n_e)
+            t_interval = self._time_vector
+            y_interval = self.y
+            u_interval = self.u
+            external_data = self._create_external_data(t_interval, 
+                                                       y_interval, 
+                                                       u_interval)
+            self._opts['external_data'] = external_data
+            res = self.op.optimize(options = self._opts)
         x_est_dict = self._append_results(res)
         self.next_time_index += 1
         return x_est_dict
           
+    def _solve_persistent(self, startTime):
+        """
+        Solves the MHE problem for a full horizon using a collocator that 
+        is kept between samples. The collocator is created the first time 
+        the horizon is full. In the following samples only the external 
+        data and the parameters are updated, and the solver is warm started 
+        from the previous solution, shifted one sample.
+        
+        The collocator keeps the time points of the horizon it was created 
+        for. The data of later horizons is moved to these time points, so 
+        the time in the result is that of the first horizon. This requires 
+        that time does not appear explicitly in the model, see 
+        _check_time_invariance.
+        
+        Parameters::
+            startTime --
+                The start time of the horizon.
+                
+        Returns::
+            res --
+                A result object from the solved optimization problem.
+        """
+        if self._alg is None:
+            self._check_time_invariance()
+            opts = self._opts.copy()
+            opts['n_e'] = self.horizon
+            opts['blocking_factors'] = [1] * self.horizon
+            opts['external_data'] = \
+                self._create_external_data(self._time_vector, self.y, self.u)
+            opts['mutable_external_data'] = True
+            opts['result_handling'] = "memory"
+            self._alg = LocalDAECollocationAlg(self.op, opts)
+            self._collocator_t0 = startTime
+            self._shift_index = self._create_shift_index()
+        else:
+            collocator = self._alg.nlp
+            t = (N.array(self._time_vector) - startTime + 
+                 self._collocator_t0)
+            external_data = self._create_external_data(t, self.y, self.u)
+            for (name, data) in external_data.eliminated.iteritems():
+                collocator.set_external_variable_data(name, data)
+            collocator._recalculate_model_parameters()
+            
+            #Warm start from the shifted previous solution
+            collocator.xx_init = collocator.primal_opt[self._shift_index]
+            collocator.dual_opt['x'] = \
+                collocator.dual_opt['x'][self._shift_index]
+            if not collocator.warm_start:
+                collocator.warm_start = True
+                self._set_warm_start_options()
+                collocator.solver_object.init()
+                collocator._init_and_set_solver_inputs()
+        self._alg.solve()
+        return self._alg.get_result()
+    
+    def _check_time_invariance(self):
+        """
+        Checks that time does not appear explicitly in the DAE or in the 
+        objective, which is required by the persistent collocator since it 
+        solves all horizons at the time points of the first one.
+        """
+        time = self.op.getTimeVariable()
+        for expr in [self.op.getDaeResidual(), 
+                     self.op.getObjectiveIntegrand(), 
+                     self.op.getObjective()]:
+            if casadi.dependsOn(expr, [time]):
+                raise ValueError('Error: The option persistent_collocator '
+                                 'requires that time does not appear '
+                                 'explicitly in the model')
+    
+    def _create_shift_index(self):
+        """
+        Creates the index map that shifts the NLP variables of the 
+        persistent collocator one element, i.e. one sample, back in time. 
+        The variables of the last element are kept.
+        
+        Returns::
+            shift_index --
+                An integer array such that xx[shift_index] is the 
+                shifted NLP variable vector xx.
+        """
+        collocator = self._alg.nlp
+        var_indices = collocator.var_indices
+        n_cp = collocator.n_cp
+        shift_index = N.arange(collocator.n_xx)
+        for vk in ['x', 'dx', 'w', 'unelim_u']:
+            if vk not in var_indices:
+                continue
+            for i in xrange(1, collocator.n_e):
+                for (k, indices) in var_indices[vk][i].iteritems():
+                    if k in var_indices[vk][i + 1]:
+                        source = var_indices[vk][i + 1][k]
+                    else:
+                        #The start point of the first element
+                        source = var_indices[vk][i][n_cp]
+                    shift_index[N.array(indices, dtype=int)] = \
+                                                N.array(source, dtype=int)
+        return shift_index
+    
+    def _set_warm_start_options(self):
+        """
+        Sets the IPOPT warm start options of the persistent collocator, 
+        unless they have been set by the user in IPOPT_options.
+        """
+        if self._opts['solver'] != 'IPOPT':
+            return
+        solver_object = self._alg.nlp.solver_object
+        for (key, value) in [('warm_start_init_point', 'yes'), 
+                             ('mu_init', 1e-3)]:
+            if key not in self.MHE_opts['IPOPT_options']:
+                solver_object.setOption(key, value)
+    
     def _append_new_data(self, u, y):
         """
         Appends the input for the next sample to the arrays that 
@@ -1333,6 +1453,8 @@ class MHE(object):
                                                    '_MHE_Qinv')
         #Set the objective
         self._set_objectives()
+        #The NLP has to be recreated with the new objective
+        self._alg = None
         #Change the matrix in the EKF_object
         self.EKF_object.update_process_noise_covariance_matrix(
                                                        process_noise_cov)
@@ -1370,6 +1492,8 @@ class MHE(object):
                                                    '_MHE_Rinv')
         #Set the objective
         self._set_objectives()
+        #The NLP has to be recreated with the new objective
+        self._alg = None
         #Change the matrix in the EKF_object
         self.EKF_object.update_measurement_noise_covariance_matrix(
                                                             measurement_cov)
@@ -1516,13 +1640,25 @@ class MHEOptions(OptionBase):
             IPOPT options for solution of NLP. See IPOPT's 
             documentation for available options.
             Default: Empty dictionary.
+            
+        persistent_collocator --
+            If True, the NLP is created once, when the horizon is 
+            full, and is then kept between the samples. Only the 
+            measurements, the inputs and the arrival cost parameters 
+            are updated in each sample and the NLP solver is warm 
+            started from the previous estimate, shifted one sample. 
+            Time must not appear explicitly in the model, since 
+            all horizons are solved at the time points of the 
+            first one. If False, the NLP is created in each sample.
+            Default: False
     """
     def __init__(self, *args, **kw):
         _defaults = {'input_names':[],
                      'process_noise_cov':[],
                      'measurement_cov':[],
                      'P0_cov':[],
-                     'IPOPT_options':{}}
+                     'IPOPT_options':{},
+                     'persistent_collocator':False}
         super(MHEOptions, self).__init__(_defaults)
         self.update(*args, **kw)
 
@@ -38,6 +38,177 @@ except ImportError:
                              pymodelicaVariableNotFoundError)
 
 
+class SampleTimings(object):
+
+    """
+    Keeps the wall-clock time spent in each phase of MPC.sample for the 
+    latest samples in a fixed-size ring buffer, and provides percentiles, 
+    histograms and deadline miss counts.
+    """
+
+    phases = ['parameters', 'shift', 'warm_start', 'solve', 'result',
+              'export']
+
+    def __init__(self, size=1000, deadline=None):
+        """
+        Parameters::
+
+            size --
+                The number of samples kept in the buffer.
+                Default: 1000
+
+            deadline --
+                The time in seconds that the total time of a sample should 
+                not exceed. If None, deadline misses are not counted.
+                Default: None
+        """
+        self.size = size
+        self.deadline = deadline
+        self.deadline_misses = 0
+        self.nbr_samples = 0
+        # One row per sample, one column per phase and a last column with
+        # the total time
+        self._data = N.zeros((size, len(self.phases) + 1))
+        self._sample_nbrs = N.zeros(size, dtype=int)
+        self._start_times = N.zeros(size)
+        self._index = dict([(p, i) for (i, p) in enumerate(self.phases)])
+
+    def start(self, sample_nbr):
+        """
+        Start timing a sample.
+        """
+        self._row = self.nbr_samples % self.size
+        self._data[self._row] = 0.
+        self._sample_nbrs[self._row] = sample_nbr
+        self._last = self._start_times[self._row] = time.time()
+        self._paused = 0.
+
+    def pause(self):
+        """
+        Pause timing the current sample. The time until resume is called is 
+        not counted in any phase or in the total time.
+        """
+        self._pause_time = time.time()
+
+    def resume(self):
+        """
+        Resume timing the current sample after pause.
+        """
+        paused = time.time() - self._pause_time
+        self._paused += paused
+        self._last += paused
+
+    def stamp(self, phase):
+        """
+        Add the time elapsed since the last stamp to a phase.
+        """
+        t = time.time()
+        self._data[self._row, self._index[phase]] += t - self._last
+        self._last = t
+
+    def stop(self):
+        """
+        Stop timing the current sample and count a deadline miss if the 
+        total time exceeded the deadline.
+        """
+        total = time.time() - self._start_times[self._row] - self._paused
+        self._data[self._row, -1] = total
+        self.nbr_samples += 1
+        if self.deadline is not None and total > self.deadline:
+            self.deadline_misses += 1
+
+    def _order(self):
+        """
+        The buffer rows in chronological order.
+        """
+        if self.nbr_samples <= self.size:
+            return N.arange(self.nbr_samples)
+        return N.roll(N.arange(self.size), -(self.nbr_samples % self.size))
+
+    def get_timings(self):
+        """
+        Get the timings of the samples in the buffer.
+
+        Returns::
+
+            A dictionary mapping 'sample', 'start', each phase and 'total' 
+            to arrays with one value per sample, in chronological order.
+        """
+        order = self._order()
+        timings = {'sample': self._sample_nbrs[order],
+                   'start': self._start_times[order],
+                   'total': self._data[order, -1]}
+        for phase in self.phases:
+            timings[phase] = self._data[order, self._index[phase]]
+        return timings
+
+    def percentiles(self, q=[50, 90, 99, 100]):
+        """
+        Get percentiles of the time spent in each phase, over the samples 
+        in the buffer.
+
+        Parameters::
+
+            q --
+                The percentiles to compute.
+                Default: [50, 90, 99, 100]
+
+        Returns::
+
+            A dictionary mapping each phase and 'total' to an array with 
+            the percentiles.
+        """
+        timings = self.get_timings()
+        if self.nbr_samples == 0:
+            return dict([(p, N.zeros(len(q))) for p in self.phases + ['total']])
+        return dict([(p, N.percentile(timings[p], q))
+                     for p in self.phases + ['total']])
+
+    def histogram(self, phase='total', bins=10):
+        """
+        Get a histogram of the time spent in a phase, over the samples in 
+        the buffer.
+
+        Returns::
+
+            counts --
+                The number of samples in each bin.
+
+            edges --
+                The bin edges in seconds.
+        """
+        return N.histogram(self.get_timings()[phase], bins=bins)
+
+    def summary(self):
+        """
+        Get a summary of the timings.
+
+        Returns::
+
+            A dictionary with the keys 'nbr_samples', 'deadline', 
+            'deadline_misses' and 'percentiles', where the percentiles are 
+            given as for the method percentiles.
+        """
+        return {'nbr_samples': self.nbr_samples,
+                'deadline': self.deadline,
+                'deadline_misses': self.deadline_misses,
+                'percentiles': self.percentiles()}
+
+    def export(self, file_name):
+        """
+        Write the timings of the samples in the buffer to a comma separated 
+        file, with one row per sample.
+        """
+        timings = self.get_timings()
+        columns = ['sample', 'start'] + self.phases + ['total']
+        data = N.column_stack([timings[c] for c in columns])
+        f = open(file_name, 'w')
+        try:
+            f.write(','.join(columns) + '\n')
+            N.savetxt(f, data, fmt='%.17g', delimiter=',')
+        finally:
+            f.close()
+
 class MPC(object):
 
     """
@@ -48,7 +219,7 @@ class MPC(object):
     def __init__(self, op, options, sample_period, horizon, 
                  initial_guess='shift', create_comp_result=True,
                  constr_viol_costs={}, warm_start_options={},
-                 noise_seed=None):
+                 noise_seed=None, timing_buffer_size=1000):
         """
         Creates the NLP that corresponds to the op we want to solve with MPC.
 
@@ -101,6 +272,13 @@ class MPC(object):
                 The seed to use for adding noise when using the method
                 extract_states().
                 Default: None
+                
+            timing_buffer_size --
+                The number of samples for which the time spent in each 
+                phase of sample() is kept, see the attribute timings and 
+                get_solver_stats. A sample that takes longer than the 
+                sample period is counted as a deadline miss.
+                Default: 1000
         """
         self._create_clock()
         self.op = op
@@ -117,6 +295,7 @@ class MPC(object):
 
         self.sample_period = sample_period
         self.horizon = horizon
+        self.timings = SampleTimings(timing_buffer_size, sample_period)
         self.constr_viol_costs = constr_viol_costs
         self.initial_guess = initial_guess
         self.create_comp_result = create_comp_result
@@ -145,6 +324,8 @@ class MPC(object):
         self._mpc_result_file_name = op.getIdentifier()+'_mpc_result.txt'
         self.result_file_name = op.getIdentifier()
         self._init_traj_set_by_user = False
+        self._prepared = False
+        self._prepare_time = 0.
 
         self.startTime= self.op.get('startTime')
         if noise_seed:
@@ -385,6 +566,7 @@ class MPC(object):
         self.collocator = self.alg.nlp
         self.p_fixed = None
         self._get_states_and_initial_condition_parameters()
+        self._create_shift_indices()
         self.collocator.solver_object.init()
 
     def _set_blocking_options(self):
@@ -604,22 +786,13 @@ class MPC(object):
                     measurements[name_init] = measurements[name_init][0]
         return measurements
 
-    def _shift_xx(self):
+    def _create_shift_indices(self):
         """
-        Shifts the result from the previous optimation and gives it as initial 
-        guess for the next optimation.
+        Computes the index map used by _shift_xx to shift the NLP variable 
+        vector one sample. The map only depends on n_e, n_cp and the 
+        variable layout of the NLP, so it is computed once, by shifting the 
+        vector of NLP variable indices.
         """
-
-        xx_result = {}
-        # If last optimization was successful, shift the result.
-        # Otherwise shift the last successful result.
-        if self.found_solution: 
-            xx_result = self.collocator.primal_opt
-        else:
-            xx_result = self.shifted_xx
-            
-        #~ xx_result = self.collocator.named_xx  #Used for debugging 
-
         # Map with splited order
         split_map = dict()
         split_map['x'] = 0
@@ -634,8 +807,9 @@ class MPC(object):
         n_e = self.options['n_e']
         n_cp = self.options['n_cp']
         n_e_s= self.n_e_s
-        # Create map for the shifted results
-        shifted_xx = xx_result[0:0]
+        xx_index = N.arange(self.collocator.n_xx)
+        # List of index ranges for the shifted results
+        shifted_index = []
 
         is_x = 1
 
@@ -647,12 +821,10 @@ class MPC(object):
 
             n_var = self.collocator.n_var[vk]
 
-            new_xx = xx_result[start+n_var*n_e_s*(n_cp+is_x):end]
-            new_xx_extrapolate = xx_result[end-n_var:end]
-            shifted_xx = N.concatenate((shifted_xx, new_xx))
-            
-            for i in range((n_cp+is_x)*n_e_s):
-                shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+            shifted_index.append(xx_index[start+n_var*n_e_s*(n_cp+is_x):end])
+            # Extrapolate with the last value
+            shifted_index.append(N.tile(xx_index[end-n_var:end],
+                                        (n_cp+is_x)*n_e_s))
             is_x = 0
 
         # Shift inputs without blocking factors
@@ -665,12 +837,10 @@ class MPC(object):
         start_cont_u=gsi[split_map['unelim_u']]
         end_cont_u = start_cont_u + n_cont_u*n_cp*n_e
 
-        new_xx = xx_result[start_cont_u+n_cont_u*n_cp*n_e_s:end_cont_u]
-        new_xx_extrapolate = xx_result[end_cont_u-n_cont_u:end_cont_u]
-        shifted_xx = N.concatenate((shifted_xx, new_xx))
-
-        for i in range(n_cp*n_e_s):
-            shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+        shifted_index.append(
+            xx_index[start_cont_u+n_cont_u*n_cp*n_e_s:end_cont_u])
+        shifted_index.append(N.tile(xx_index[end_cont_u-n_cont_u:end_cont_u],
+                                    n_cp*n_e_s))
 
         # Shift inputs with blocking factors 
         n_bf_u = self.collocator.n_var['unelim_u'] - n_cont_u
@@ -681,19 +851,15 @@ class MPC(object):
 
             end_bf_u = start_bf_u + len(factors)
 
-            new_xx = xx_result[start_bf_u+n_bf_u:end_bf_u]
-            new_xx_extrapolate = xx_result[end_bf_u-n_bf_u:end_bf_u]
-            
-            shifted_xx = N.concatenate((shifted_xx, new_xx))
-            shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+            shifted_index.append(xx_index[start_bf_u+n_bf_u:end_bf_u])
+            shifted_index.append(xx_index[end_bf_u-n_bf_u:end_bf_u])
             start_bf_u = end_bf_u
 
         # Shift initial controls (without blocking factors)
         start_init_u = gsi[split_map['unelim_u']] + (n_cp*n_e_s-1)*n_cont_u
         end_init_u = start_init_u + n_cont_u
 
-        new_xx = xx_result[start_init_u:end_init_u]
-        shifted_xx = N.concatenate((shifted_xx, new_xx))
+        shifted_index.append(xx_index[start_init_u:end_init_u])
 
         # Shift initial dx, w
         for vk in ['dx', 'w']:
@@ -702,19 +868,93 @@ class MPC(object):
             start=gsi[split_map[vk]] + (n_cp*n_e_s-1)*n_var
             end = start+n_var
 
-            new_xx = xx_result[start:end]
-            shifted_xx = N.concatenate((shifted_xx, new_xx))
+            shifted_index.append(xx_index[start:end])
 
         # Add p_opt
         start_p = gsi[split_map['p_opt']]
         end_p = gsi[split_map['p_opt']+1]
         
-        new_xx = xx_result[start_p:end_p]
-        shifted_xx = N.concatenate((shifted_xx, new_xx))
-        
+        shifted_index.append(xx_index[start_p:end_p])
+
+        self._shift_index = N.concatenate(shifted_index)
+
+        # Shift the multipliers of the constraints that are instantiated
+        # for each element. The constraints at the start time take the
+        # multipliers of the last collocation point of the first sample and
+        # the last element is extrapolated, as for the NLP variables. The
+        # multipliers of the remaining constraints are kept.
+        g_index = N.arange(self.collocator.n_c)
+        for eqtype in ['collocation', 'dae', 'continuity', 'path_eq',
+                       'path_ineq']:
+            (indices, elements, points) = \
+                self.collocator.get_nlp_constraint_indices(eqtype)
+            if len(elements) == 0:
+                continue
+            rows = {}
+            for (row, i, k) in zip(indices, elements, points):
+                rows[(int(i), int(k))] = row
+            last = int(elements.max())
+            for (row, i, k) in zip(indices, elements, points):
+                if i == 1 and k == 0:
+                    source = (n_e_s, n_cp)
+                else:
+                    source = (min(int(i)+n_e_s, last), int(k))
+                if source in rows:
+                    g_index[row] = rows[source]
+        self._dual_g_shift_index = g_index
+
+        # Two buffers each for the shifted primal vector and the shifted
+        # multipliers, used alternately, so that the previously shifted
+        # vectors can be shifted again without copying
+        n = len(self._shift_index)
+        self._shift_buffers = [N.empty(n), N.empty(n)]
+        self._dual_shift_buffers = [N.empty(n), N.empty(n)]
+        n_g = len(self._dual_g_shift_index)
+        self._dual_g_shift_buffers = [N.empty(n_g), N.empty(n_g)]
+
+    def _shift_xx(self):
+        """
+        Shifts the result from the previous optimation and gives it as initial 
+        guess for the next optimation. The bound multipliers, which are laid
+        out as the primal variables, are shifted in the same way for the
+        warm start, and the constraint multipliers are shifted by the
+        elements of the constraints.
+        """
+        # If last optimization was successful, shift the result.
+        # Otherwise shift the last successful result, which has already
+        # been shifted one or more times.
+        if self.found_solution:
+            xx_result = self.collocator.primal_opt
+            dual_x = self.collocator.dual_opt['x']
+            dual_g = self.collocator.dual_opt['g']
+        else:
+            xx_result = self.shifted_xx
+            dual_x = self.shifted_dual_x
+            dual_g = self.shifted_dual_g
+            
+        #~ xx_result = self.collocator.named_xx  #Used for debugging 
+
+        self._shift_buffers.reverse()
+        shifted_xx = self._shift_buffers[0]
+        N.take(xx_result, self._shift_index, out=shifted_xx)
+
         # Save the shifted result in the collocator and locally
         self.collocator.xx_init = shifted_xx
         self.shifted_xx = shifted_xx
+
+        # Shift the bound multipliers in the same way
+        self._dual_shift_buffers.reverse()
+        shifted_dual_x = self._dual_shift_buffers[0]
+        N.take(dual_x, self._shift_index, out=shifted_dual_x)
+        self.collocator.dual_opt['x'] = shifted_dual_x
+        self.shifted_dual_x = shifted_dual_x
+
+        # Shift the constraint multipliers
+        self._dual_g_shift_buffers.reverse()
+        shifted_dual_g = self._dual_g_shift_buffers[0]
+        N.take(dual_g, self._dual_g_shift_index, out=shifted_dual_g)
+        self.collocator.dual_opt['g'] = shifted_dual_g
+        self.shifted_dual_g = shifted_dual_g
         
     def _recalculate_parameters(self):
         """
@@ -745,11 +985,18 @@ class MPC(object):
                 If None the start time of the next optimization will be 
                 calculated as the start time of the last optimization + 
                 the sample period.
+                If the sample has been prepared with prepare_sample, the 
+                start time is already moved and start_time must be None.
                 Defaul: None
         """  
         # Update times and sample number
         self._t0 = time.clock()
-        self._sample_nbr+=1
+        if self._prepared:
+            if start_time is not None:
+                raise ValueError("The start time of a prepared sample " +
+                                 "must be given to prepare_sample.")
+        else:
+            self._advance_sample(start_time)
 
         # Check the type of sim_res and do accordingly
         if isinstance(x_k, dict):
@@ -767,6 +1014,12 @@ class MPC(object):
             else:
                 self.op.set(key, state_dict[key])
 
+    def _advance_sample(self, start_time):
+        """
+        Moves the optimization horizon to the next sample, see update_state.
+        """
+        self._sample_nbr+=1
+
         # Define new startTime
         if start_time == None:
             if self._sample_nbr > 1:
@@ -800,22 +1053,44 @@ class MPC(object):
                                             du_bounds[key.split\
                                             ('_du_bounds')[0]])
                 
-    def sample(self):
-        """
-        Updates parameter values, shifts the optimization horizon, 
-        redefines the initial guess of the primal variables (for all but the 
-        first sample) and solves the NLP. 
-        Warm start is initiated the second time sample is called.  
+    def prepare_sample(self, start_time=None):
         """
-        # Update parameter values
-        self._recalculate_parameters()
+        Prepares the next sample before the new values of the states are 
+        known. Moves the optimization horizon forward as update_state does, 
+        and shifts the time points, redefines the initial guess of the 
+        primal variables and initiates the warm start as sample does. 
         
+        The following calls to update_state and sample then only set the 
+        states and parameter values and solve the NLP, which shortens the 
+        time from when the states are known to when the optimal input is 
+        available.
+
+        Parameters::
+
+            start_time --
+                The start time of the next optimization, see update_state.
+                Default: None
+        """
+        t0 = time.clock()
+        self._advance_sample(start_time)
+        self.timings.start(self._sample_nbr)
+        self._prepare_nlp()
+        self.timings.pause()
+        self._prepared = True
+        self._prepare_time = time.clock() - t0
+
+    def _prepare_nlp(self):
+        """
+        Shifts the time points, redefines the initial guess of the primal 
+        variables and initiates the warm start, see sample.
+        """
+        timings = self.timings
+
         # Update timepoints
         if self.startTime != self.collocator.time[0]:
             coll_time = self.collocator.time+(self.startTime-self.collocator.time[0])
             self.collocator.time = coll_time
             
-            
         # Set the next initial guesses for primal variables
         if self._init_traj_set_by_user:
                 self._set_inittraj()
@@ -832,6 +1107,7 @@ class MPC(object):
                 else:
                     print("Warning: A new initial guess for the primal " +\
                           "variables have not been specified for this sample.") 
+        timings.stamp('shift')
        
         # Initiate the warm start 
         if self._sample_nbr == 2:            
@@ -839,11 +1115,38 @@ class MPC(object):
             self._set_warm_start_options()
             self.collocator.solver_object.init()
             self.collocator._init_and_set_solver_inputs()
-                    
+        timings.stamp('warm_start')
+
+    def sample(self):
+        """
+        Updates parameter values, shifts the optimization horizon, 
+        redefines the initial guess of the primal variables (for all but the 
+        first sample) and solves the NLP. 
+        Warm start is initiated the second time sample is called.  
+        
+        If the sample has been prepared with prepare_sample, only the 
+        parameter values are updated before the NLP is solved.
+        """
+        timings = self.timings
+        if self._prepared:
+            timings.resume()
+        else:
+            timings.start(self._sample_nbr)
+            self._prepare_time = 0.
+        
+        # Update parameter values
+        self._recalculate_parameters()
+        timings.stamp('parameters')
+        
+        if not self._prepared:
+            self._prepare_nlp()
+        self._prepared = False
 
         # Solve the NLP
         self.sol_time = self.collocator.solve_nlp()
-        self.update_time = time.clock() - self._t0 - self.sol_time
+        timings.stamp('solve')
+        self.update_time = time.clock() - self._t0 - self.sol_time + \
+                           self._prepare_time
         self.post_time = time.clock()
 
         # Check return status and if optimization was successful
@@ -856,12 +1159,14 @@ class MPC(object):
         if self.found_solution: 
             self.result = self.collocator.get_result()
             self.consec_fails = 0
+            timings.stamp('result')
             if self.initial_guess == 'trajectory':
-                self.collocator.export_result_dymola(self.result_file_name)
+                self.collocator.write_result()
                 self.collocator.times['init'] = self.update_time
                 self.collocator.times['sol'] = self.sol_time
                 self.collocator.times['post_processing']= time.clock()-self.post_time 
                 self._result_object = self.collocator.get_result_object()
+                timings.stamp('export')
         else:
             if self._sample_nbr == 1:
                 raise RuntimeError("The solver was unable to find a "+\
@@ -878,7 +1183,10 @@ class MPC(object):
 
         self._init_traj_set_by_user = False
         self._add_times()
-        return self._get_opt_input()
+        opt_input = self._get_opt_input()
+        timings.stamp('result')
+        timings.stop()
+        return opt_input
 
     def extract_states(self, sim_res, mean=0, st_dev=0.000):
         """
@@ -924,7 +1232,7 @@ class MPC(object):
         (a LocalDAECollocationAlgResult-object). 
         """
         if self.initial_guess != 'trajectory':
-             self.collocator.export_result_dymola(self.result_file_name)
+             self.collocator.write_result()
              self.collocator.times['init'] = self.update_time
              self.collocator.times['sol'] = self.sol_time
              self.collocator.times['post_processing']= time.clock()-self.post_time 
@@ -1047,9 +1355,18 @@ class MPC(object):
         for i, stat in enumerate(self.solver_stats): 
             print("%s: %s: %s iterations in %s seconds" %(i+1, stat[0], \
                                                 stat[1], stat[3]))
-    def get_solver_stats(self):
+    def get_solver_stats(self, timings=False):
         """ 
         Returns the return status and number of iterations for each for each 
         optimization.
+        
+        Parameters::
+        
+            timings --
+                If True, a summary of the time spent in each phase of 
+                sample(), see SampleTimings.summary, is also returned.
+                Default: False
         """
+        if timings:
+            return (self.solver_stats, self.tot_times, self.timings.summary())
         return (self.solver_stats, self.tot_times)
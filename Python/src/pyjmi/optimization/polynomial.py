@@ -151,6 +151,39 @@ class RadauPol(LocalPol):
         nbi = not beg_interp
         return lagrange_eval(self.p[nbi:], i - nbi, tau)
     
+    def eval_basis_matrix(self, tau, beg_interp):
+        """
+        Evaluate all Lagrange basis polynomials at several time points.
+        
+        Parameters::
+        
+            tau --
+                Normalized time points to evaluate the polynomials at.
+                
+                Type: rank 1 ndarray
+                
+            beg_interp --
+                Whether or not to include an interpolation point at tau = 0.
+                
+                Type: bool
+        
+        Returns::
+        
+            Matrix with one row per time point, whose column j contains
+            the values of basis polynomial j + (not beg_interp), so that
+            eval_basis_matrix(tau, beg_interp)[m, j] equals
+            eval_basis(j + (not beg_interp), tau[m], beg_interp).
+            
+            Type: rank 2 ndarray
+        """
+        nbi = not beg_interp
+        tau = N.asarray(tau, dtype=float).reshape(-1)
+        R = self.p[nbi:]
+        basis = N.empty([len(tau), len(R)])
+        for j in xrange(len(R)):
+            basis[:, j] = lagrange_eval(R, j, tau)
+        return basis
+    
     def eval_basis_der(self, i, tau):
         """
         Evaluate derivative of Lagrange basis polynomial. Assumes an
@@ -221,6 +254,7 @@ class GaussPol(LocalPol):
     
     # Inherit evaluation methods from RadauPol
     eval_basis = RadauPol.__dict__["eval_basis"]
+    eval_basis_matrix = RadauPol.__dict__["eval_basis_matrix"]
     eval_basis_der = RadauPol.__dict__["eval_basis_der"]
 
 class LobattoPol(LocalPol):
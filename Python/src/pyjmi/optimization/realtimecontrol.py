@@ -355,6 +355,8 @@ class RealTimeMPCBase(RealTimeBase):
         super(RealTimeMPCBase, self).__init__(dt, t_final, start_values,
                                               output_names, input_names,
                                               par_changes, noise)
+        self.prepare_times = []
+        self.fallback_samples = []
         horizon = int(t_hor/dt)
         n_e = horizon 
         
@@ -387,7 +389,7 @@ class RealTimeMPCBase(RealTimeBase):
         
         self.solver = MPC(op, opt_opts, dt, horizon, constr_viol_costs = constr_viol_costs)  
             
-    def enable_codegen(self, name=None):
+    def enable_codegen(self, name=None, cache_dir=None, cache_size=100):
         """
         Enables use of generated C code for the MPC solver.
         
@@ -403,9 +405,25 @@ class RealTimeMPCBase(RealTimeBase):
                 nlp_[name].so, grad_f_[name].so, jac_g_[name].so and
                 hess_lag_[name].so as ExternalFunction objects to be used
                 by the solver rather than generating new code.
+
+                If name is None, the compiled functions are stored in
+                cache_dir, identified by a hash of the generated code, and
+                are reused by all later collocators with the same structure.
                 Default: None
+
+            cache_dir --
+                The directory for cached compiled functions, used if name
+                is None.
+                Default: None (the environment variable
+                JMODELICA_CODEGEN_CACHE if it is set, otherwise
+                jmodelica_codegen_cache in the temporary directory)
+
+            cache_size --
+                The maximum number of compiled functions kept in cache_dir.
+                The least recently used functions are removed first.
+                Default: 100
         """
-        self.solver.collocator.enable_codegen(name)
+        self.solver.collocator.enable_codegen(name, cache_dir, cache_size)
             
     def enable_integral_action(self, mu, M, error_names=None, u_e=None):
         """
@@ -459,7 +477,7 @@ class RealTimeMPCBase(RealTimeBase):
             self.u_e = N.array(u_e)
         self.u_e_e = N.zeros(len(self.inputs))
         
-    def run(self, save=False):
+    def run(self, save=False, pipelined=False, deadline=None):
         """
         Run the real time MPC controller defined by the object.
         
@@ -471,12 +489,37 @@ class RealTimeMPCBase(RealTimeBase):
                 the save_results function.
                 Default: False
                 
+            pipelined --
+                If True, each sample is prepared, see MPC.prepare_sample,
+                right after the control signal of the previous sample has
+                been sent, while waiting for the measurements. Only setting
+                the states and solving the NLP is then left between the
+                measurements and the next control signal. The preparation
+                times are stored in the attribute prepare_times.
+                Default: False
+                
+            deadline --
+                The longest time in seconds that the NLP solver may run in
+                each sample after the first, set as the IPOPT option
+                max_cpu_time. If the solver is stopped, or does not find a
+                solution for another reason, the input of the last
+                successful sample, shifted to the current sample, is used.
+                The samples where this is done are stored in the attribute
+                fallback_samples.
+                Default: None (no deadline)
+                
         Returns::
         
             The results and statistics from the run.
         """
         if self._already_run:
             raise RuntimeError('run can only be called once')
+        if deadline is not None:
+            if self.solver.options['solver'] != 'IPOPT':
+                raise ValueError('A deadline can only be used with IPOPT')
+            # The warm start options are set from the second sample
+            self.solver.warm_start_options = dict(
+                self.solver.warm_start_options, max_cpu_time=deadline)
             
         self.e_e = []
         
@@ -491,12 +534,13 @@ class RealTimeMPCBase(RealTimeBase):
         time3 = 0
         
         for k in range(self.n_steps):
-            new_pars = self.par_changes.get_new_pars(k*self.dt)
-            if new_pars != None:
-                self.solver.op.set(new_pars.keys(), new_pars.values())
+            if k == 0 or not pipelined:
+                self._prepare_sample(k, pipelined)
             
             self.solver.update_state(x_k)
             u_k = self.solver.sample()
+            if not self.solver.found_solution:
+                self.fallback_samples.append(k)
             u_k = self._apply_noise(u_k, std_dev = self.noise)
             if self._ia:
                 u_k_e = self._apply_error(u_k)
@@ -512,6 +556,8 @@ class RealTimeMPCBase(RealTimeBase):
                 self.send_control_signal(u_k)
             if k == 0:
                 next_time = time.time() + self.dt
+            if pipelined and k + 1 < self.n_steps:
+                self._prepare_sample(k + 1, pipelined)
             m_k = self.wait_and_get_measurements(next_time)
             next_time = time.time() + self.dt
             time3 = time.time()
@@ -538,6 +584,19 @@ class RealTimeMPCBase(RealTimeBase):
         
         return self.results, self.stats
     
+    def _prepare_sample(self, k, pipelined):
+        """
+        Apply the parameter changes for sample k and, if pipelined, prepare
+        the MPC solver for the sample.
+        """
+        new_pars = self.par_changes.get_new_pars(k*self.dt)
+        if new_pars != None:
+            self.solver.op.set(new_pars.keys(), new_pars.values())
+        if pipelined:
+            start_prepare_time = time.time()
+            self.solver.prepare_sample()
+            self.prepare_times.append(time.time() - start_prepare_time)
+    
     def _apply_noise(self, u_k, std_dev=0.0):
         if std_dev == 0:
             return u_k
@@ -638,6 +697,8 @@ class RealTimeMPCBase(RealTimeBase):
         result_dict['late_times'] = self.late_times
         result_dict['wait_times'] = self.wait_times
         result_dict['solve_times'] = self.solve_times
+        result_dict['prepare_times'] = self.prepare_times
+        result_dict['fallback_samples'] = self.fallback_samples
         save_to_file(result_dict, filename)
 
 
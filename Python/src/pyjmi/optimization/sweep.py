@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2015 Modelon AB, all rights reserved.
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Module for solving an optimization problem for many sets of parameter values.
+"""
+import os
+import time
+import logging
+import multiprocessing
+import numpy as N
+
+from pyjmi.common.io import ResultDymolaTextual, ResultDymolaBinary
+from pyjmi.optimization.casadi_collocation import LocalDAECollocationAlgResult
+
+# The solver used by the worker processes. It is set in the parent before the
+# workers are forked, so that each worker gets its own copy of the prepared
+# NLP without having to recreate it.
+_sweep_solver = None
+_sweep_xx_init = None
+
+class ParameterSweep(object):
+
+    """
+    Solves an optimization problem for a number of parameter sets in
+    parallel, using one prepared collocator shared by all worker processes.
+    """
+
+    def __init__(self, op, options={}, nbr_workers=None, warm_start=True,
+                 result_file_prefix=None, codegen=False):
+        """
+        Prepares the optimization problem. The NLP is created once, here,
+        and is then reused for all parameter sets.
+
+        Parameters::
+
+            op --
+                The optimization problem to solve.
+
+            options --
+                The collocation options, see
+                op.optimize_options('LocalDAECollocationAlg').
+                Default: {}
+
+            nbr_workers --
+                The number of worker processes. If 1, or if the platform
+                does not support forking processes, all cases are solved in
+                the current process.
+                Default: None (the number of CPUs)
+
+            warm_start --
+                If True, each case is warm started from the solution of the
+                nearest, in parameter space, case solved so far.
+                Default: True
+
+            result_file_prefix --
+                Prefix of the result file names. The result of case i is
+                written to '<result_file_prefix>_sweep_<i>_result.txt', or
+                '.mat' if the result_handling option is "binary".
+                Default: None (the identifier of op)
+
+            codegen --
+                If True, the NLP functions are compiled to C code, see
+                OptimizationSolver.enable_codegen. The compiled functions
+                are cached, so later sweeps of problems with the same
+                structure reuse them.
+                Default: False
+        """
+        t0 = time.clock()
+        self.op = op
+        self.solver = op.prepare_optimization(options=options)
+        if codegen:
+            self.solver.enable_codegen()
+        self.options = self.solver.collocator.options
+        self.warm_start = warm_start
+        if nbr_workers is None:
+            nbr_workers = multiprocessing.cpu_count()
+        if nbr_workers > 1 and not hasattr(os, 'fork'):
+            logging.warning('Parallel parameter sweeps require fork, ' +
+                            'solving all cases in the current process.')
+            nbr_workers = 1
+        self.nbr_workers = nbr_workers
+        if result_file_prefix is None:
+            result_file_prefix = op.getIdentifier()
+        self.result_file_prefix = result_file_prefix
+        self.times = {'init': time.clock() - t0}
+
+    def run(self, parameter_sets):
+        """
+        Solve the optimization problem for each parameter set.
+
+        Parameters::
+
+            parameter_sets --
+                A list of dicts mapping parameter names to values. All sets
+                must contain the same parameter names.
+
+        Returns::
+
+            A list with one LocalDAECollocationAlgResult for each parameter
+            set, in the same order as parameter_sets. The solver statistics
+            of each case are available through get_solver_statistics.
+            The results do not hold a reference to a solver, so get_solver
+            and get_opt_input are not available.
+        """
+        global _sweep_solver, _sweep_xx_init
+        t0 = time.clock()
+        parameter_sets = list(parameter_sets)
+        n_cases = len(parameter_sets)
+        if n_cases == 0:
+            return []
+        names = sorted(parameter_sets[0].keys())
+        points = N.array([[float(p[name]) for name in names]
+                          for p in parameter_sets])
+        # Normalize the parameter space so that all parameters are weighted
+        # equally when looking for the nearest solved case
+        scale = N.ptp(points, axis=0)
+        scale[scale == 0] = 1.
+        points = points / scale
+
+        _sweep_solver = self.solver
+        _sweep_xx_init = N.array(self.solver.collocator.xx_init)
+
+        results = n_cases * [None]
+        solutions = {} # Case index -> (primal_opt, dual_opt)
+        unsolved = range(n_cases)
+
+        def next_case():
+            i = unsolved.pop(0)
+            warm_start = None
+            if self.warm_start and len(solutions) > 0:
+                solved = solutions.keys()
+                dist = N.sum((points[solved] - points[i])**2, axis=1)
+                warm_start = solutions[solved[N.argmin(dist)]]
+            result_file_name = '%s_sweep_%d_result.%s' % (
+                self.result_file_prefix, i,
+                'mat' if self.options['result_handling'] == "binary" else 'txt')
+            return (i, parameter_sets[i], warm_start, result_file_name)
+
+        def store(output):
+            (i, result_file_name, result_data, primal_opt, dual_opt, stats,
+             times, h_opt) = output
+            solutions[i] = (primal_opt, dual_opt)
+            results[i] = self._create_result(result_file_name, result_data,
+                                             primal_opt, dual_opt, stats,
+                                             times, h_opt)
+
+        if self.nbr_workers == 1:
+            while len(unsolved) > 0:
+                store(_solve_case(next_case()))
+        else:
+            pool = multiprocessing.Pool(self.nbr_workers)
+            try:
+                # Solve one case first so that all other cases can be warm
+                # started
+                if self.warm_start:
+                    store(pool.apply(_solve_case, (next_case(),)))
+                pending = []
+                while len(unsolved) > 0 or len(pending) > 0:
+                    while len(unsolved) > 0 and \
+                            len(pending) < self.nbr_workers:
+                        pending.append(pool.apply_async(_solve_case,
+                                                        (next_case(),)))
+                    pending[0].wait(0.01)
+                    for async_result in [r for r in pending if r.ready()]:
+                        pending.remove(async_result)
+                        store(async_result.get())
+            finally:
+                pool.terminate()
+                pool.join()
+        self.times['run'] = time.clock() - t0
+        return results
+
+    def _create_result(self, result_file_name, result_data, primal_opt,
+                       dual_opt, stats, times, h_opt):
+        """
+        Create a result object for a case solved by _solve_case.
+        """
+        if result_data is None:
+            if self.options['result_handling'] == "binary":
+                result_data = ResultDymolaBinary(result_file_name)
+            else:
+                result_data = ResultDymolaTextual(result_file_name)
+        res = LocalDAECollocationAlgResult(
+            self.op, result_file_name, None, result_data, self.options, times,
+            h_opt)
+        res.primal_opt = primal_opt
+        res.dual_opt = dual_opt
+        res.solver_statistics = stats
+        return res
+
+def _solve_case(args):
+    """
+    Solve one case of a parameter sweep with _sweep_solver.
+    """
+    (i, parameters, warm_start, result_file_name) = args
+    solver = _sweep_solver
+    collocator = solver.collocator
+    for (name, value) in parameters.iteritems():
+        solver.set(name, value)
+    if warm_start is None:
+        collocator.xx_init = _sweep_xx_init
+        solver.set_warm_start(False)
+    else:
+        (collocator.primal_opt, collocator.dual_opt) = warm_start
+        solver.set_warm_start(True)
+    collocator.result_file_name = result_file_name
+    res = solver.optimize()
+    if collocator.result_handling == "memory":
+        return (i, None, res.result_data, collocator.primal_opt,
+                collocator.dual_opt, res.get_solver_statistics(), res.times,
+                res.h_opt)
+    return (i, collocator.result_file_name, None, collocator.primal_opt,
+            collocator.dual_opt, res.get_solver_statistics(), res.times,
+            res.h_opt)
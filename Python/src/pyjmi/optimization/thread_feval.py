@@ -17,6 +17,8 @@
 import threading
 import os
 import sys
+import traceback
+import multiprocessing
 import numpy as N
 
 class FevalThread(threading.Thread):
@@ -111,3 +113,223 @@ def feval(func_file_name,x,debug):
 			fval[i] = eval(f_string)
 	
 	return fval
+
+def _feval_worker(conn, func_file_name, dir_name, debug):
+    """
+    Main loop of a FevalPool worker process. The file containing the
+    function definition is executed once, after which points are received
+    through conn and the function values are sent back until None is
+    received.
+    """
+    if debug:
+        sys.stdout = open('out_file_' + dir_name + '.txt', 'w')
+        sys.stderr = open('err_file_' + dir_name + '.txt', 'w')
+    try:
+        namespace = {'__name__': '__main__',
+                     '__file__': os.path.abspath(func_file_name)}
+        execfile(func_file_name, namespace)
+        # The function has the same name as the file
+        func_name = func_file_name.split('/')[-1].split('\\')[-1]
+        if func_name.endswith('.py'):
+            func_name = func_name[:-3]
+        f = namespace[func_name]
+        # Evaluate in a sub-directory, as is done by func_eval.py
+        try:
+            os.mkdir(dir_name)
+        except OSError:
+            pass
+        os.chdir(dir_name)
+    except:
+        conn.send((False, traceback.format_exc()))
+        conn.close()
+        return
+    conn.send((True, None))
+    while True:
+        x = conn.recv()
+        if x is None:
+            break
+        try:
+            conn.send((True, f(x)))
+        except:
+            conn.send((False, traceback.format_exc()))
+    conn.close()
+
+class FevalPool(object):
+    """
+    A pool of persistent worker processes evaluating a function defined in
+    a file. Each worker executes the file once and then evaluates the
+    function in many points, instead of starting a new Python interpreter
+    for each function evaluation. To guard against memory leaks in the
+    function, for example when an FMU is loaded in each evaluation, a
+    worker is replaced by a new process after a given number of
+    evaluations.
+    """
+
+    def __init__(self, func_file_name, nbr_workers, max_worker_fevals=100,
+                 debug=False):
+        """
+        Create the pool. The worker processes are started when they are
+        first needed.
+
+        Parameters::
+
+            func_file_name --
+                string
+                The name of a python file containing the function
+                definition. The function in the file must have the same
+                name as the file itself (without ".py").
+
+            nbr_workers --
+                int
+                The number of worker processes.
+
+            max_worker_fevals --
+                int
+                The number of function evaluations after which a worker
+                process is replaced by a new one. Set to None to never
+                replace the workers.
+                Default: 100
+
+            debug --
+                bool
+                Set to True to get separate error and output files for each
+                worker process.
+                Default: False
+        """
+        if nbr_workers < 1:
+            raise ValueError, 'The number of worker processes must be positive.'
+        self.func_file_name = func_file_name
+        self.max_worker_fevals = max_worker_fevals
+        self.debug = debug
+        # One [process, connection, number of evaluations] per worker
+        self._workers = nbr_workers * [None]
+
+    def _start_worker(self, i):
+        dir_name = 'dir_' + str(i + 1)
+        (conn, child_conn) = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=_feval_worker,
+                                       args=(child_conn, self.func_file_name,
+                                             dir_name, self.debug))
+        proc.daemon = True
+        proc.start()
+        child_conn.close()
+        self._workers[i] = [proc, conn, 0]
+        self._receive(i)
+
+    def _stop_worker(self, i):
+        (proc, conn, nbr_fevals) = self._workers[i]
+        self._workers[i] = None
+        try:
+            conn.send(None)
+            conn.close()
+        except (IOError, OSError):
+            pass
+        proc.join(5)
+        if proc.is_alive():
+            proc.terminate()
+            proc.join()
+
+    def _send(self, i, x):
+        worker = self._workers[i]
+        if worker is not None and self.max_worker_fevals is not None and \
+                worker[2] >= self.max_worker_fevals:
+            self._stop_worker(i)
+            worker = None
+        if worker is None:
+            self._start_worker(i)
+            worker = self._workers[i]
+        try:
+            worker[1].send(N.array(x, dtype=float))
+        except (IOError, OSError):
+            self._stop_worker(i)
+            raise OSError, 'Something went wrong with the function ' + \
+                  'evaluation: the worker process terminated unexpectedly.'
+        worker[2] += 1
+
+    def _receive(self, i):
+        try:
+            (success, value) = self._workers[i][1].recv()
+        except (EOFError, IOError):
+            self._workers[i][0].join()
+            self._workers[i] = None
+            raise OSError, 'Something went wrong with the function ' + \
+                  'evaluation: the worker process terminated unexpectedly.'
+        if not success:
+            self._stop_worker(i)
+            raise OSError, 'Something went wrong with the function ' + \
+                  'evaluation:\n' + value
+        return value
+
+    def feval(self, x):
+        """
+        Evaluate the function in x. If x contains multiple points (rows)
+        then the points are distributed over the worker processes.
+
+        Parameters::
+
+            x --
+                ndarray (1 or 2 dimensions)
+                The point(s) in which to evaluate the function.
+
+        Returns::
+
+            fval --
+                float or ndarray (1 dimension)
+                The function value(s) in x.
+        """
+        if N.ndim(x) == 1:
+            return self._feval_batch([x])[0]
+        m = len(x)
+        nbr_workers = len(self._workers)
+        fval = N.zeros(m)
+        for start in xrange(0, m, nbr_workers):
+            stop = min(start + nbr_workers, m)
+            fval[start:stop] = self._feval_batch(x[start:stop])
+        return fval
+
+    def _feval_batch(self, x):
+        """
+        Evaluate the function in at most one point per worker process and
+        return the list of function values. If an evaluation fails, the
+        replies of all other workers are read before the error is raised,
+        so that no reply is left to be read by the next call.
+        """
+        pending = []
+        error = None
+        try:
+            for i in xrange(len(x)):
+                try:
+                    self._send(i, x[i])
+                except OSError, e:
+                    error = e
+                    break
+                pending.append(i)
+            fval = len(x) * [None]
+            while len(pending) > 0:
+                try:
+                    fval[pending[0]] = self._receive(pending[0])
+                except OSError, e:
+                    if error is None:
+                        error = e
+                del pending[0]
+        finally:
+            # Replace the workers whose replies were not read, for example
+            # if the evaluation was interrupted
+            for i in pending:
+                if self._workers[i] is not None:
+                    self._stop_worker(i)
+        if error is not None:
+            raise error
+        return fval
+
+    def close(self):
+        """
+        Stop all worker processes.
+        """
+        for i in xrange(len(self._workers)):
+            if self._workers[i] is not None:
+                self._stop_worker(i)
+
+    def __del__(self):
+        if hasattr(self, '_workers'):
+            self.close()
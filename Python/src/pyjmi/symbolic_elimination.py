@@ -22,7 +22,7 @@ import scipy
 import casadi
 import modelicacasadi_wrapper as ci
 import itertools
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from modelicacasadi_wrapper import Model
 from pyjmi.common.core import ModelBase
 from pyjmi.common.algorithm_drivers import OptionBase
@@ -228,9 +228,10 @@ def find_deps(expr, mx_vars, deps=None):
 
 class Component(object):
 
-    def __init__(self, vertices, causalization_options, edges):
+    def __init__(self, vertices, causalization_options, edges, incidence=None):
         # Define data structures
         self.options = causalization_options
+        self.incidence = incidence
         self.vertices = vertices
         self.n = len(vertices) # Block size
         self.variables = variables = []
@@ -315,6 +316,8 @@ class Component(object):
 
         Solvability in this method is considered to be equivalent to linear dependence of
         all unknowns.
+
+        edges is a dictionary mapping (equation, variable) to the corresponding Edge.
         """
         # Check if block is linear
         res_f = casadi.MXFunction(self.mx_vars, self.eq_expr)
@@ -326,14 +329,10 @@ class Component(object):
                 # Check if jac[i, j] depends on block unknowns
                 if casadi.dependsOn(res_f.jac(i, j), self.mx_vars):
                     is_linear = False
-                    found_edges = 0
-                    for edge in edges:
-                        if (casadi.isEqual(self.eq_expr[j], edge.eq.expression) and
-                            casadi.isEqual(self.mx_vars[i], edge.var.mx_var)):
-                            edge.linear = False
-                            found_edges += 1
-                    if found_edges != 1:
+                    edge = edges.get((self.equations[j], self.variables[i]))
+                    if edge is None:
                         dh()
+                    edge.linear = False
         if not self.options['solve_torn_linear_blocks'] and self.torn:
             return False
         return is_linear
@@ -441,8 +440,9 @@ class Component(object):
             i += 1
 
         # Create new bipartite graph for block
-        causal_edges = create_edges(causal_equations, causal_variables)
-        causal_graph = BipartiteGraph(causal_equations, causal_variables, causal_edges, EliminationOptions())
+        causal_edges = create_edges(causal_equations, causal_variables, self.incidence)
+        causal_graph = BipartiteGraph(causal_equations, causal_variables, causal_edges, EliminationOptions(),
+                                      self.incidence)
 
         # Compute components and verify scalarity
         causal_graph.maximum_match()
@@ -534,8 +534,9 @@ class Component(object):
             i += 1
 
         # Create new bipartite graph for block
-        causal_edges = create_edges(causal_equations, causal_variables)
-        causal_graph = BipartiteGraph(causal_equations, causal_variables, causal_edges, EliminationOptions())
+        causal_edges = create_edges(causal_equations, causal_variables, self.incidence)
+        causal_graph = BipartiteGraph(causal_equations, causal_variables, causal_edges, EliminationOptions(),
+                                      self.incidence)
 
         # Compute components and verify scalarity
         try:
@@ -567,10 +568,11 @@ class Component(object):
 
 class BipartiteGraph(object):
 
-    def __init__(self, equations, variables, edges, causalization_options):
+    def __init__(self, equations, variables, edges, causalization_options, incidence=None):
         self.equations = equations
         self.variables = variables
         self.options = causalization_options
+        self.incidence = incidence
         self.n = len(equations)
         if self.n != len(variables):
             raise ValueError("Equation system is structurally singular.")
@@ -578,6 +580,9 @@ class BipartiteGraph(object):
         self.matches = None
         self.components = []
 
+        # Map from (equation, variable) to edge
+        self._edge_map = dict(((edge.eq, edge.var), edge) for edge in edges)
+
         # Create incidence matrix
         row = []
         col = []
@@ -775,7 +780,95 @@ class BipartiteGraph(object):
 
     def maximum_match(self):
         """
-        Computes a new perfect matching.
+        Computes a new perfect matching using Hopcroft-Karp.
+
+        The matching is stored in self.matches as a list of (equation, variable) tuples,
+        in the order of self.equations.
+
+        If the plots option is set, the layers of each phase are drawn, using the slower
+        implementation in _find_shortest_aug_paths.
+        """
+        if self.options['plots']:
+            self._maximum_match_layered()
+            return
+
+        # Adjacency lists of equations, using the positions in self.equations and self.variables
+        eq_pos = dict((eq, i) for (i, eq) in enumerate(self.equations))
+        var_pos = dict((vari, j) for (j, vari) in enumerate(self.variables))
+        adjacent = [[] for eq in self.equations]
+        for edge in self.edges:
+            adjacent[eq_pos[edge.eq]].append(var_pos[edge.var])
+        empty = [eq for (eq, adj) in itertools.izip(self.equations, adjacent) if len(adj) == 0]
+        if len(empty) > 0:
+            raise RuntimeError("The following equations contain no variables: %s" % empty)
+
+        n = self.n
+        eq_match = n * [-1] # Variable matched to each equation
+        var_match = n * [-1] # Equation matched to each variable
+        while True:
+            # Breadth first search from the unmatched equations, computing the layer of each
+            # equation in the alternating paths
+            layer = n * [-1]
+            queue = deque()
+            for i in xrange(n):
+                if eq_match[i] == -1:
+                    layer[i] = 0
+                    queue.append(i)
+            found = False
+            while queue:
+                i = queue.popleft()
+                for j in adjacent[i]:
+                    k = var_match[j]
+                    if k == -1:
+                        found = True
+                    elif layer[k] == -1:
+                        layer[k] = layer[i] + 1
+                        queue.append(k)
+            if not found:
+                break
+
+            # Depth first search along the layers from each unmatched equation, augmenting
+            # the matching along vertex-disjoint paths
+            next_edge = n * [0]
+            for root in xrange(n):
+                if eq_match[root] != -1:
+                    continue
+                eqs = [root]
+                varis = []
+                while eqs:
+                    i = eqs[-1]
+                    adj = adjacent[i]
+                    while next_edge[i] < len(adj):
+                        j = adj[next_edge[i]]
+                        next_edge[i] += 1
+                        k = var_match[j]
+                        if k == -1:
+                            # Augment
+                            varis.append(j)
+                            for (i, j) in itertools.izip(eqs, varis):
+                                eq_match[i] = j
+                                var_match[j] = i
+                            eqs = []
+                            break
+                        elif layer[k] == layer[i] + 1:
+                            varis.append(j)
+                            eqs.append(k)
+                            break
+                    else:
+                        # Dead end, remove from the layered graph
+                        layer[i] = -1
+                        eqs.pop()
+                        if varis:
+                            varis.pop()
+
+        if -1 in eq_match:
+            raise RuntimeError("Unable to find perfect matching")
+        self.matches = [(eq, self.variables[j]) for (eq, j) in itertools.izip(self.equations, eq_match)]
+
+    def _maximum_match_layered(self):
+        """
+        Computes a new perfect matching using _find_shortest_aug_paths, which draws the
+        layers of each phase.
         """
         self.matches = [] # Step 0
         i = 0
@@ -932,7 +1025,7 @@ class BipartiteGraph(object):
         """
         Inherits the applicable subset of the provided matchings.
         """
-        block_names = [var.name for var in self.variables]
+        block_names = set(var.name for var in self.variables)
         self.matches = [match for match in matching if match[1].name in block_names]
 
     def scc(self, global_index=0):
@@ -941,21 +1034,25 @@ class BipartiteGraph(object):
         """
         vertices = [DigraphVertex(i, eq, vari) for (i, (eq, vari)) in enumerate(self.matches)]
 
-        # Create edges (without self-loops)
+        # Create edges (without self-loops) and the successors of each vertex
+        matches = set(self.matches)
         dig_edgs = []
+        successors = [[] for v in vertices]
         for edge in self.edges:
-            if (edge.eq, edge.var) not in self.matches:
+            if (edge.eq, edge.var) not in matches:
             #~ if (edge.var, edge.eq) not in self.matches:
                 dig_edgs.append((edge.eq.dig_vertex, edge.var.dig_vertex))
+                successors[edge.eq.dig_vertex.index].append(edge.var.dig_vertex)
         self.dig_edgs = dig_edgs
 
         # Strong connect
         self.i = 0
         self.stack = []
         self.components = []
+        on_stack = len(vertices) * [False]
         for v in vertices:
             if v.number is None:
-                self._strong_connect(v)
+                self._strong_connect(v, successors, on_stack)
 
         # Create new equation and variable indices
         i = 0
@@ -967,36 +1064,89 @@ class BipartiteGraph(object):
                 vertex.variable.global_blt_index = global_index + i
                 i += 1
 
-    def _strong_connect(self, v):
+    def _strong_connect(self, v, successors, on_stack):
+        """
+        Finds the strongly connected components reachable from v.
+
+        The depth first search is done with an explicit stack of (vertex, successor iterator)
+        pairs, to not be limited by the recursion depth for large graphs.
         """
-        Finds a strong connection for v.
+        self._visit(v, on_stack)
+        work = [(v, iter(successors[v.index]))]
+        while work:
+            (v, it) = work[-1]
+            for w in it:
+                if w.number is None: # (v, w) is a tree arc
+                    self._visit(w, on_stack)
+                    work.append((w, iter(successors[w.index])))
+                    break
+                elif w.number < v.number: # (v, w) is a frond or cross-link
+                    if on_stack[w.index]:
+                        v.lowlink = min(v.lowlink, w.number)
+            else:
+                work.pop()
+                if v.lowlink == v.number: # v is the root of a component
+                    # Start new strongly connected component
+                    vertices = []
+                    while self.stack and self.stack[-1].number >= v.number:
+                        w = self.stack.pop()
+                        on_stack[w.index] = False
+                        vertices.append(w)
+                    self.components.append(Component(vertices, self.options, self._edge_map,
+                                                     self.incidence))
+                if work:
+                    u = work[-1][0]
+                    u.lowlink = min(u.lowlink, v.lowlink)
+
+    def _visit(self, v, on_stack):
+        """
+        Numbers v and pushes it on the stack.
         """
         self.i += 1
         v.number = self.i
         v.lowlink = self.i
         self.stack.append(v)
+        on_stack[v.index] = True
 
-        for (v1, w) in self.dig_edgs:
-            if v1 == v:
-                if w.number is None: # (v, w) is a tree arc
-                    self._strong_connect(w)
-                    v.lowlink = min(v.lowlink, w.lowlink)
-                elif w.number < v.number: # (v, w) is a frond or cross-link
-                    if w in self.stack:
-                        v.lowlink = min(v.lowlink, w.number)
-
-        if v.lowlink == v.number: # v is the root of a component
-            # Start new strongly connected component
-            vertices = []
-            while self.stack and self.stack[-1].number >= v.number:
-                vertices.append(self.stack.pop())
-            self.components.append(Component(vertices, self.options, self.edges))
+def incidence_matrix(expressions, mx_vars):
+    """
+    Computes the incidence of expressions on mx_vars from the sparsity pattern of the
+    Jacobian.
 
-def create_edges(equations, variables):
+    Returns a scipy.sparse.csr_matrix with one row per expression and one column per
+    variable.
+    """
+    n = len(mx_vars)
+    v = casadi.MX.sym("v", n)
+    [res] = casadi.substitute([casadi.vertcat(expressions)], mx_vars, casadi.vertsplit(v))
+    sparsity = casadi.jacobian(res, v).sparsity()
+    row = np.array(sparsity.row(), dtype=int)
+    colind = np.array(sparsity.colind(), dtype=int)
+    incidence = scipy.sparse.csc_matrix((np.ones(len(row)), row, colind), shape=(len(expressions), n))
+    return incidence.tocsr()
+
+def create_edges(equations, variables, incidence=None):
         """
         Create edges between Equations and Variables.
+
+        If incidence is given, it is a scipy.sparse.csr_matrix with the incidence of the
+        equations on the variables, indexed by their global indices, see
+        incidence_matrix. Otherwise the dependencies of each equation on each variable
+        are found symbolically.
         """
-        # This can probably be made more efficient by analyzing Jacobian sparsity of a SISO function with latest CasADi
+        if incidence is not None:
+            var_map = dict((var.global_index, (i, var)) for (i, var) in enumerate(variables))
+            edges = []
+            indptr = incidence.indptr
+            indices = incidence.indices
+            for equation in equations:
+                row = equation.global_index
+                # Keep the order of variables
+                eq_vars = sorted(var_map[col] for col in indices[indptr[row]:indptr[row+1]]
+                                 if col in var_map)
+                edges.extend(Edge(equation, var) for (i, var) in eq_vars)
+            return edges
+
         edges = []
         mx_vars = [var.mx_var for var in variables]
         for equation in equations:
@@ -1155,11 +1305,18 @@ class BLTModel(object):
             equations.append(Equation(named_eq.__str__(), i, i, tearing, named_res))
             i += 1
 
+        # Compute incidence of the equations on all variables. The first columns are the
+        # variables of the graph, in the order of their global indices
+        self._incidence_vars = (mx_var_struct['dx'] + mx_var_struct['w'] + mx_var_struct['x'] +
+                                mx_var_struct['u'] + mx_var_struct['p_opt'] + mx_var_struct['time'])
+        self._incidence = incidence_matrix([eq.expression for eq in equations], self._incidence_vars)
+        self._incidence_csc = self._incidence.tocsc()
+
         # Create edges
-        self._edges = create_edges(equations, variables)
+        self._edges = create_edges(equations, variables, self._incidence)
 
         # Create graph
-        self._graph = BipartiteGraph(equations, variables, self._edges, self.options)
+        self._graph = BipartiteGraph(equations, variables, self._edges, self.options, self._incidence)
         if self.options['plots']:
             self._graph.draw(11)
 
@@ -1499,14 +1656,16 @@ class BLTModel(object):
             return True
         var = co.variables[0]
 
-        # Find untorn dependencies, excluding block variable
-        deps = []
-        for i in xrange(co.n):
-            for vk in ['dx', 'x', 'u', 'w', 'p_opt']:
-                for dae_var in self._mx_var_struct[vk]:
-                    if casadi.dependsOn(co.eq_expr[i], [dae_var]) and dae_var.getName() != var.name:
-                        deps.append(dae_var)
-        deps = list(set(deps))
+        # Find untorn dependencies, excluding block variable and time (last column)
+        incidence = self._incidence
+        n_dae_vars = len(self._incidence_vars) - 1
+        dep_cols = set()
+        for eq in co.equations:
+            dep_cols.update(incidence.indices[incidence.indptr[eq.global_index]:
+                                              incidence.indptr[eq.global_index+1]])
+        dep_cols = [col for col in sorted(dep_cols)
+                    if col < n_dae_vars and self._incidence_vars[col].getName() != var.name]
+        deps = [self._incidence_vars[col] for col in dep_cols]
 
         # Find torn dependencies
         torn_dep_names = []
@@ -1514,28 +1673,34 @@ class BLTModel(object):
             torn_dep_names += self._dependencies[dep.getName()]
         torn_dep_names = list(set(torn_dep_names))
 
+        # Equations in which the block variable occurs
+        incidence_csc = self._incidence_csc
+        incidences = list(incidence_csc.indices[incidence_csc.indptr[var.global_index]:
+                                                incidence_csc.indptr[var.global_index+1]])
+
         # Compute density measure
         if self.options['dense_measure'] == 'Markowitz':
             # Count dependencies
             n_dependencies = len(torn_dep_names)
 
             # Count incidences
-            n_incidences = self._graph.incidences.getcol(var.global_index).getnnz()
+            n_incidences = len(incidences)
 
             # Compute measure
             measure = (n_dependencies - 1) * (n_incidences - 1)
         elif self.options['dense_measure'] == 'lmfi':
             # Compute measure
             measure = 0
-            incidences = list(self._graph.incidences.getcol(var.global_index).nonzero()[0])
             incidences.remove(co.equations[0].global_index) # Skip block equation
             if len(incidences) > 1:
                 # Find torn dependencies that cause fill-in
                 for inc in incidences:
+                    inc_cols = set(self._incidence.indices[self._incidence.indptr[inc]:
+                                                           self._incidence.indptr[inc+1]])
                     inc_torn_dep_names = []
-                    for dep in deps:
+                    for (col, dep) in itertools.izip(dep_cols, deps):
                         # If dependency causes fill-in
-                        if not casadi.dependsOn(self._graph.equations[inc].expression, [dep]):
+                        if col not in inc_cols:
                             inc_torn_dep_names += self._dependencies[dep.getName()]
                     n_dependencies = len(set(inc_torn_dep_names))
                     measure += n_dependencies - 1
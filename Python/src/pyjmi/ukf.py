@@ -18,9 +18,12 @@
 Unscented Kalman Filter module
 """
 
+import os
 import numpy as N
 import scipy as S
+import scipy.linalg
 import types 
+import multiprocessing
 from scipy.sparse import lil_matrix, linalg
 from pyfmi.common.algorithm_drivers import OptionBase, InvalidAlgorithmOptionException, UnrecognizedOptionError
 import collections
@@ -28,6 +31,12 @@ from pyfmi.fmi import FMUException
 from assimulo.solvers.sundials import CVodeError 
 import random
 
+# The observer model and simulation options used by the worker processes of a 
+# UKF. They are set before the workers are forked, so that each worker gets 
+# its own instance of the model.
+_worker_model = None
+_worker_sim_opts = None
+
 class UKF:
     """A class representing a Non-augmented Unscented Kalman Filter.
     
@@ -59,6 +68,7 @@ class UKF:
         x  -- Contains the current state estimates, sorted alphabetically ([ScaledVariable])
         mes -- Contains the measured variables ([ScaledVariable])
         P --  Estimated state covariance matrix (numpy.array)
+        S --  Lower triangular square root of P, only used by the square root UKF (numpy.array)
         P_v -- Assumed process noise covariance matrix (numpy.array)
         P_n -- Assumed measurement noise covariance matrix (numpy.array)
         Wm -- Weights for mean calculation (numpy.array)
@@ -67,6 +77,13 @@ class UKF:
         xp -- The a priori predicted state estimates (numpy.array)
         yp -- The a priori predicted measurements (numpy.array)
         fails -- Dict containing the number of failed sigma-point simulations at each time instance ({float:int})
+    
+    If the option nbr_workers is greater than 1, the sigma points are simulated 
+    concurrently in a pool of worker processes, each with its own copy of the 
+    observer model. The copies are made when the pool is created, at the first 
+    prediction, so changes made to the model after that, other than the 
+    initial values set by the UKF, are not seen by the workers. The pool is 
+    kept until close is called.
     """
     
     def __init__(self, model, x_0, measurements, h, options):
@@ -104,6 +121,7 @@ class UKF:
         for i,state in enumerate(self.x):
             P[i,i] = options['P_0'][state.get_name()]/state.get_nominal_value()**2
         self.P = P
+        self.S = None
         
         #Form the process noise covariance matrix with scaled covariances
         P_v = N.eye(len(options['P_v']))
@@ -128,9 +146,55 @@ class UKF:
         self.Wm = Wm
         self.Wc = Wc 
         
+        #Simulation options used for all sigma points, and the worker pool
+        self._sim_opts = self._create_simulate_options(model)
+        self._pool = None
+        
         #Make sure the model is properly reset
         self.model.reset()
         
+    def _create_simulate_options(self, model):
+        """Create the options used when simulating the sigma points.
+        
+            Arguments:
+            model -- Observer model (FMUModel)
+            
+            Returns:
+            opt -- Simulation options for the model
+            
+        """
+        opt = model.simulate_options()
+        opt['CVode_options']['atol'] = 1e-8
+        opt['CVode_options']['rtol'] = 1e-6
+        return opt
+    
+    def _get_pool(self):
+        """Returns the pool of worker processes used to simulate the sigma points, 
+        or None if the sigma points should be simulated in this process.
+        
+        """
+        global _worker_model, _worker_sim_opts
+        nbr_workers = self.options['nbr_workers']
+        if nbr_workers <= 1:
+            return None
+        if not hasattr(os, 'fork'):
+            print 'Parallel sigma point simulation requires fork, simulating in the current process'
+            return None
+        if self._pool is None:
+            _worker_model = self.model
+            _worker_sim_opts = self._sim_opts
+            self._pool = multiprocessing.Pool(nbr_workers)
+        return self._pool
+    
+    def close(self):
+        """Terminates the worker processes used to simulate the sigma points, if any.
+        
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        
     def _calc_weights(self, options):
         """Calculate weights for sigma points. 
         Needs to be done only when changing parameters of alpha, beta and kappa
@@ -159,8 +223,13 @@ class UKF:
         """
         
         #Update options attribute
+        nbr_workers = self.options['nbr_workers']
         self.options.update(*args, **kw)
         
+        #Recreate the worker pool with the new number of workers when needed
+        if self.options['nbr_workers'] != nbr_workers:
+            self.close()
+        
         #Update weights
         [Wm, Wc] = self._calc_weights(self.options)
         self.Wm = Wm
@@ -187,7 +256,7 @@ class UKF:
         
         return self.options.copy()
         
-    def _calc_sigma(self, x, P, P_v, P_n, options):
+    def _calc_sigma(self, x, P, P_v, P_n, options, S=None):
         """Calculates the sigma points for a state estimate vector.
             
             Arguments:
@@ -196,6 +265,8 @@ class UKF:
             P_v -- Scaled process noise covariance (numpy.array)
             P_n -- Scaled measurement noise covariance (numpy.array)
             options -- options containing weight parameters (UKFOptions)
+            S -- Lower triangular square root of P. If given, it is used instead of
+                the Cholesky decomposition of P (numpy.array)
             
             Returns:
             sigma -- the sigma matrix, whose columns corresponds to the sigma points.
@@ -205,30 +276,25 @@ class UKF:
         #State vector dimension
         L = len(options['P_0'])                                              
         
-        #Represent current state estimate as an array
-        x_a = []
-        for state in x:
-            x_a = x_a + [state.get_scaled_value()]
-        x_a = N.array(x_a)                                                                           
-        
-        #Calculate the cholesky decomposition of the covariance matrix
-        P = P * (options['alpha']**2) * (L + options['kappa'])
-        
-        try:
-            P_sqrt = S.linalg.cholesky(P, lower = True)
-        except N.linalg.LinAlgError:
-            print 'The covariance matrix was not positive definite:'
-            print 'P = '
-            print P
-            raise
+        #Represent current state estimate as a column vector
+        x_a = N.array([[state.get_scaled_value()] for state in x])
+        
+        #Calculate the cholesky decomposition of the scaled covariance matrix
+        scale = (options['alpha']**2) * (L + options['kappa'])
+        if S is None:
+            P = P * scale
+            try:
+                P_sqrt = scipy.linalg.cholesky(P, lower = True)
+            except N.linalg.LinAlgError:
+                print 'The covariance matrix was not positive definite:'
+                print 'P = '
+                print P
+                raise
+        else:
+            P_sqrt = S * N.sqrt(scale)
    
-        #Calculate sigma matrix
-        sigma = N.zeros((L, 2 * L + 1))
-        sigma[:,0] = x_a                      #First sigma point is the estimated augmented state vector
-        for i in range(1, L + 1):
-            sigma[:,i] = x_a + P_sqrt[:,(i-1)]
-        for i in range(L + 1, 2 * L + 1):
-            sigma[:,i] = x_a - P_sqrt[:,i - (L + 1)] 
+        #Calculate sigma matrix. The first sigma point is the estimated state vector
+        sigma = N.hstack((x_a, x_a + P_sqrt, x_a - P_sqrt))
         return sigma
         
     def update(self,y):
@@ -293,7 +359,13 @@ class UKF:
         """
     
         #Calculate sigma points
-        sigma = self._calc_sigma(self.x, self.P, self.P_v, self.P_n, self.options)  
+        if self.options['square_root']:
+            if self.S is None:
+                self.S = scipy.linalg.cholesky(self.P, lower = True)
+            sigma = self._calc_sigma(self.x, self.P, self.P_v, self.P_n, self.options, self.S)
+        else:
+            self.S = None
+            sigma = self._calc_sigma(self.x, self.P, self.P_v, self.P_n, self.options)  
  
         #Do a prediction of states and measurements, and calculate Kalman filter gain
         [xp, yp, K, P] = self._predict(sigma, self.model, self.x, u, known_values, self.P_v, self.P_n, self.currTime, self.h, self.mes, self.Wm, self.Wc)
@@ -329,6 +401,9 @@ class UKF:
             K -- The scaled Kalman filter gain (numpy.array)
             P -- The scaled estimated state covariance matrix (numpy.array)
             
+            With the option square_root, the square root of P is also stored in the 
+            attribute S.
+            
         """
         
         #Calculate sigma matrix and extract sigma points
@@ -339,92 +414,186 @@ class UKF:
         Y = N.zeros([L_meas, sigma.shape[1]])
         
         #Simulate each sigma point h seconds
-        for i in range(0, sigma.shape[1]):
-        
-            #If sigma point simulation fails, try perturbing initial value and start again. Maximum 10 times,
-            #then use the result of the last simulated sigma point.
-            retry = True
-            k = 1
-			
-            while retry:
-                retry = False
-                #Reset the observer model
-                model.reset()
+        args = [(x, measurements, sigma[:,i], sigma[:,0], u, known_values, currTime, h, i, sigma.shape[1])
+                for i in range(0, sigma.shape[1])]
+        pool = self._get_pool()
+        if pool is None:
+            results = [_simulate_sigma_point(model, self._sim_opts, *a) for a in args]
+        else:
+            results = pool.map(_simulate_sigma_point_worker, args)
+        
+        for i, (x_i, y_i, failed) in enumerate(results):
+            if failed:
+                self.fails[currTime] = self.fails.get(currTime, 0) + 1
             
-                #Set the initial states as the current sigma point
-                for j, state in enumerate(x):
-                    #If the sigma point has previously failed, try perturbing the state values
-                    if k > 1:
-                        dist = N.abs(sigma[j,0] - sigma[j,i])                #Distance in this coordinate to mean point
-                        sigma[j,i] = sigma[j,i] + random.gauss(0, k*1e-3*dist) #Perturb with 0.1% of distance as std. Increase times k after each iteration.
-                    model.set(state.get_name()+'_0', sigma[j,i]*state.get_nominal_value())
-                    
-                #Set known values
-                for known in known_values:
-                    model.set(known+'_0', known_values[known])
-                    
-                #Simulate and extract result
-                opt = model.simulate_options()
-                opt['CVode_options']['atol'] = 1e-8
-                opt['CVode_options']['rtol'] = 1e-6
-                print 'Simulating sigma-point '+str(i+1)+' out of '+str(sigma.shape[1])+' :'
-                try:
-                    result = model.simulate(start_time = currTime, final_time = currTime + h, options = opt, input = u)
-                except (CVodeError, ValueError, FMUException) as e:
-                    print e
-                    retry = True
-                    print 'Failed sigma point simulation'
-                    if k == 1:
-                        if currTime in self.fails.keys():
-                            self.fails[currTime] = self.fails[currTime] + 1
-                        else:
-                            self.fails[currTime] = 1
-                    if k == 10:
-                        print 'Simulation failed 10 times, will use result from last sigma point instead'
-                        break
-                k = k + 1
-			
-            #Assign result to matrix, and add process noise. Initialize anew so that all variables are updated
-            for k, state in enumerate(x):
-                Xxp[k,i] = result[state.get_name()][-1]/state.get_nominal_value()             
-     
-            #Assign measurements and add measurement noise
-            for k, meas in enumerate(measurements):
-                Y[k,i] = result[meas.get_name()][-1]/meas.get_nominal_value()
-        
-        #Compute predictions and covariances
-        xp = N.multiply(Wm, Xxp[:])                         #Multiply each point with corresponding weight
-        yp = N.multiply(Wm, Y[:])
-        xp = xp.sum(axis = 1)                               #Produce the weighted sum
-        yp = yp.sum(axis = 1) 
-        xp = N.reshape(xp, (-1,1))                          #Make them 2-D column vectors
-        yp = N.reshape(yp, (-1,1))
-        
-        Pxx = N.zeros((Xxp.shape[0],Xxp.shape[0]))          #State covariance
-        Pyy = N.zeros((Y.shape[0],Y.shape[0]))              #Measurement covariance
-        Pxy = N.zeros((Xxp.shape[0],Y.shape[0]))            #Cross-covariance
-        
-        for i in range(0,Xxp.shape[1]):
-            x_dev = N.reshape(Xxp[:,i],(-1,1)) - xp
-            y_dev = N.reshape(Y[:,i], (-1,1))- yp     
-            Pxx = Pxx + self.Wc[i] * N.outer(x_dev, x_dev)
-            Pyy = Pyy + self.Wc[i] * N.outer(y_dev, y_dev)
-            Pxy = Pxy + self.Wc[i] * N.outer(x_dev,y_dev)
-        
-        Pxx = Pxx + P_v
-        Pyy = Pyy + P_n
-     
-        #Calculate Kalman filter gain
-        if Pyy.shape[0] == 1 or Pyy.shape[1] == 1:
-            invPyy = 1 / Pyy    
+            #If all simulations of the sigma point failed, use the result of the last sigma point
+            if x_i is None:
+                if i == 0:
+                    raise FMUException('Simulation of the first sigma point failed 10 times')
+                Xxp[:,i] = Xxp[:,i-1]
+                Y[:,i] = Y[:,i-1]
+            else:
+                Xxp[:,i] = x_i
+                Y[:,i] = y_i
+        
+        #Compute predictions as the weighted sums of the sigma points
+        xp = N.reshape(Xxp.dot(Wm), (-1,1))
+        yp = N.reshape(Y.dot(Wm), (-1,1))
+        
+        #Deviations of the sigma points from the predictions
+        X_dev = Xxp - xp
+        Y_dev = Y - yp
+        
+        #Cross-covariance
+        X_dev_w = X_dev * Wc
+        Pxy = X_dev_w.dot(Y_dev.T)
+        
+        if self.options['square_root']:
+            #Square roots of the state and measurement covariances
+            S_x = _sqrt_covariance(X_dev, Wc, P_v)
+            S_y = _sqrt_covariance(Y_dev, Wc, P_n)
+            Pyy = S_y.dot(S_y.T)
+            
+            #Calculate Kalman filter gain, K = Pxy*inv(S_y*S_y')
+            K = scipy.linalg.cho_solve((S_y, True), Pxy.T).T
+            
+            #Calculate the square root of the state covariance, by downdating 
+            #with the columns of K*S_y
+            U = K.dot(S_y)
+            for j in range(U.shape[1]):
+                S_x = _cholupdate(S_x, U[:,j], -1.)
+            self.S = S_x
+            P = S_x.dot(S_x.T)
         else:
-            invPyy = N.linalg.solve(Pyy,N.eye(Pyy.shape[0]))
+            #State and measurement covariances
+            Pxx = X_dev_w.dot(X_dev.T) + P_v
+            Pyy = (Y_dev * Wc).dot(Y_dev.T) + P_n
+            
+            #Calculate Kalman filter gain, K = Pxy*inv(Pyy)
+            try:
+                K = scipy.linalg.cho_solve(scipy.linalg.cho_factor(Pyy), Pxy.T).T
+            except N.linalg.LinAlgError:
+                K = N.linalg.solve(Pyy, Pxy.T).T
+            
+            #Calculate state covariance
+            P = Pxx - K.dot(Pyy.dot(K.T))
+        return [xp, yp, K, P]
+
+def _sqrt_covariance(dev, Wc, noise_cov):
+    """Calculate the lower triangular square root of the covariance 
+    sum(Wc[i]*dev[:,i]*dev[:,i]') + noise_cov, without forming the covariance.
+    
+        Arguments:
+        dev -- Deviations of the sigma points from their weighted mean, one column 
+            per sigma point (numpy.array)
+        Wc -- Weights for covariance calculation (numpy.array)
+        noise_cov -- Additive noise covariance (numpy.array)
         
-        K = Pxy.dot(invPyy)
+        Returns:
+        S -- Lower triangular matrix such that S*S' is the covariance (numpy.array)
         
-        #Calculate state covariance
-        P = Pxx - K.dot(Pyy.dot(K.T))
-        return [xp, yp, K, P]
+    """
+    #All sigma points but the first have the same, positive, weight
+    A = N.hstack((N.sqrt(Wc[1]) * dev[:,1:], scipy.linalg.cholesky(noise_cov, lower = True)))
+    S = N.linalg.qr(A.T, mode = 'r').T
+    #Make the diagonal positive
+    S = S * N.where(N.diag(S) < 0, -1., 1.)
+    
+    #The first weight is negative for small alpha, in which case it is a downdate
+    if Wc[0] != 0:
+        S = _cholupdate(S, N.sqrt(N.abs(Wc[0])) * dev[:,0], N.sign(Wc[0]))
+    return S
+
+def _cholupdate(L, x, sign = 1.):
+    """Rank one update, or downdate, of a Cholesky factor.
+    
+        Arguments:
+        L -- Lower triangular matrix with positive diagonal (numpy.array)
+        x -- Update vector (numpy.array)
+        sign -- 1 for an update and -1 for a downdate (float)
+        
+        Returns:
+        L -- Lower triangular matrix such that L*L' is the original L*L' + sign*x*x' (numpy.array)
+        
+    """
+    L = N.array(L, dtype = float)
+    x = N.array(x, dtype = float)
+    for k in range(len(x)):
+        r2 = L[k,k]**2 + sign * x[k]**2
+        if r2 <= 0:
+            raise N.linalg.LinAlgError('The downdated covariance matrix is not positive definite')
+        r = N.sqrt(r2)
+        c = r / L[k,k]
+        s = x[k] / L[k,k]
+        L[k,k] = r
+        L[k+1:,k] = (L[k+1:,k] + sign * s * x[k+1:]) / c
+        x[k+1:] = c * x[k+1:] - s * L[k+1:,k]
+    return L
+
+def _simulate_sigma_point(model, opt, x, measurements, sigma_i, sigma_0, u, known_values, currTime, h, i, n):
+    """Simulate one sigma point h seconds. If the simulation fails, the initial 
+    values are perturbed and the simulation is started again, at most 10 times.
+    
+        Arguments:
+        model -- Observer model (FMUModel)
+        opt -- Simulation options for the model
+        x -- The current state estimates ([ScaledVariable])
+        measurements -- Contains the measured variables ([ScaledVariable])
+        sigma_i -- The scaled sigma point (numpy.array)
+        sigma_0 -- The scaled first sigma point, i.e. the state estimate (numpy.array)
+        u -- Input trajectory to the process model (([string], numpy.array))
+        known_values -- Known state values ({string:float})
+        currTime -- Current time instant (float)
+        h -- Sample interval in seconds (float)
+        i -- Index of the sigma point, used for printing (int)
+        n -- Number of sigma points, used for printing (int)
+        
+        Returns:
+        x_i -- The scaled states at currTime + h, or None if all simulations failed (numpy.array)
+        y_i -- The scaled measurements at currTime + h, or None if all simulations failed (numpy.array)
+        failed -- True if at least one simulation failed (bool)
+        
+    """
+    #The initial values of the states and the known values are set in one call
+    known_names = known_values.keys()
+    names = [state.get_name()+'_0' for state in x] + [name+'_0' for name in known_names]
+    value_refs = N.array([model.get_variable_valueref(name) for name in names], dtype=N.uint32)
+    nominals = N.array([state.get_nominal_value() for state in x])
+    known = N.array([known_values[name] for name in known_names], dtype=float)
+    sigma_i = N.array(sigma_i, dtype=float)
+    
+    failed = False
+    for k in range(1, 11):
+        #If the sigma point has previously failed, try perturbing the state values
+        if k > 1:
+            dist = N.abs(sigma_0 - sigma_i)                     #Distance in each coordinate to mean point
+            sigma_i = sigma_i + N.array([random.gauss(0, k*1e-3*d) for d in dist]) #Perturb with 0.1% of distance as std. Increase times k after each iteration.
+        
+        #Reset the observer model and set the initial states as the sigma point
+        model.reset()
+        model.set_real(value_refs, N.hstack((sigma_i*nominals, known)))
+        
+        print 'Simulating sigma-point '+str(i+1)+' out of '+str(n)+' :'
+        try:
+            result = model.simulate(start_time = currTime, final_time = currTime + h, options = opt, input = u)
+        except (CVodeError, ValueError, FMUException) as e:
+            print e
+            print 'Failed sigma point simulation'
+            failed = True
+            continue
+        
+        x_i = N.array([result[state.get_name()][-1] for state in x])/nominals
+        y_i = N.array([result[meas.get_name()][-1]/meas.get_nominal_value() for meas in measurements])
+        return (x_i, y_i, failed)
+    
+    print 'Simulation failed 10 times, will use result from last sigma point instead'
+    return (None, None, failed)
+
+def _simulate_sigma_point_worker(args):
+    """Simulate one sigma point in a worker process, see _simulate_sigma_point.
+    
+    """
+    return _simulate_sigma_point(_worker_model, _worker_sim_opts, *args)
         
 class UKFOptions(OptionBase):
     """Class containing covariance matrices and weight parameters for the UKF.
@@ -444,6 +613,11 @@ class UKFOptions(OptionBase):
             where beta = 2 is optimal for Gaussian distributions (float)
         kappa -- Secondary scaling parameter, used to ensure semi-positive definiteness
             of covariance matrix. Usually set to zero (float)
+        nbr_workers -- Number of worker processes used to simulate the sigma points. 
+            If 1, the sigma points are simulated one at a time in the current process (int)
+        square_root -- If True, the square root form of the UKF is used, where the 
+            Cholesky factor of the state covariance is propagated instead of the 
+            covariance itself (bool)
     """
     
     def __init__(self, *args, **kw):
@@ -451,7 +625,7 @@ class UKFOptions(OptionBase):
         """
       
         #Set default values, and then update to user input arguments
-        defaults = {'P_0': {} , 'P_v': {}, 'P_n': {}, 'alpha': 1e-3, 'beta': 2.0, 'kappa':0.0}
+        defaults = {'P_0': {} , 'P_v': {}, 'P_n': {}, 'alpha': 1e-3, 'beta': 2.0, 'kappa':0.0, 'nbr_workers': 1, 'square_root': False}
         super(UKFOptions, self).__init__(defaults)
         
         #Update options with user input
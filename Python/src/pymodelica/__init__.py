@@ -54,6 +54,9 @@ except IOError:
                   % _f)
 
 
+import sys
+import types
+
 import pymodelica
 
 import numpy as N
@@ -61,5 +64,34 @@ import numpy as N
 int = N.int32
 N.int = N.int32
 
-#Import the compile functions allowing for users to type: from pymodelica import compiler_*
-from compiler import compile_fmu, compile_fmux
+# The compile functions and the submodules in __all__ are loaded when they are
+# first accessed, see _LazyModule, so that importing pymodelica is cheap in
+# processes that do not compile models, such as worker processes.
+_compiler_names = ['compile_fmu', 'compile_fmux', 'compile_batch']
+_submodule_names = __all__ + ['compiler_exceptions', 'compiler_logging']
+
+class _LazyModule(types.ModuleType):
+    
+    """
+    Module type of pymodelica, which loads attributes on demand.
+    """
+    
+    def __getattr__(self, name):
+        if name in _compiler_names:
+            #Allows for users to type: from pymodelica import compile_*
+            from pymodelica import compiler
+            for n in _compiler_names:
+                setattr(self, n, getattr(compiler, n))
+        elif name in _submodule_names:
+            __import__(self.__name__ + '.' + name)
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
+
+# Replace this module by a _LazyModule with the same contents. The original
+# module is kept alive since its globals are cleared when it is deleted.
+_module = _LazyModule(__name__, __doc__)
+_module.__dict__.update(globals())
+_module._original_module = sys.modules[__name__]
+sys.modules[__name__] = _module
@@ -25,10 +25,18 @@ import os
 import sys
 import platform as plt
 import logging
+import shutil
+import tempfile
+import threading
+import traceback
+import multiprocessing
+import Queue
+import cPickle
 from subprocess import Popen, PIPE
 from compiler_logging import CompilerLogHandler
 from compiler_exceptions import JError
 from compiler_exceptions import IllegalCompilerArgumentError
+from compiler_exceptions import IllegalLogStringError
 
 import pymodelica as pym
 from pymodelica.common import xmlparser
@@ -37,7 +45,8 @@ from pymodelica.common.core import get_unit_name, list_to_string
 
 def compile_fmu(class_name, file_name=[], compiler='auto', target='me', version='2.0', 
                 platform='auto', compiler_options={}, compile_to='.', 
-                compiler_log_level='warning', separate_process=True, jvm_args=''):
+                compiler_log_level='warning', separate_process=True, jvm_args='',
+                log_listener=None):
     """ 
     Compile a Modelica model to an FMU.
     
@@ -127,7 +136,14 @@ def compile_fmu(class_name, file_name=[], compiler='auto', target='me', version=
             String of arguments to be passed to the JVM when compiling in a 
             separate process.
             Default: Empty string
-            
+
+        log_listener --
+            A pymodelica.compiler_logging.CompilerLogListener that is notified
+            of warnings, errors and compilation stages while the compilation
+            is running. It also sets the maximum number of problems that are
+            kept until the compilation has finished. Only used if
+            separate_process is True.
+            Default: None
             
     Returns::
     
@@ -143,11 +159,11 @@ def compile_fmu(class_name, file_name=[], compiler='auto', target='me', version=
         raise IllegalCompilerArgumentError("Unknown target '" + target + "'. Use 'me', 'cs' or 'me+cs' to compile an FMU.")
     return _compile_unit(class_name, file_name, compiler, target, version,
                 platform, compiler_options, compile_to, compiler_log_level,
-                separate_process, jvm_args)       
+                separate_process, jvm_args, log_listener)       
 
 def compile_fmux(class_name, file_name=[], compiler='auto', compiler_options={}, 
                  compile_to='.', compiler_log_level='warning', separate_process=True,
-                 jvm_args=''):
+                 jvm_args='', log_listener=None):
     """ 
     Compile a Modelica model to an FMUX.
     
@@ -208,6 +224,14 @@ def compile_fmux(class_name, file_name=[], compiler='auto', compiler_options={},
             String of arguments to be passed to the JVM when compiling in a 
             separate process.
             Default: Empty string
+
+        log_listener --
+            A pymodelica.compiler_logging.CompilerLogListener that is notified
+            of warnings, errors and compilation stages while the compilation
+            is running. It also sets the maximum number of problems that are
+            kept until the compilation has finished. Only used if
+            separate_process is True.
+            Default: None
             
     Returns::
     
@@ -217,11 +241,11 @@ def compile_fmux(class_name, file_name=[], compiler='auto', compiler_options={},
     """
     return _compile_unit(class_name, file_name, compiler, 'fmux', None, 'auto',
                 compiler_options, compile_to, compiler_log_level,
-                separate_process, jvm_args)
+                separate_process, jvm_args, log_listener)
 
 def _compile_unit(class_name, file_name, compiler, target, version,
                 platform, compiler_options, compile_to, compiler_log_level,
-                separate_process, jvm_args):
+                separate_process, jvm_args, log_listener=None):
     """
     Helper function for compile_fmu and compile_fmux.
     """
@@ -252,11 +276,12 @@ def _compile_unit(class_name, file_name, compiler, target, version,
 
     else:
         return compile_separate_process(class_name, file_name, compiler, target, version, platform, 
-                                        compiler_options, compile_to, compiler_log_level, jvm_args)
+                                        compiler_options, compile_to, compiler_log_level, jvm_args,
+                                        log_listener)
 
 def compile_separate_process(class_name, file_name=[], compiler='auto', target='me', version='1.0', 
                              platform='auto', compiler_options={}, compile_to='.', 
-                             compiler_log_level='warning', jvm_args=''):
+                             compiler_log_level='warning', jvm_args='', log_listener=None):
     """
     Compile model in separate process.
     Requires environment variable SEPARATE_PROCESS_JVM to be set, otherwise defaults
@@ -321,6 +346,13 @@ def compile_separate_process(class_name, file_name=[], compiler='auto', target='
             separate process.
             Default: Empty string
         
+        log_listener --
+            A pymodelica.compiler_logging.CompilerLogListener that is notified
+            of warnings, errors and compilation stages while the compilation
+            is running. It also sets the maximum number of problems that are
+            kept until the compilation has finished.
+            Default: None
+        
     Returns::
         A CompilerResult object with the name of the generated unit (or 'None' if no unit was generated) 
         and a list of warnings given by the compiler.
@@ -340,7 +372,9 @@ def compile_separate_process(class_name, file_name=[], compiler='auto', target='
     else: 
         cmd.append(pym._optimica_class)
     
-    cmd.append('-log=' + _gen_log_level(compiler_log_level))
+    # Compilation stages are given as info messages
+    xml_level = 'w' if log_listener is None else 'i'
+    cmd.append('-log=' + _gen_log_level(compiler_log_level, xml_level))
     
     if compiler_options:
         cmd.append('-opt=' + _gen_compiler_options(compiler_options))
@@ -363,13 +397,317 @@ def compile_separate_process(class_name, file_name=[], compiler='auto', target='
     cmd.append(class_name)
     
     process = Popen(cmd, stderr=PIPE)
-    log = CompilerLogHandler()
+    log = CompilerLogHandler(log_listener)
     log.start(process.stderr);
     try:
         process.wait();
     finally:
         return log.end();
 
+def compile_batch(jobs, compiler='auto', version='2.0', platform='auto',
+                  compile_to='.', compiler_log_level='warning', jvm_args='',
+                  nbr_workers=None):
+    """
+    Compile a batch of models concurrently.
+    
+    The jobs are compiled by at most nbr_workers worker processes. Each 
+    worker is a Python process with a JVM of its own that is started once 
+    and then used for all jobs given to the worker, so the JVM startup is 
+    paid once per worker instead of once per job. The XML log of each job 
+    is written to a file of its own, which is parsed by a CompilerLogHandler 
+    when the job has finished. Since no JVM is started in the current 
+    process, compile_batch can also be used after a JVM has been started, 
+    for example by compile_fmu with separate_process=False.
+    
+    The arguments are checked when compile_batch is called, the 
+    compilations are started when the first result is requested.
+    
+    Parameters::
+    
+        jobs --
+            A list of jobs. Each job is a tuple 
+            (class_name, file_name, compiler_options, target), see compile_fmu 
+            for a description of the elements. The last two elements may be 
+            omitted, in which case no compiler options and target 'me' are 
+            used.
+            
+        compiler -- 
+            The compiler used to compile the models. The different options are:
+              - 'auto': the compiler is selected automatically depending on 
+                 file ending
+              - 'modelica': the ModelicaCompiler is used
+              - 'optimica': the OptimicaCompiler is used
+            Default: 'auto'
+            
+        version --
+            The FMI version. Valid options are '1.0' and '2.0'.
+            Default: '2.0'
+            
+        platform --
+            Set platform, see compile_fmu.
+            Default: 'auto'
+            
+        compile_to --
+            Directory in which the units are created.
+            Default: Current directory.
+        
+        compiler_log_level --
+            Set the logging for the compiler, see compile_fmu. Writing the log 
+            to stderr is not allowed.
+            Default: 'warning'
+            
+        jvm_args --
+            String of arguments to be passed to the JVM of each worker.
+            Default: Empty string
+            
+        nbr_workers --
+            Number of worker processes, that is the maximum number of 
+            compilations that run at the same time.
+            Default: None (the number of CPUs)
+    
+    Returns::
+    
+        A generator yielding a tuple (job, result) for each job as it 
+        completes. result is a CompilerResult if the compilation succeeded, 
+        otherwise the JError or IOError that the compilation raised.
+    """
+    if platform == 'auto':
+        platform = _get_platform()
+    for p in platform.split(','):
+        if p not in ['win32', 'win64', 'darwin32', 'darwin64', 'linux32', 
+                     'linux64']:
+            raise IllegalCompilerArgumentError("Unknown platform: '%s'." % p)
+    _gen_log_level(compiler_log_level) # Check log string
+    if nbr_workers is None:
+        nbr_workers = multiprocessing.cpu_count()
+    if nbr_workers < 1:
+        raise ValueError("The number of worker processes must be positive.")
+    
+    jobs = list(jobs)
+    args = []
+    for (i, job) in enumerate(jobs):
+        class_name = job[0]
+        file_name = job[1]
+        compiler_options = dict(job[2]) if len(job) > 2 else {}
+        target = job[3] if len(job) > 3 else 'me'
+        if isinstance(file_name, basestring):
+            file_name = [file_name]
+        for key, value in compiler_options.iteritems():
+            if isinstance(value, list):
+                compiler_options[key] = list_to_string(value)
+        args.append((i, (class_name, file_name, compiler, target, version, 
+                         platform, compiler_options, compile_to, 
+                         compiler_log_level)))
+    
+    return _compile_batch(jobs, args, jvm_args, 
+                          min(nbr_workers, max(len(args), 1)))
+
+def _compile_batch(jobs, args, jvm_args, nbr_workers):
+    """
+    Helper function for compile_batch. A generator that distributes the jobs 
+    over the worker processes and yields the results as they complete.
+    """
+    job_queue = Queue.Queue()
+    for job_args in args:
+        job_queue.put(job_args)
+    result_queue = Queue.Queue()
+    log_dir = tempfile.mkdtemp(prefix='jmodelica_batch_')
+    
+    # The threads only send the jobs to the worker processes and wait for them
+    workers = [_CompileBatchWorker(jvm_args) for i in xrange(nbr_workers)]
+    threads = []
+    for worker in workers:
+        thread = threading.Thread(target=_compile_batch_thread, 
+                                  args=(worker, job_queue, result_queue, 
+                                        log_dir))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    
+    finished = False
+    try:
+        for n in xrange(len(args)):
+            (i, result) = result_queue.get()
+            yield (jobs[i], result)
+        finished = True
+    finally:
+        # Drop the jobs that have not been started and, if the results are 
+        # no longer wanted, stop the compilations that are running
+        try:
+            while True:
+                job_queue.get_nowait()
+        except Queue.Empty:
+            pass
+        if not finished:
+            for worker in workers:
+                worker.kill()
+        for thread in threads:
+            thread.join()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+def _compile_batch_thread(worker, job_queue, result_queue, log_dir):
+    """
+    Helper function for compile_batch. Gives jobs to one worker process until 
+    there are no jobs left and puts the results in result_queue.
+    """
+    try:
+        while True:
+            try:
+                (i, job_args) = job_queue.get_nowait()
+            except Queue.Empty:
+                break
+            log_file = os.path.join(log_dir, 'job_%d.xml' % i)
+            try:
+                result = worker.compile(job_args, log_file)
+            except Exception:
+                # Every job must get a result, otherwise compile_batch waits 
+                # for it forever
+                worker.kill()
+                worker.close()
+                result = JError(traceback.format_exc())
+            result_queue.put((i, result))
+    finally:
+        worker.close()
+
+class _CompileBatchWorker(object):
+    """
+    A worker process of compile_batch, see _compile_batch_worker. The process 
+    is started when the first job is given to it and is restarted if it 
+    terminates unexpectedly.
+    """
+    
+    def __init__(self, jvm_args):
+        self.jvm_args = jvm_args
+        self._process = None
+    
+    def _start(self):
+        path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = "import sys; sys.path.insert(0, %r); " \
+               "from pymodelica.compiler import _compile_batch_worker; " \
+               "_compile_batch_worker(%r)" % (path, self.jvm_args)
+        self._process = Popen([sys.executable, '-c', code], stdin=PIPE, 
+                              stdout=PIPE)
+    
+    def compile(self, job_args, log_file):
+        """
+        Compiles a job in the worker process and returns the CompilerResult, 
+        or the exception raised by the compilation.
+        """
+        if self._process is None:
+            self._start()
+        try:
+            cPickle.dump(job_args + (log_file,), self._process.stdin, 2)
+            self._process.stdin.flush()
+            reply = cPickle.load(self._process.stdout)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self.close()
+            return IOError("The compiler worker process terminated unexpectedly.")
+        if reply is not None:
+            # JError does not pass its arguments to Exception.__init__, so 
+            # the exceptions are sent as class, arguments and attributes
+            (cls, args, attributes) = reply
+            error = cls.__new__(cls, *args)
+            error.__dict__.update(attributes)
+            return error
+        
+        stream = open(log_file, 'rb')
+        log = CompilerLogHandler()
+        log.start(stream)
+        try:
+            return log.end()
+        except (JError, IOError), e:
+            return e
+        finally:
+            stream.close()
+            os.remove(log_file)
+    
+    def kill(self):
+        """
+        Kills the worker process, the job that is compiled gets an IOError as 
+        result.
+        """
+        process = self._process
+        if process is not None:
+            try:
+                process.kill()
+            except OSError:
+                pass
+    
+    def close(self):
+        """
+        Stops the worker process.
+        """
+        process = self._process
+        self._process = None
+        if process is not None:
+            try:
+                process.stdin.close()
+            except IOError:
+                pass
+            process.wait()
+
+def _compile_batch_worker(jvm_args):
+    """
+    Main loop of a compile_batch worker process. Reads pickled jobs from 
+    stdin and compiles them in a JVM that is started for the first job. For 
+    each job None or the class, arguments and attributes of the exception 
+    raised by the compilation are pickled to stdout, and the log of the 
+    compilation is written to the log file given in the job. Anything printed 
+    by the compiler is written to stderr.
+    """
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
+        msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    
+    pym.environ['JVM_ARGS'] = ' '.join(pym.environ['JVM_ARGS'].split() + 
+                                       jvm_args.split())
+    while True:
+        try:
+            job = cPickle.load(sys.stdin)
+        except EOFError:
+            break
+        error = _compile_batch_worker_job(*job)
+        if error is None:
+            reply = cPickle.dumps(None, 2)
+        else:
+            try:
+                reply = cPickle.dumps((error.__class__, error.args, 
+                                       error.__dict__), 2)
+            except Exception:
+                reply = cPickle.dumps((JError, (), {'message': str(error)}), 2)
+        replies.write(reply)
+        replies.flush()
+    replies.close()
+
+def _compile_batch_worker_job(class_name, file_name, compiler, target, 
+                              version, platform, compiler_options, compile_to, 
+                              compiler_log_level, log_file):
+    """
+    Helper function for _compile_batch_worker. Compiles one job in the 
+    current process and returns None, or the exception raised by the 
+    compilation.
+    """
+    try:
+        comp = _get_compiler(files=file_name, selected_compiler=compiler)
+        comp.set_options(compiler_options)
+        comp.set_compiler_logger(_gen_log_level(compiler_log_level, 
+                                                xml_file=log_file))
+        comp.set_target_platforms(platform.split(','))
+        try:
+            comp.compile_Unit(class_name, file_name, target, version, 
+                              compile_to)
+        except:
+            comp._compiler.closeLogger()
+            raise
+    except (JError, IOError), e:
+        return e
+    except Exception:
+        return JError(traceback.format_exc())
+    return None
+
 def _gen_compiler_options(compiler_options):
     """
     Helper function. Takes compiler options dict and generates a string with 
@@ -382,16 +720,20 @@ def _gen_compiler_options(compiler_options):
     opts = opts.replace('False', 'false')
     return opts
     
-def _gen_log_level(log_string):
+def _gen_log_level(log_string, xml_level='w', xml_file=None):
     """
     Helper function. Takes log level as accepted by Python and generates a string
-    which is understood by the Java compiler.
+    which is understood by the Java compiler. xml_level is the level of the
+    XML log that is written to stderr, or to xml_file if it is given.
     """
     if "|stderr" in log_string:
         raise IllegalLogStringError("Piping compiler log to stderr is not allowed in separate process.")
     if len(log_string) == 0:
         log_string = 'w'
-    log_string += ",w|xml|stderr"
+    if xml_file is None:
+        log_string += "," + xml_level + "|xml|stderr"
+    else:
+        log_string += "," + xml_level + "|xml:" + xml_file
     return log_string
     
 def _get_separate_JVM():
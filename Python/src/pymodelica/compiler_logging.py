@@ -23,8 +23,75 @@ from compiler_exceptions import *
 import sys
 import traceback
 import os
+import re
+import time
+import logging
 import tempfile
 
+# Matches the info messages that the compiler gives when it starts a new
+# compilation stage. The messages are not separated in the log.
+_STAGE_PATTERN = re.compile(r'(Parsing [^\n]*?|Flattening model|Checking for errors|'
+                            r'Applying transformation: [^\n]*?|Generating code)\.\.\.')
+
+# The maximum length of log text kept while looking for stage messages
+_MAX_TEXT_LENGTH = 4096
+
+class CompilerLogListener(object):
+    """
+    Receives events from the compiler log while it is parsed, so that
+    problems and progress can be handled before the compilation has
+    finished. The methods are called from the log handling thread, in the
+    order that the events are given by the compiler. The default
+    implementations do nothing, override the ones of interest.
+    
+    Compilation stages are only reported if the log given to the parser
+    contains info messages.
+    
+    Parameters::
+        max_problems --
+            The maximum number of warnings and errors that are kept until
+            the compilation has finished. Errors are kept in favour of
+            warnings. All problems are passed to the problem method
+            regardless of this limit.
+            Default: None (no limit)
+    """
+    def __init__(self, max_problems=None):
+        self.max_problems = max_problems
+    
+    def problem(self, problem):
+        """
+        Called for each warning, error and exception in the log.
+        
+        Parameters::
+            problem --
+                A CompilationWarning, CompilationError or
+                CompilationException.
+        """
+        pass
+    
+    def stage_started(self, stage):
+        """
+        Called when the compiler starts a compilation stage.
+        
+        Parameters::
+            stage --
+                The name of the stage, for example 'Flattening model'.
+        """
+        pass
+    
+    def stage_finished(self, stage, elapsed):
+        """
+        Called when a compilation stage has finished, that is when the next
+        stage starts or the log ends.
+        
+        Parameters::
+            stage --
+                The name of the stage.
+            elapsed --
+                The time spent in the stage, in seconds.
+        """
+        pass
+
 class LogErrorParser(xml.sax.ContentHandler):
     """
     Implementation of the xml.sax.ContentHandler class. This class looks for
@@ -33,13 +100,20 @@ class LogErrorParser(xml.sax.ContentHandler):
     parameters::
         result --
             A _CompilerResultHolder that stores the result
+        listener --
+            A CompilerLogListener that is notified of each event as it is
+            parsed, or None.
     """
-    def __init__(self, result):
+    def __init__(self, result, listener=None):
         xml.sax.ContentHandler.__init__(self)
         self.result = result
+        self.listener = listener
         self.node = None
         self.state = None
         self.attribute = None
+        self.text = ''
+        self.stage = None
+        self.stage_start = time.time()
     def startElement(self, name, attrs):
         if self.state == 'error' or self.state == 'warning' or \
                 self.state == 'exception' or self.state == 'unit':
@@ -65,7 +139,8 @@ class LogErrorParser(xml.sax.ContentHandler):
                 self.state == 'warning' and name == "Warning" or \
                 self.state == 'exception' and name == "Exception":
             problem = self._construct_problem_node(self.node)
-            self.result.problems.append(problem)
+            self.result.add_problem(problem)
+            self._notify('problem', problem)
             self.state = None
             self.node = None
         elif self.state == 'unit' and name == "CompilationUnit":
@@ -75,9 +150,47 @@ class LogErrorParser(xml.sax.ContentHandler):
         elif name == 'value':
             self.attribute = None
     
+    def endDocument(self):
+        self._finish_stage()
+    
     def characters(self, content):
         if self.node is not None and self.attribute is not None:
             self.node[self.attribute] += content;
+        elif self.node is None:
+            self._find_stages(content)
+    
+    def _find_stages(self, content):
+        """
+        Looks for stage messages in log text outside of problem nodes.
+        """
+        text = self.text + content
+        end = 0
+        for match in _STAGE_PATTERN.finditer(text):
+            self._finish_stage()
+            self.stage = match.group(1)
+            self._notify('stage_started', self.stage)
+            end = match.end()
+        self.text = text[end:][-_MAX_TEXT_LENGTH:]
+    
+    def _finish_stage(self):
+        now = time.time()
+        if self.stage is not None:
+            elapsed = now - self.stage_start
+            self.result.stage_times.append((self.stage, elapsed))
+            self._notify('stage_finished', self.stage, elapsed)
+            self.stage = None
+        self.stage_start = now
+    
+    def _notify(self, event, *args):
+        """
+        Calls a method of the listener. Exceptions raised by the listener
+        are printed, they must not stop the parsing of the log.
+        """
+        if self.listener is not None:
+            try:
+                getattr(self.listener, event)(*args)
+            except Exception:
+                traceback.print_exc()
     
     def _construct_problem_node(self, node):
         if node['type'] == 'exception':
@@ -128,6 +241,13 @@ class KeepLastStream():
         self.last = self.stream.read(num)
         return self.last
     
+    def close(self):
+        """
+        Called by the SAX parser when it is done. The underlying stream is
+        closed by the owner of the stream.
+        """
+        pass
+    
     def genErrorMsg(self, e):
         column = e.getColumnNumber()
         localLine = e.getLineNumber() - self.line
@@ -197,42 +317,81 @@ class LogHandlerThread(Thread):
     Contains two attributes, errors and warnings that will be propagated with
     errors and warnings during the compilation.
     """
-    def __init__(self, stream):
+    def __init__(self, stream, listener=None):
         """
         Creates the new LogHandlerThread
         
         Parameters::
             stream --
                 An output stream that the logger can parse.
+            listener --
+                A CompilerLogListener that is notified of the events in the
+                log as they are parsed.
+                Default: None
         
         """
         Thread.__init__(self)
         self.stream = KeepLastStream(stream)
-        self.result = _CompilerResultHolder()
+        self.listener = listener
+        max_problems = None if listener is None else listener.max_problems
+        self.result = _CompilerResultHolder(max_problems)
 
     def run(self):
         """
         The thread.run() method that delegates to a SAX parser. 
         """
         try:
-            xml.sax.parse(self.stream, LogErrorParser(self.result))
+            xml.sax.parse(self.stream, LogErrorParser(self.result, self.listener))
         except xml.sax.SAXParseException, e:
-            self.result.problems.append(CompilationException('xml.sax.SAXParseException', self.stream.genErrorMsg(e),""))
+            self.result.add_problem(CompilationException('xml.sax.SAXParseException', self.stream.genErrorMsg(e),""))
 
 class _CompilerResultHolder:
     """
     Holds the result of the compilation while log is read.
+    
+    If max_problems is not None, at most max_problems warnings and errors
+    are kept. When the limit is reached, new warnings are dropped and new
+    errors replace the last kept warning, or are dropped if there is none.
+    Exceptions are always kept.
     """
-    def __init__(self):
+    def __init__(self, max_problems=None):
         self.problems = []
         self.name = None
+        self.stage_times = []
+        self.max_problems = max_problems
+        self.nbr_limited = 0
+        self.dropped_warnings = 0
+        self.dropped_errors = 0
+    
+    def add_problem(self, problem):
+        if isinstance(problem, CompilationException) or self.max_problems is None:
+            self.problems.append(problem)
+        elif self.nbr_limited < self.max_problems:
+            self.problems.append(problem)
+            self.nbr_limited += 1
+        elif isinstance(problem, CompilationWarning):
+            self.dropped_warnings += 1
+        else:
+            for i in xrange(len(self.problems) - 1, -1, -1):
+                if isinstance(self.problems[i], CompilationWarning):
+                    self.problems[i] = problem
+                    self.dropped_warnings += 1
+                    return
+            self.dropped_errors += 1
 
 class CompilerLogHandler:
-    def __init__(self):
+    def __init__(self, listener=None):
         """
         Create a compiler log handler. It will parse the xml stream that is
         output by the JModelica.org compiler.
         
+        Parameters::
+            listener --
+                A CompilerLogListener that is notified of warnings, errors
+                and compilation stages as they are parsed, and that limits
+                the number of problems kept in memory.
+                Default: None
+        
         Normal call flow is as follows:
         stream = <<<an output stream from the compiler>>>
         log = CompilerLogHandler()
@@ -243,7 +402,9 @@ class CompilerLogHandler:
             stream.close()
             log.end()
         """
+        self.listener = listener
         self.loggerThread = None
+        self.stage_times = []
     
     def _create_log_handler_thread(self, stream):
         """
@@ -253,7 +414,7 @@ class CompilerLogHandler:
         
             A LogHandlerThread object.
         """
-        return LogHandlerThread(stream);
+        return LogHandlerThread(stream, self.listener);
     
     def start(self, stream):
         """
@@ -279,14 +440,24 @@ class CompilerLogHandler:
         This method will proccess the errors and warnings that are given in the
         log stream. An appropriate Python error is raised if an exception was
         given by the compiler process.
+        
+        The time spent in each compilation stage is stored in stage_times,
+        as a list of (stage, seconds) tuples.
         """
         if (self.loggerThread is None):
             print "Invalid call order!"
         self.loggerThread.join()
-        problems = self.loggerThread.result.problems
-        name = self.loggerThread.result.name
+        result = self.loggerThread.result
+        problems = result.problems
+        name = result.name
+        self.stage_times = result.stage_times
         self.loggerThread = None
         
+        if result.dropped_warnings > 0 or result.dropped_errors > 0:
+            logging.warning("%d warnings and %d errors from the compiler were not kept, "
+                            "the limit is %d problems." % (result.dropped_warnings,
+                            result.dropped_errors, result.max_problems))
+        
         exceptions = []
         errors = []
         warnings = []
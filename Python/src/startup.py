@@ -46,7 +46,6 @@ available in this namespace (unlikely).
 import os, os.path
 import sys
 import logging
-import jpype
 from required_defaults import get_required_paths_dict as _get_required_paths_dict
 from required_defaults import optimica_compiler_included as _optimica_compiler_included
 
@@ -73,6 +72,15 @@ if _optimica_compiler_included():
 def _create_compiler(comp, options):
     return comp(options)
 
+def _default_jvm_path():
+    # Importing jpype and searching for the JVM is the most expensive part of
+    # the startup, so it is only done if JPYPE_JVM is not set. The result is
+    # stored in the process environment, from which it is read by later
+    # startups, in this process and in its worker processes.
+    import jpype
+    os.environ['JPYPE_JVM'] = jpype.getDefaultJVMPath() or ''
+    return os.environ['JPYPE_JVM']
+
 _reqired_path = _get_required_paths_dict()
 _no_inst_msg = ' installation could not be found, some modules and examples will therefore not work properly.'
 # Format of _expected_env item: (name, should_split, default, error_msg_if_not_set)  
@@ -81,7 +89,7 @@ _expected_env = [('IPOPT_HOME',    False, '', 'An IPOPT' + _no_inst_msg),
                  ('COMPILER_JARS', True,  COMPILER_JARS),
                  ('BEAVER_PATH',   False, os.path.join(_jm_home,'ThirdParty','Beaver','lib')),
                  ('MODELICAPATH',  True,  os.path.join(_jm_home,'ThirdParty','MSL')),
-                 ('JPYPE_JVM',     False, jpype.getDefaultJVMPath() or ''),
+                 ('JPYPE_JVM',     False, _default_jvm_path),
                  ('JVM_ARGS',      False, '-Xmx700m')]
 
 if sys.platform == 'win32':
@@ -92,7 +100,7 @@ for _e in _expected_env:
     try:
         environ[_e[0]] = os.environ[_e[0]]
     except KeyError:
-        environ[_e[0]] = _e[2]
+        environ[_e[0]] = _e[2]() if callable(_e[2]) else _e[2]
   
 if sys.platform == 'win32':
     # add mingw to path (win32)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2014 Modelon AB
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+""" Test module for testing the Multiple_Shooting class
+"""
+import numpy as N
+from tests_jmodelica import testattr
+
+try:
+    from assimulo.problem import Explicit_Problem
+    from assimulo.solvers import CVode
+    from pyjmi.optimization.assimulo_shooting import Multiple_Shooting
+except (NameError, ImportError):
+    pass
+
+class _Model(object):
+    """
+    A model with the parts of the JMI model interface used by
+    Multiple_Shooting. The states are x and c, with
+
+        der(x) = -x + u
+        der(c) = x^2 + u^2
+
+    on the interval [0, 4], and the cost is c(4) + der(x)(4)^2.
+    """
+    def __init__(self):
+        self.real_u = N.zeros(1)
+        self.real_x = N.array([1., 0.])
+        self.real_dx = N.zeros(2)
+        self._x_p = N.zeros(2)
+        self._dx_p = N.zeros(2)
+
+    def opt_interval_get_start_time(self):
+        return 0.
+
+    def opt_interval_get_final_time(self):
+        return 4.
+
+    def set_real_x_p(self, x, i):
+        self._x_p = N.array(x, dtype=float)
+
+    def set_real_dx_p(self, dx, i):
+        self._dx_p = N.array(dx, dtype=float)
+
+    def set_real_u_p(self, u, i):
+        pass
+
+    def opt_eval_J(self):
+        return self._x_p[1] + self._dx_p[0]**2
+
+class _Problem(object):
+    """
+    The right hand side of _Model, which like the JMI problems uses the
+    inputs set in the model and sets the states and derivatives of the
+    model.
+    """
+    def __init__(self, model):
+        self._model = model
+
+    def rhs(self, t, y):
+        u = self._model.real_u[0]
+        self._model.real_x = N.array(y, dtype=float)
+        self._model.real_dx = N.array([-y[0] + u, y[0]**2 + u**2])
+        return self._model.real_dx.copy()
+
+class _Simulator(object):
+    """
+    CVode with the interface of the simulators used by Multiple_Shooting.
+    """
+    def __init__(self, problem):
+        self._problem = problem
+        self.rtol = 1e-10
+        self.atol = 1e-10
+        self._solver = CVode(Explicit_Problem(problem.rhs,
+                                              problem._model.real_x.copy(),
+                                              0.0))
+        self._solver.rtol = self.rtol
+        self._solver.atol = self.atol
+        self._solver.verbosity = 50
+
+    def reset(self):
+        self._solver.reset()
+
+    def re_init(self, t0, y0):
+        self._solver.re_init(t0, y0)
+
+    def __call__(self, tfinal, ncp=0):
+        return self._solver.simulate(tfinal, ncp)
+
+class TestMultipleShooting(object):
+
+    def _create_shooting(self, nbr_workers=1, sensitivities=False):
+        """
+        Creates a Multiple_Shooting with four intervals for _Model.
+        """
+        simulator = _Simulator(_Problem(_Model()))
+        shooting = Multiple_Shooting(simulator, 4, [0.5], nbr_workers,
+                                     sensitivities)
+        shooting.verbosity = Multiple_Shooting.QUIET
+        return shooting
+
+    @testattr(stddist_base = True)
+    def test_parallel_intervals(self):
+        """
+        Test that f and h are the same when the intervals are simulated in
+        worker processes, and that the cost uses the derivatives at the
+        final time.
+        """
+        for sensitivities in [False, True]:
+            serial = self._create_shooting(1, sensitivities)
+            pooled = self._create_shooting(3, sensitivities)
+            try:
+                p = serial.get_p0() + 0.05
+                N.testing.assert_allclose(pooled.get_p0() + 0.05, p)
+                for q in [p, p + 0.01]:
+                    h = serial.h(q)
+                    N.testing.assert_allclose(pooled.h(q), h, rtol=1e-10)
+                    N.testing.assert_allclose(pooled.f(q), serial.f(q),
+                                              rtol=1e-10)
+
+                    #The cost with der(x) evaluated at the final time
+                    y_end = serial._simulate_intervals(q)[-1]
+                    u_last = q[serial.gridsize-1]
+                    N.testing.assert_allclose(serial.f(q), y_end[1] +
+                                              (u_last - y_end[0])**2)
+            finally:
+                pooled.close()
+
+    @testattr(stddist_base = True)
+    def test_sensitivity_derivatives(self):
+        """
+        Test that the gradient of f and the Jacobian of h computed from the
+        sensitivities agree with central differences of f and h, both with
+        a dense and a sparse Jacobian.
+        """
+        shooting = self._create_shooting(sensitivities=True)
+        p = shooting.get_p0() + 0.05
+        step = 1e-4
+        df_fd = N.empty(len(p))
+        dh_fd = N.empty((len(shooting.h(p)), len(p)))
+        for j in range(len(p)):
+            p_plus = p.copy()
+            p_plus[j] += step
+            p_minus = p.copy()
+            p_minus[j] -= step
+            df_fd[j] = (shooting.f(p_plus) - shooting.f(p_minus))/(2*step)
+            dh_fd[:,j] = (shooting.h(p_plus) - shooting.h(p_minus))/(2*step)
+
+        N.testing.assert_allclose(shooting.df(p), df_fd, rtol=1e-4, atol=1e-5)
+        dh = shooting.dh(p)
+        assert isinstance(dh, N.ndarray)
+        N.testing.assert_allclose(dh, dh_fd, rtol=1e-4, atol=1e-5)
+
+        shooting.sparse_jacobian = True
+        dh_sparse = shooting.dh(p)
+        assert not isinstance(dh_sparse, N.ndarray)
+        N.testing.assert_allclose(dh_sparse.toarray(), dh_fd, rtol=1e-4,
+                                  atol=1e-5)
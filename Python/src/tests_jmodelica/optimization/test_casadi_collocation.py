@@ -1738,6 +1738,36 @@ class TestLocalDAECollocator(object):
         op.optimize(self.algorithm, opts)
         assert(os.path.exists("vdp_custom_file_name.txt"))
 
+    @testattr(casadi_base = True)
+    def test_result_handling(self):
+        """
+        Test that binary and in-memory results equal the textual result.
+        """
+        op = self.vdp_bounds_lagrange_op
+        opts = self.optimize_options(op, self.algorithm)
+        res_txt = op.optimize(self.algorithm, opts)
+
+        # Binary result file
+        try:
+            os.remove("VDP_pack_VDP_Opt_Bounds_Lagrange_result.mat")
+        except OSError:
+            pass
+        opts['result_handling'] = "binary"
+        res_mat = op.optimize(self.algorithm, opts)
+        assert(os.path.exists("VDP_pack_VDP_Opt_Bounds_Lagrange_result.mat"))
+
+        # Result in memory
+        opts['result_handling'] = "memory"
+        res_mem = op.optimize(self.algorithm, opts)
+        assert(res_mem.result_file is None)
+
+        for res in [res_mat, res_mem]:
+            for name in ['time', 'x1', 'x2', 'u']:
+                N.testing.assert_allclose(res[name], res_txt[name], rtol=1e-12)
+
+        opts['result_handling'] = "csv"
+        nose.tools.assert_raises(ValueError, op.optimize, self.algorithm, opts)
+
     @testattr(casadi_base = True)
     def test_result_mode(self):
         """
@@ -2123,6 +2153,23 @@ class TestLocalDAECollocator(object):
         N.testing.assert_allclose([res.final("T"), res.final("c")],
                                   [284.60202203, 346.31140851], rtol=5e-4)
 
+    @testattr(casadi_base = True)
+    def test_input_interpolator_vectorized(self):
+        """
+        Test evaluating the input interpolator at many time points at once.
+        """
+        op = self.cstr_extends_op
+        opts = self.optimize_options(op, self.algorithm)
+        opts['n_e'] = 20
+        opt_res = op.optimize(self.algorithm, opts)
+        (input_names, opt_input) = opt_res.get_opt_input()
+
+        t = N.linspace(0., 150., 301)
+        u = opt_input(t)
+        N.testing.assert_equal(u.shape, (len(t), len(input_names)))
+        for (t_m, u_m) in zip(t, u):
+            N.testing.assert_allclose(opt_input(t_m), u_m)
+
     @testattr(casadi_base = True)
     def test_matrix_evaluations(self):
         """
@@ -21,10 +21,17 @@ OptimizationSolver.
 """
 
 import os
+import stat
+import shutil
+import tempfile
 import numpy as N
+import nose.tools
 from tests_jmodelica import testattr, get_files_path
 try:
     from pyjmi import transfer_optimization_problem
+    from pyjmi.optimization.casadi_collocation import (
+        CasadiCollocatorException, _default_codegen_cache_dir,
+        _create_codegen_cache_dir)
 except (NameError, ImportError):
     pass
 
@@ -80,3 +87,80 @@ def test_code_gen():
     # Check that all solvers gave the same result
     assert result_distance(res0, res1, var_names) < 1e-6
     assert result_distance(res0, res2, var_names) < 1e-6
+
+@testattr(casadi_base = True)
+def test_code_gen_cache():
+    var_names = ('x1', 'x2', 'u')
+    if os.name == 'nt':
+        ext = '.dll'
+    else:
+        ext = '.so'
+    cache_dir = tempfile.mkdtemp()
+    
+    file_path = os.path.join(get_files_path(), 'Modelica', 'VDP.mop')
+    op = transfer_optimization_problem("VDP_pack.VDP_Opt2", file_path)
+    
+    opt_opts = op.optimize_options()
+    res0 = op.optimize(options = opt_opts)
+    
+    try:
+        # First solver: generate and compile new C code into the cache
+        solver1 = op.prepare_optimization(options = opt_opts)
+        solver1.enable_codegen(cache_dir=cache_dir)
+        libs = sorted(f for f in os.listdir(cache_dir) if f.endswith(ext))
+        assert len(libs) == 4
+        file_ctimes = dict((f, os.stat(os.path.join(cache_dir, f)).st_ctime)
+                           for f in os.listdir(cache_dir))
+        res1 = solver1.optimize()
+        
+        # Second solver: same structure, so the cached code is reused
+        solver2 = op.prepare_optimization(options = opt_opts)
+        solver2.enable_codegen(cache_dir=cache_dir)
+        assert sorted(os.listdir(cache_dir)) == sorted(file_ctimes.keys())
+        for f in os.listdir(cache_dir):
+            if f.endswith('.c'):
+                assert file_ctimes[f] == os.stat(os.path.join(cache_dir, f)).st_ctime
+        res2 = solver2.optimize()
+        
+        # Changing the discretization changes the generated code
+        opt_opts['n_e'] = 2 * opt_opts['n_e']
+        solver3 = op.prepare_optimization(options = opt_opts)
+        solver3.enable_codegen(cache_dir=cache_dir, cache_size=4)
+        new_libs = sorted(f for f in os.listdir(cache_dir) if f.endswith(ext))
+        assert len(new_libs) == 4
+        assert len(set(new_libs) & set(libs)) == 0
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    
+    assert result_distance(res0, res1, var_names) < 1e-6
+    assert result_distance(res0, res2, var_names) < 1e-6
+
+@testattr(casadi_base = True)
+def test_code_gen_cache_dir():
+    """
+    Test that the code generation cache directory is only accessible by
+    the current user.
+    """
+    env_cache_dir = os.environ.pop('JMODELICA_CODEGEN_CACHE', None)
+    try:
+        cache_dir = _default_codegen_cache_dir()
+    finally:
+        if env_cache_dir is not None:
+            os.environ['JMODELICA_CODEGEN_CACHE'] = env_cache_dir
+    assert os.path.dirname(cache_dir) == tempfile.gettempdir()
+    if hasattr(os, 'getuid'):
+        assert cache_dir.endswith('_' + str(os.getuid()))
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        _create_codegen_cache_dir(cache_dir)
+        assert os.path.isdir(cache_dir)
+        _create_codegen_cache_dir(cache_dir) # An existing directory is used
+        if hasattr(os, 'getuid'):
+            assert stat.S_IMODE(os.stat(cache_dir).st_mode) & 0077 == 0
+            os.chmod(cache_dir, 0777)
+            nose.tools.assert_raises(CasadiCollocatorException,
+                                     _create_codegen_cache_dir, cache_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
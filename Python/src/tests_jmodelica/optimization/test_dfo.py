@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Modelon AB, all rights reserved.
+
+"""Tests the dfo and thread_feval modules."""
+
+import os
+import nose
+import shutil
+import tempfile
+import numpy as N
+
+from tests_jmodelica import testattr
+from pyjmi.optimization import dfo
+from pyjmi.optimization.thread_feval import FevalPool
+
+# Objective function files for FevalPool, the function must have the same
+# name as the file
+_feval_square = """
+import numpy as N
+def feval_square(x):
+    if x[0] < 0:
+        raise ValueError('Negative x[0]')
+    return float(N.sum(x**2))
+"""
+
+_feval_pid = """
+import os
+def feval_pid(x):
+    return float(os.getpid())
+"""
+
+def _quadratic(x):
+    return (x[0] - 1.)**2 + 2.*(x[1] + 0.5)**2 + 0.5*(x[2] - 2.)**2
+
+@testattr(stddist_base = True)
+def test_nelme_speculative():
+    """Test that speculative Nelder-Mead follows the same iterates."""
+    xstart = N.zeros(3)
+    (x_ref, f_ref, iters_ref, fevals_ref, _) = dfo.nelme(_quadratic, xstart,
+                                                         disp=False)
+    for nbr_cores in [1, 4]:
+        (x_opt, f_opt, iters, fevals, _) = dfo.nelme(_quadratic, xstart,
+                                                     disp=False,
+                                                     nbr_cores=nbr_cores,
+                                                     speculative=True)
+        N.testing.assert_allclose(x_opt, x_ref)
+        N.testing.assert_allclose(f_opt, f_ref)
+        assert iters == iters_ref
+        # The vertex values are not evaluated again in each iteration
+        assert fevals < fevals_ref
+
+class TestFevalPool(object):
+    """Tests the FevalPool of the thread_feval module."""
+
+    def setUp(self):
+        # The workers evaluate in sub-directories of the working directory
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        for (name, text) in [('feval_square', _feval_square),
+                             ('feval_pid', _feval_pid)]:
+            with open(name + '.py', 'w') as f:
+                f.write(text)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    @testattr(stddist_base = True)
+    def test_feval(self):
+        """Test evaluating a single point and a batch of points."""
+        pool = FevalPool('feval_square.py', 2)
+        try:
+            N.testing.assert_allclose(pool.feval(N.array([1., 2.])), 5.)
+            x = N.array([[1., 0.], [2., 0.], [3., 1.]])
+            N.testing.assert_allclose(pool.feval(x), [1., 4., 10.])
+        finally:
+            pool.close()
+
+    @testattr(stddist_base = True)
+    def test_feval_failure(self):
+        """Test that a failed evaluation does not affect the next one."""
+        pool = FevalPool('feval_square.py', 2)
+        try:
+            # The first worker fails while the second has a reply to send
+            x = N.array([[-1., 0.], [2., 0.], [3., 1.]])
+            nose.tools.assert_raises(OSError, pool.feval, x)
+            x = N.array([[1., 0.], [3., 0.], [4., 0.]])
+            N.testing.assert_allclose(pool.feval(x), [1., 9., 16.])
+            N.testing.assert_allclose(pool.feval(N.array([1., 2.])), 5.)
+        finally:
+            pool.close()
+
+    @testattr(stddist_base = True)
+    def test_worker_restart(self):
+        """Test that the workers are replaced after max_worker_fevals."""
+        pool = FevalPool('feval_pid.py', 2, max_worker_fevals=2)
+        try:
+            x = N.zeros((2, 1))
+            pids = [tuple(pool.feval(x)) for i in xrange(3)]
+        finally:
+            pool.close()
+        assert pids[0] == pids[1]
+        assert len(set(pids[0] + pids[2])) == 4
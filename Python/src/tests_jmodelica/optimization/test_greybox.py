@@ -314,6 +314,70 @@ def test_compare():
     assert identification.calculate_risk(identification.get_cost()-idObj1.get_cost(),1,2) == result[0]['risk'] 
     
 
+@testattr(casadi_base = True)
+def test_release_each():
+    # Locate the model and file paths 
+    file_path = os.path.join(get_files_path(),'Modelica',"DrumBoiler.mo")
+    modelPath = "DrumBoiler"
+
+    # Load measurement data
+    RCdata = get_test_data()
+    measurements = RCdata['measurements'] 
+    time = RCdata['time'] 
+
+    # Extract control signal data from measurements
+    inputs={}
+    inputs['uc']= measurements.pop('uc')
+    inputs['fc']= measurements.pop('fc')
+
+    # Transfer model to Casadi interface
+    op = transfer_optimization_problem(modelPath, file_path, accept_model=True )
+    op_opts = op.optimize_options()
+
+    # Create greybox object
+    GB = GreyBox(op, op_opts, measurements, inputs, time)
+    GB.set_variable_attribute(GB.get_noise_covariance_variable('E'), 'max', 100)
+    GB.set_variable_attribute(GB.get_noise_covariance_variable('P'), 'max', 100)
+    GB.set_variable_attribute('x10', 'initialGuess', 148)
+    GB.set_variable_attribute('x20', 'initialGuess', 27.5)
+    
+    # Optimize null model
+    nullModelFree = set(['GreyBox_r_E', 'GreyBox_r_P', 'x10', 'x20'])
+    identification = GB.identify(nullModelFree)
+    
+    # Release 'TD' and 'A4' concurrently
+    (idObjs, result) = identification.release_each(['TD', 'A4'], nbr_workers=2)
+    assert idObjs[0].free_parameters == nullModelFree.union(['TD'])
+    assert idObjs[1].free_parameters == nullModelFree.union(['A4'])
+    N.testing.assert_allclose(result[0]['cost'], 5466.596970228651, 1e-3)
+    N.testing.assert_allclose(result[1]['cost'], 5630.90033894926, 1e-3)
+    N.testing.assert_allclose(result[0]['costred'], 164.47186155134114, 5e-3)
+    N.testing.assert_allclose(result[1]['costred'], 0.16849283073224797, 5e-3)
+    assert result[0]['risk'] == identification.calculate_risk(result[0]['costred'], 1, 2)
+    
+    # The results are cached per set of free parameters
+    (idObjs2, result2) = identification.release_each([set(['TD'])])
+    assert idObjs2[0] is idObjs[0]
+    
+    # The same results in the current process, with a result file per 
+    # optimization
+    GB.identifications.clear()
+    (idObjs3, result3) = identification.release_each(['TD', 'A4'], nbr_workers=1)
+    N.testing.assert_allclose([r['cost'] for r in result3], 
+                              [r['cost'] for r in result], 1e-6)
+    assert idObjs3[0].result.result_file != idObjs3[1].result.result_file
+    N.testing.assert_allclose(idObjs3[0].result.final('TD'), 
+                              idObjs[0].result.final('TD'), 1e-6)
+    N.testing.assert_allclose(idObjs3[1].result.final('A4'), 
+                              idObjs[1].result.final('A4'), 1e-6)
+    
+    # Releasing from another Identification changes the initial guess, which 
+    # clears the cached results
+    idObjs3[0].release_each(['A4'], nbr_workers=1)
+    (idObjs4, result4) = identification.release_each([set(['TD'])])
+    assert idObjs4[0] is not idObjs3[0]
+    N.testing.assert_allclose(result4[0]['cost'], result[0]['cost'], 1e-6)
+
 @testattr(casadi_base = True)
 def test_risk_calculation():
 	
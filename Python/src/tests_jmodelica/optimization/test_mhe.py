@@ -848,6 +848,46 @@ class TestMHE:
                 #Check that the estimation match the expected values
                 assert(N.abs(x_est_t[name] - res[name][k]) < small) == True
         
+    @testattr(casadi_base = True)
+    def test_persistent_collocator(self):
+        """
+        Test that the persistent_collocator option gives the same 
+        estimates as when the NLP is created in each sample.
+        """
+        u = N.array([200., 230.90169944, 258.77852523, 280.90169944, 
+                     295.10565163, 300., 295.10565163, 280.90169944, 
+                     258.77852523, 230.90169944])
+        y = {'T': N.array([350.49995133, 350.62330131, 348.36492738, 
+                           350.66030448, 349.06684452, 350.30260073, 
+                           350.88973306, 351.02143123, 352.25379842, 
+                           350.69031449]),
+             'c': N.array([1000.15989016, 995.19520286, 995.36670838, 
+                           992.97568672, 994.39361231, 993.60003461, 
+                           991.27116652, 984.54130088, 984.5513898, 
+                           987.03969368])}
+        sample_time = 0.1
+        horizon = 3
+        estimates = []
+        for persistent in [False, True]:
+            op = transfer_optimization_problem(self.CSTR_cpath, 
+                                               self.CSTR_fpath, 
+                                               accept_model = True, 
+                                               compiler_options = \
+                                               {"state_initial_equations":True,
+                                                "common_subexp_elim":False})
+            MHE_opts = MHEOptions(self.CSTR_MHE_opts)
+            MHE_opts['persistent_collocator'] = persistent
+            MHE_object = MHE(op, sample_time, horizon, self.CSTR_x_0_guess, 
+                             self.CSTR_dx_0, self.CSTR_c_0, MHE_opts)
+            x_est = []
+            for k in range(len(u)):
+                x_est_t = MHE_object.step([('Tc', u[k])], 
+                                          [('c', y['c'][k]), 
+                                           ('T', y['T'][k])])
+                x_est.append([x_est_t['c'], x_est_t['T']])
+            estimates.append(N.array(x_est))
+        N.testing.assert_allclose(estimates[1], estimates[0], rtol=1e-6)
+        
     @testattr(casadi_base = True)
     def VDP_test(self):
         """
@@ -45,6 +45,71 @@ def assert_results(res, input_name, u_norm_ref, u_norm_rtol=1e-4):
     u_norm = N.linalg.norm(u) / N.sqrt(len(u))
     N.testing.assert_allclose(u_norm, u_norm_ref, u_norm_rtol)
 
+def shift_xx_reference(mpc, xx_result):
+    """
+    Helper function that shifts an NLP variable vector of an MPC object one
+    sample by concatenating slices, as MPC._shift_xx did before the shift 
+    was precomputed as an index map.
+    """
+    split_map = {'x': 0, 'dx': 1, 'w': 2, 'unelim_u': 3, 'init_final': 4,
+                 'p_opt': 5}
+    gsi = mpc.collocator.global_split_indices
+    n_e = mpc.options['n_e']
+    n_cp = mpc.options['n_cp']
+    n_e_s = mpc.n_e_s
+    shifted_xx = xx_result[0:0]
+
+    # Shift x, dx and w
+    is_x = 1
+    for vk in ['x', 'dx', 'w']:
+        start = gsi[split_map[vk]]
+        end = gsi[split_map[vk]+1]
+        n_var = mpc.collocator.n_var[vk]
+        new_xx = xx_result[start+n_var*n_e_s*(n_cp+is_x):end]
+        new_xx_extrapolate = xx_result[end-n_var:end]
+        shifted_xx = N.concatenate((shifted_xx, new_xx))
+        for i in range((n_cp+is_x)*n_e_s):
+            shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+        is_x = 0
+
+    # Shift inputs without blocking factors
+    factors = mpc.options['blocking_factors'].factors
+    n_cont_u = len([var for var in mpc.collocator.mvar_vectors['unelim_u']
+                    if var.getName() not in factors.keys()])
+    start_cont_u = gsi[split_map['unelim_u']]
+    end_cont_u = start_cont_u + n_cont_u*n_cp*n_e
+    new_xx = xx_result[start_cont_u+n_cont_u*n_cp*n_e_s:end_cont_u]
+    new_xx_extrapolate = xx_result[end_cont_u-n_cont_u:end_cont_u]
+    shifted_xx = N.concatenate((shifted_xx, new_xx))
+    for i in range(n_cp*n_e_s):
+        shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+
+    # Shift inputs with blocking factors
+    n_bf_u = mpc.collocator.n_var['unelim_u'] - n_cont_u
+    start_bf_u = end_cont_u
+    for name in factors.keys():
+        end_bf_u = start_bf_u + len(factors[name])
+        new_xx = xx_result[start_bf_u+n_bf_u:end_bf_u]
+        new_xx_extrapolate = xx_result[end_bf_u-n_bf_u:end_bf_u]
+        shifted_xx = N.concatenate((shifted_xx, new_xx, new_xx_extrapolate))
+        start_bf_u = end_bf_u
+
+    # Shift initial controls (without blocking factors)
+    start_init_u = gsi[split_map['unelim_u']] + (n_cp*n_e_s-1)*n_cont_u
+    shifted_xx = N.concatenate((shifted_xx,
+                                xx_result[start_init_u:start_init_u+n_cont_u]))
+
+    # Shift initial dx, w
+    for vk in ['dx', 'w']:
+        n_var = mpc.collocator.n_var[vk]
+        start = gsi[split_map[vk]] + (n_cp*n_e_s-1)*n_var
+        shifted_xx = N.concatenate((shifted_xx, xx_result[start:start+n_var]))
+
+    # Add p_opt
+    start_p = gsi[split_map['p_opt']]
+    end_p = gsi[split_map['p_opt']+1]
+    return N.concatenate((shifted_xx, xx_result[start_p:end_p]))
+
 class TestMPCClass(object):
     """
     Tests pyjmi.optimization.mpc.
@@ -457,6 +522,140 @@ class TestMPCClass(object):
         N.testing.assert_equal(sample_period, result2['time'][0])
         N.testing.assert_equal(sample_period*(horizon+1), result2['time'][-1])
 
+    @testattr(casadi_base = True)
+    def test_sample_timings(self):
+        """
+        Test that the time spent in each phase of sample is recorded.
+        """
+        op = transfer_to_casadi_interface("CSTR.CSTR_MPC", 
+                                        self.cstr_file_path,
+                            compiler_options={"state_initial_equations":True})
+        op.set('_start_c', float(self.c_0_A))
+        op.set('_start_T', float(self.T_0_A))
+        
+        opt_opts = op.optimize_options()
+        opt_opts['n_e'] = 20
+        opt_opts['IPOPT_options']['print_level'] = 0
+        
+        sample_period = 3
+        horizon = 20
+        MPC_object = MPC(op, opt_opts, sample_period, horizon, 
+                         constr_viol_costs={'T': 1e6}, timing_buffer_size=2)
+        
+        for k in range(3):
+            MPC_object.update_state()
+            MPC_object.sample()
+        
+        timings = MPC_object.timings.get_timings()
+        N.testing.assert_equal(timings['sample'], [2, 3])
+        assert N.all(timings['solve'] > 0)
+        phases = N.sum([timings[p] for p in MPC_object.timings.phases], axis=0)
+        assert N.all(phases <= timings['total'])
+        
+        (stats, tot_times, summary) = MPC_object.get_solver_stats(timings=True)
+        N.testing.assert_equal(summary['nbr_samples'], 3)
+        N.testing.assert_equal(summary['deadline'], sample_period)
+        N.testing.assert_equal(len(summary['percentiles']['total']), 4)
+
+    @testattr(casadi_base = True)
+    def test_result_handling(self):
+        """
+        Test that the results of a sample are the same for all values of 
+        the result_handling option, both when the result is loaded in 
+        sample and in get_results_this_sample.
+        """
+        op = transfer_to_casadi_interface("CSTR.CSTR_MPC", 
+                                        self.cstr_file_path,
+                            compiler_options={"state_initial_equations":True})
+        op.set('_start_c', float(self.c_0_A))
+        op.set('_start_T', float(self.T_0_A))
+        
+        sample_period = 3
+        horizon = 20
+        for initial_guess in ['shift', 'trajectory']:
+            results = {}
+            for result_handling in ['file', 'binary', 'memory']:
+                opt_opts = op.optimize_options()
+                opt_opts['n_e'] = 20
+                opt_opts['result_handling'] = result_handling
+                opt_opts['IPOPT_options']['print_level'] = 0
+                MPC_object = MPC(op, opt_opts, sample_period, horizon,
+                                 initial_guess=initial_guess)
+                MPC_object.update_state()
+                MPC_object.sample()
+                results[result_handling] = \
+                                        MPC_object.get_results_this_sample()
+            for result_handling in ['binary', 'memory']:
+                for name in ['time', 'c', 'T', 'Tc']:
+                    N.testing.assert_allclose(
+                        results[result_handling][name], 
+                        results['file'][name], rtol=1e-10)
+
+    @testattr(casadi_base = True)
+    def test_shift_index_map(self):
+        """
+        Test that shifting the initial guess and the bound multipliers with 
+        the precomputed index map gives the same result as concatenating 
+        slices of the previous result, also after a failed optimization.
+        """
+        op = transfer_to_casadi_interface("CSTR.CSTR_MPC", 
+                                        self.cstr_file_path,
+                            compiler_options={"state_initial_equations":True})
+        op.set('_start_c', float(self.c_0_A))
+        op.set('_start_T', float(self.T_0_A))
+        
+        opt_opts = op.optimize_options()
+        opt_opts['n_e'] = 20
+        opt_opts['IPOPT_options']['print_level'] = 0
+        
+        sample_period = 3
+        horizon = 20
+        MPC_object = MPC(op, opt_opts, sample_period, horizon)
+        MPC_object.update_state()
+        MPC_object.sample()
+        collocator = MPC_object.collocator
+        primal = N.array(collocator.primal_opt).reshape(-1)
+        dual_x = N.array(collocator.dual_opt['x']).reshape(-1)
+        dual_g = N.array(collocator.dual_opt['g']).reshape(-1)
+
+        MPC_object._shift_xx()
+        shifted_primal = shift_xx_reference(MPC_object, primal)
+        shifted_dual_x = shift_xx_reference(MPC_object, dual_x)
+        N.testing.assert_array_equal(collocator.xx_init, shifted_primal)
+        N.testing.assert_array_equal(collocator.dual_opt['x'], shifted_dual_x)
+
+        # The multipliers of the collocation and DAE constraints of element
+        # i are taken from element i + n_e_s, and from the last element at
+        # the end of the horizon. The initial equations are not shifted.
+        n_e = opt_opts['n_e']
+        n_e_s = MPC_object.n_e_s
+        shifted_dual_g = N.array(collocator.dual_opt['g'])
+        for eqtype in ['collocation', 'dae']:
+            (indices, elements, points) = \
+                collocator.get_nlp_constraint_indices(eqtype)
+            rows = dict(((i, k), row) for (row, i, k) in
+                        zip(indices, elements, points))
+            for i in range(1, n_e + 1):
+                for k in range(1, opt_opts['n_cp'] + 1):
+                    N.testing.assert_array_equal(
+                        shifted_dual_g[rows[(i, k)]],
+                        dual_g[rows[(min(i + n_e_s, n_e), k)]])
+        (indices, _, _) = collocator.get_nlp_constraint_indices('initial')
+        N.testing.assert_array_equal(shifted_dual_g[indices], dual_g[indices])
+
+        # A failed optimization replaces the multipliers, the last 
+        # successful result is then shifted once more
+        MPC_object.found_solution = False
+        collocator.dual_opt['x'] = N.zeros(len(dual_x))
+        collocator.dual_opt['g'] = N.zeros(len(dual_g))
+        MPC_object._shift_xx()
+        N.testing.assert_array_equal(collocator.xx_init,
+            shift_xx_reference(MPC_object, shifted_primal))
+        N.testing.assert_array_equal(collocator.dual_opt['x'],
+            shift_xx_reference(MPC_object, shifted_dual_x))
+        N.testing.assert_array_equal(collocator.dual_opt['g'],
+            shifted_dual_g[MPC_object._dual_g_shift_index])
+
     #~ @testattr(casadi_base = True)
     #~ def test_set(self):
         #~ """
@@ -55,6 +55,29 @@ def test_realtime_mpc():
     results, _ = mpc.run()
     check_result(results, ref)
 
+@testattr(casadi_base = True)
+def test_realtime_mpc_pipelined():
+    start_values = {'_start_phi': 0, '_start_v': 0, '_start_z': 0}
+    par_changes = ParameterChanges({1: {'z_ref': 5}})
+    ref = {'phi': 0.936978004043,
+           'z': 4.25919322427,
+           'v': 3.40523065632,
+           'u': -0.0597209819244,
+           'time': 2.0}
+
+    path = os.path.join(get_files_path(), 'Modelica', 'bnb.mop')
+    mpc = MPCSimBase(path, 'Ball_Beam.Ball_Beam_MPC',
+                     'Ball_Beam.Ball_Beam_MPC_Model', 0.05, 1, 2,
+                     start_values, {}, ['phi', 'v', 'z'], ['u'], None,
+                     par_changes)
+    results, _ = mpc.run(pipelined=True, deadline=10.)
+    check_result(results, ref)
+    assert len(mpc.prepare_times) == mpc.n_steps
+    assert mpc.fallback_samples == []
+    timings = mpc.solver.timings.get_timings()
+    phases = N.sum([timings[p] for p in mpc.solver.timings.phases], axis=0)
+    assert N.all(phases <= timings['total'])
+
 @testattr(casadi_base = True)
 def test_realtime_mpc_ia():
     start_values = {'_start_h1': 0, '_start_h2': 0,
@@ -0,0 +1,39 @@
+#!/usr/bin/env python 
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Modelon AB, all rights reserved.
+
+"""Tests the sweep module."""
+
+import os
+import numpy as N
+
+from tests_jmodelica import testattr, get_files_path
+
+try:
+    from pyjmi import transfer_optimization_problem
+    from pyjmi.optimization.sweep import ParameterSweep
+except (NameError, ImportError):
+    pass
+
+def _max_distance(res1, res2, names):
+    return max([N.max(N.abs(res1[name] - res2[name])) for name in names])
+
+@testattr(casadi_base = True)
+def test_parameter_sweep():
+    """Test that a parameter sweep gives the same results as optimize."""
+    file_path = os.path.join(get_files_path(), 'Modelica', 'VDP.mop')
+    op = transfer_optimization_problem("VDP_pack.VDP_Opt2", file_path)
+    parameter_sets = [{'p1': p1} for p1 in [1., 1.5, 2., 1.25]]
+    
+    for nbr_workers in [1, 2]:
+        sweep = ParameterSweep(op, nbr_workers=nbr_workers)
+        results = sweep.run(parameter_sets)
+        assert len(results) == len(parameter_sets)
+        for (parameters, res) in zip(parameter_sets, results):
+            assert res.final('p1') == parameters['p1']
+            assert res.get_solver_statistics()[0] == 'Solve_Succeeded'
+            
+            op.set('p1', parameters['p1'])
+            res_ref = op.optimize()
+            assert _max_distance(res, res_ref, ('x1', 'x2', 'u')) < 1e-4
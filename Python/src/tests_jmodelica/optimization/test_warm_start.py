@@ -11,6 +11,8 @@ import numpy as N
 from tests_jmodelica import testattr, get_files_path
 
 try:
+    from casadi import MX
+    import modelicacasadi_wrapper as mc
     from pyjmi import transfer_optimization_problem
     from pyjmi.optimization.casadi_collocation import ExternalData
 except (NameError, ImportError):
@@ -110,6 +112,64 @@ def test_set_init_traj():
     assert(N.linalg.norm(res1['x1']-res0['x1'])) >= 1e-4
     assert(N.linalg.norm(res1['x2']-res0['x2'])) >= 1e-4
 
+@testattr(casadi_base = True)
+def test_set_variable_bounds():
+    """Test that OptimizationSolver.set_variable_bounds works"""
+    file_path = os.path.join(get_files_path(), 'Modelica', 'VDP.mop')
+    op = transfer_optimization_problem("VDP_pack.VDP_Opt2", file_path)
+
+    solver = op.prepare_optimization()
+    res1 = solver.optimize()
+    assert N.max(res1['u']) > 0.5 + 1e-4
+
+    solver.set_variable_bounds('u', max=0.5)
+    res2 = solver.optimize()
+    assert N.max(res2['u']) <= 0.5 + 1e-6
+
+    # Compare with a problem created with the new bound
+    op.getVariable('u').setAttribute('max', 0.5)
+    res3 = op.optimize()
+    assert result_distance(res2, res3, ('x1', 'x2', 'u')) < 1e-6
+
+@testattr(casadi_base = True)
+def test_set_path_constraint_bound():
+    """Test that OptimizationSolver.set_path_constraint_bound works"""
+    file_path = os.path.join(get_files_path(), 'Modelica', 'VDP.mop')
+    op = transfer_optimization_problem("VDP_pack.VDP_Opt_Simple", file_path)
+
+    solver = op.prepare_optimization()
+    res1 = solver.optimize()
+    assert N.max(res1['u']) > 0.37 + 1e-4
+
+    # Change the constraint u <= 0.75 to u <= 0.37
+    solver.set_path_constraint_bound(0, 0.37)
+    res2 = solver.optimize()
+    assert N.max(res2['u']) <= 0.37 + 1e-6
+
+    # Compare with a problem prepared with the new constant
+    cnstr = op.getPathConstraints()[0]
+    op.setPathConstraints([mc.Constraint(cnstr.getLhs(), MX(0.37), cnstr.getType())])
+    res3 = op.prepare_optimization().optimize()
+    assert result_distance(res2, res3, ('x1', 'x2', 'u')) < 1e-6
+
+@testattr(casadi_base = True)
+def test_fix_and_release_parameter():
+    """Test that OptimizationSolver.fix_parameter and release_parameter work"""
+    file_path = os.path.join(get_files_path(), 'Modelica', 'ParameterEstimation_1.mop')
+    op = transfer_optimization_problem("ParEst.ParEstCasADi", file_path)
+
+    solver = op.prepare_optimization()
+    solver.fix_parameter('w', 1.1)
+    solver.fix_parameter('z', 0.4)
+    res = solver.optimize()
+    N.testing.assert_allclose(res.final('w'), 1.1)
+    N.testing.assert_allclose(res.final('z'), 0.4)
+
+    solver.release_parameter('z')
+    res = solver.optimize()
+    N.testing.assert_allclose(res.final('w'), 1.1)
+    assert res.final('z') >= 0.1
+
 def check_changed_input(model_name, signal_name, ext_data_constructor, eliminate_algebraics=False,
         result_mode='collocation_points'):
     file_path = os.path.join(get_files_path(), 'Modelica', 'TestWarmStart.mop')
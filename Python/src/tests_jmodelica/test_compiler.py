@@ -412,6 +412,81 @@ class Test_Compiler_functions:
                fmuname+" was not created."
         os.remove(fmuname)
 
+    @testattr(stddist_base = True)
+    def test_compile_batch(self):
+        """
+        Test that it is possible to compile several FMUs with compile_batch.
+        """
+        path = Test_Compiler_functions.fpath_mc
+        jobs = [(Test_Compiler_functions.cpath_mc, path), 
+                ('Pendulum_pack.PlanarPendulum', path, {}, 'cs'), 
+                ('Pendulum_pack.NoSuchClass', path)]
+        results = dict((job[0], result) for (job, result) in 
+                       pym.compile_batch(jobs, nbr_workers=2))
+        
+        assert len(results) == 3
+        for cl in [job[0] for job in jobs[:2]]:
+            fmuname = results[cl]
+            assert os.access(fmuname, os.F_OK) == True, \
+                   fmuname+" was not created."
+            os.remove(fmuname)
+        assert isinstance(results['Pendulum_pack.NoSuchClass'], 
+                          pym.compiler_exceptions.ModelicaClassNotFoundError)
+
+    @testattr(stddist_base = True)
+    def test_compile_batch_one_worker(self):
+        """
+        Test that one worker process compiles all jobs, also after a job has
+        failed.
+        """
+        path = Test_Compiler_functions.fpath_mc
+        jobs = [('Pendulum_pack.NoSuchClass', path), 
+                (Test_Compiler_functions.cpath_mc, path), 
+                ('Pendulum_pack.PlanarPendulum', path, {}, 'cs')]
+        results = list(pym.compile_batch(jobs, nbr_workers=1))
+        
+        assert [job for (job, result) in results] == jobs
+        assert isinstance(results[0][1], 
+                          pym.compiler_exceptions.ModelicaClassNotFoundError)
+        for (job, fmuname) in results[1:]:
+            assert os.access(fmuname, os.F_OK) == True, \
+                   fmuname+" was not created."
+            os.remove(fmuname)
+
+    @testattr(stddist_base = True)
+    def test_compile_batch_invalid_arguments(self):
+        """
+        Test that compile_batch checks its arguments when it is called and not
+        when the first result is requested.
+        """
+        jobs = [(Test_Compiler_functions.cpath_mc, 
+                 Test_Compiler_functions.fpath_mc)]
+        nose.tools.assert_raises(pym.compiler_exceptions.IllegalLogStringError, 
+                                 pym.compile_batch, jobs, 
+                                 compiler_log_level='w|stderr')
+        nose.tools.assert_raises(
+            pym.compiler_exceptions.IllegalCompilerArgumentError, 
+            pym.compile_batch, jobs, platform='no_such_platform')
+        nose.tools.assert_raises(ValueError, pym.compile_batch, jobs, 
+                                 nbr_workers=0)
+
+    @testattr(stddist_base = True)
+    def test_compile_batch_after_jvm_started(self):
+        """
+        Test that compile_batch works after a JVM has been started in the 
+        current process.
+        """
+        path = Test_Compiler_functions.fpath_mc
+        fmuname = compile_fmu(Test_Compiler_functions.cpath_mc, path, 
+                              separate_process=False)
+        os.remove(fmuname)
+        jobs = [(Test_Compiler_functions.cpath_mc, path), 
+                ('Pendulum_pack.PlanarPendulum', path)]
+        for (job, fmuname) in pym.compile_batch(jobs, nbr_workers=2):
+            assert os.access(fmuname, os.F_OK) == True, \
+                   fmuname+" was not created."
+            os.remove(fmuname)
+
     @testattr(stddist_base = True)
     def test_separate_process_control_characters(self):
         """
@@ -502,3 +577,52 @@ class Test_Compiler_functions:
 #        path = Test_Compiler_functions.fpath_mc
 #        pym.compile_fmu(cl, path, target='cs', version='2.0', platform='win64')
 
+
+class Test_Compiler_Logging:
+    """ This class tests the parsing of the compiler log. """
+    
+    @staticmethod
+    def _problem_node(name, message):
+        values = [('identifier', ''), ('kind', 'semantic'), ('file', 'Test.mo'),
+                  ('line', '1'), ('column', '1'), ('message', message)]
+        return '<%s>\n%s</%s>\n' % (name, ''.join('    <value name="%s">%s</value>\n' % v
+                                                   for v in values), name)
+    
+    @testattr(stddist_base = True)
+    def test_log_listener(self):
+        """
+        Test that a CompilerLogListener gets all problems and stages as they
+        are parsed and that the retained problems are limited.
+        """
+        from StringIO import StringIO
+        from pymodelica.compiler_logging import CompilerLogHandler, CompilerLogListener
+        from pymodelica.compiler_exceptions import CompilerError
+        
+        class Listener(CompilerLogListener):
+            def __init__(self):
+                CompilerLogListener.__init__(self, max_problems=2)
+                self.events = []
+            def problem(self, problem):
+                self.events.append(problem.message)
+            def stage_started(self, stage):
+                self.events.append(stage)
+        
+        node = Test_Compiler_Logging._problem_node
+        log = ('<compilation>\nParsing Test.mo...Test.mo parsed OK.Flattening model...' +
+               node('Warning', 'w1') + node('Warning', 'w2') + 'Checking for errors...' +
+               node('Error', 'e1') + node('Warning', 'w3') + 'Generating code...</compilation>')
+        listener = Listener()
+        handler = CompilerLogHandler(listener)
+        handler.start(StringIO(log))
+        nose.tools.assert_raises(CompilerError, handler.end)
+        assert listener.events == ['Parsing Test.mo', 'Flattening model', 'w1', 'w2',
+                                   'Checking for errors', 'e1', 'w3', 'Generating code']
+        assert [stage for (stage, time) in handler.stage_times] == [
+            'Parsing Test.mo', 'Flattening model', 'Checking for errors', 'Generating code']
+        
+        # The error replaces a warning when the limit is reached
+        handler.start(StringIO(log))
+        with nose.tools.assert_raises(CompilerError) as cm:
+            handler.end()
+        assert [p.message for p in cm.exception.errors] == ['e1']
+        assert [p.message for p in cm.exception.warnings] == ['w1']
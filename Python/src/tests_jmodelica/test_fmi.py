@@ -21,6 +21,8 @@ Module containing the tests for the FMI interface.
 
 import nose
 import os
+import shutil
+import tempfile
 import numpy as N
 import sys as S
 
@@ -29,7 +31,7 @@ from pymodelica.compiler import compile_fmu
 from pyfmi.fmi import FMUModel, FMUException, FMUModelME1, FMUModelCS1, load_fmu, FMUModelCS2, FMUModelME2, PyEventInfo
 import pyfmi.fmi_algorithm_drivers as ad
 from pyfmi.common.core import get_platform_dir
-from pyjmi.log import parse_jmi_log, gather_solves
+from pyjmi.log import parse_jmi_log, iterparse_jmi_log, gather_solves, JMILogIndex
 from pyfmi.common.io import ResultHandler
 import pyfmi.fmi as fmi
 
@@ -1216,6 +1218,32 @@ class Test_Logger:
         nose.tools.assert_almost_equal( d[0].block_solves[0].iterations[0].scaled_residual_norm,
                                         1.2432316741177614E+01 )
 
+    @testattr(stddist_full = True)
+    def test_stream_and_index_log_file(self):
+        """
+        Test that a pregenerated log file gives the same nodes when streamed
+        and when queried through an index
+        """
+        file_name = os.path.join(path_to_fmu_logs, 'LoggerTest_log.txt')
+        log = parse_jmi_log(file_name)
+
+        nodes = list(iterparse_jmi_log(file_name))
+        assert len(nodes) == len(log.nodes)
+
+        index_file = os.path.join(tempfile.mkdtemp(), 'LoggerTest_log.index')
+        try:
+            for i in range(2): # Create the index, then load it
+                index = JMILogIndex(file_name, index_file=index_file)
+                assert os.path.isfile(index_file)
+                for types in ['EquationSolve', ('NewtonSolve', 'KinsolInfo')]:
+                    assert ([node.type for node in index.find(types)] ==
+                            [node.type for node in log.find(types)])
+                solves = index.find('EquationSolve', t_start=0.0, t_end=0.0)
+                assert len(solves) > 0
+                assert all(solve.t == 0.0 for solve in solves)
+        finally:
+            shutil.rmtree(os.path.dirname(index_file))
+
 
 class Test_SetDependentParameterError:
     """
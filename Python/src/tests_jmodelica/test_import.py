@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Modelon AB
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests and benchmark of the import of the pyjmi and pymodelica packages.
+
+Run as a script to print the startup time of a worker process that imports
+pyjmi and pymodelica, with and without loading everything that was loaded
+by the import before it was made lazy.
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+import pyjmi
+from tests_jmodelica import testattr
+
+# Loads what importing pyjmi and pymodelica used to load eagerly
+_eager_statement = """
+import pyjmi, pymodelica
+if pyjmi.modelicacasadi_present:
+    pyjmi.CasadiModel
+pymodelica.compile_fmu
+"""
+
+def _run_python(statement, env=None):
+    """
+    Run statement in a new Python process and return its output.
+    """
+    p = subprocess.Popen([sys.executable, '-c', statement], env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (out, err) = p.communicate()
+    if p.returncode != 0:
+        raise Exception('Failed to run:\n%s\n%s' % (statement, err))
+    return out
+
+def _worker_env(probed=True):
+    """
+    Return the environment of a worker process started from this process.
+    If probed is False, the JVM path probed by the startup script is not
+    passed on.
+    """
+    env = dict(os.environ)
+    if probed:
+        env['JPYPE_JVM'] = pyjmi.environ['JPYPE_JVM']
+    else:
+        env.pop('JPYPE_JVM', None)
+    return env
+
+def import_time(statement, env=None, nbr_runs=5):
+    """
+    Return the smallest wall clock time, over nbr_runs runs, for starting a
+    Python process that runs statement.
+    """
+    times = []
+    for i in xrange(nbr_runs):
+        t0 = time.time()
+        _run_python(statement, env)
+        times.append(time.time() - t0)
+    return min(times)
+
+@testattr(stddist_base = True)
+def test_lazy_import():
+    """Test that importing pyjmi and pymodelica does not load optional parts."""
+    out = _run_python("import sys, pyjmi, pymodelica\n" +
+                      "print sorted(m for m in ['casadi', 'jpype', " +
+                      "'pyjmi.casadi_interface', 'pymodelica.compiler'] " +
+                      "if m in sys.modules)", _worker_env())
+    assert out.strip() == '[]', out
+
+@testattr(stddist_base = True)
+def test_lazy_attributes():
+    """Test that the lazily loaded attributes are available."""
+    out = _run_python("import pyjmi, pymodelica\n" +
+                      "from pyjmi.common.core import TrajectoryLinearInterpolation\n" +
+                      "print pyjmi.common.core.TrajectoryLinearInterpolation is " +
+                      "TrajectoryLinearInterpolation\n" +
+                      "print pymodelica.compile_fmu is " +
+                      "pymodelica.compiler.compile_fmu\n" +
+                      "print pyjmi.casadi_present in (True, False)",
+                      _worker_env())
+    assert out.split() == ['True', 'True', 'True'], out
+
+if __name__ == '__main__':
+    t_empty = import_time('pass')
+    print 'Python startup:                       %.3f s' % t_empty
+    print 'Worker startup, lazy and probed env:  %.3f s' % \
+        import_time('import pyjmi, pymodelica', _worker_env())
+    print 'Worker startup, lazy:                 %.3f s' % \
+        import_time('import pyjmi, pymodelica', _worker_env(False))
+    print 'Worker startup, eager:                %.3f s' % \
+        import_time(_eager_statement, _worker_env(False))
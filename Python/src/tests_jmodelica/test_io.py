@@ -313,3 +313,111 @@ class TestResultFileBinary:
         for i in range(len(x)):
             nose.tools.assert_equal(x[i], -y[i])
     
+
+class _SensitivityVariable(object):
+    """A model variable in the XML description of _SensitivityModel."""
+    def __init__(self, name, vref, alias):
+        self.name = name
+        self.vref = vref
+        self.alias = alias
+    def get_name(self):
+        return self.name
+    def get_value_reference(self):
+        return self.vref
+    def get_alias(self):
+        return self.alias
+    def get_description(self):
+        return 'Description of ' + self.name
+    def get_variability(self):
+        return 0
+
+class _SensitivityModel(object):
+    """
+    The parts of a JMI model that are used by ResultWriterDymolaSensitivity.
+    The parameters p and k are followed by the state x, with the alias a,
+    its derivative and the algebraic variable y, with the negated alias b.
+    Sensitivities are computed with respect to p.
+    """
+    def __init__(self):
+        from pyjmi.common import xmlparser
+        self.variables = [
+            _SensitivityVariable('p', 0, xmlparser.NO_ALIAS),
+            _SensitivityVariable('k', 1, xmlparser.NO_ALIAS),
+            _SensitivityVariable('x', 2, xmlparser.NO_ALIAS),
+            _SensitivityVariable('a', 2, xmlparser.ALIAS),
+            _SensitivityVariable('der(x)', 3, xmlparser.NO_ALIAS),
+            _SensitivityVariable('y', 4, xmlparser.NO_ALIAS),
+            _SensitivityVariable('b', 4, xmlparser.NEGATED_ALIAS)]
+        self.z = N.array([2., 3., 0., 0., 0.])
+        self.sc = N.array([2., 1., 4., 0.5, 10.])
+        self.jmimodel = self
+        self.t = 0.
+    def _get_XMLDoc(self):
+        return self
+    def get_model_variables(self):
+        return self.variables
+    def _get_variable(self, name):
+        return [var for var in self.variables if var.name == name][0]
+    def is_alias(self, name):
+        from pyjmi.common import xmlparser
+        return self._get_variable(name).alias != xmlparser.NO_ALIAS
+    def is_negated_alias(self, name):
+        from pyjmi.common import xmlparser
+        return self._get_variable(name).alias == xmlparser.NEGATED_ALIAS
+    def get_value_reference(self, name):
+        return self._get_variable(name).vref
+    def get_p_opt_variable_names(self):
+        return [(0, 'p')]
+    def get_x_variable_names(self):
+        return [(2, 'x')]
+    def get_w_variable_names(self):
+        return [(4, 'y')]
+    def get_scaling_method(self):
+        from pyjmi import jmi
+        return jmi.JMI_SCALING_VARIABLES
+    def get_offsets(self):
+        return 12*[0] + [2]
+    def get_variable_scaling_factors(self):
+        return self.sc
+
+class TestResultWriterDymolaSensitivity:
+    """Tests the class ResultWriterDymolaSensitivity."""
+    
+    @testattr(stddist_base = True)
+    def test_binary_format(self):
+        """
+        Test that a result written in binary format reads back the same as 
+        a result written in textual format.
+        """
+        from pyjmi.jmi_io import ResultWriterDymolaSensitivity
+        from pyjmi.common.io import ResultDymolaTextual as JMIResultDymolaTextual
+        from pyjmi.common.io import ResultDymolaBinary as JMIResultDymolaBinary
+        
+        # Points of time, x, der(x), y, dx/dp and dy/dp
+        t = N.linspace(0., 1., 5)
+        points = N.vstack([t, N.sin(t), N.cos(t), t**2, 2*t, -t]).T
+        
+        for format in ['txt', 'mat']:
+            model = _SensitivityModel()
+            writer = ResultWriterDymolaSensitivity(model, format=format)
+            writer.write_header('sensitivity_result.' + format)
+            for point in points:
+                model.t = point[0]
+                writer.write_point(point)
+            writer.write_finalize()
+        
+        res_txt = JMIResultDymolaTextual('sensitivity_result.txt')
+        res_mat = JMIResultDymolaBinary('sensitivity_result.mat')
+        for name in ['time', 'p', 'k', 'x', 'a', 'der(x)', 'y', 'b', 
+                     'dx/dp', 'dy/dp']:
+            traj_txt = res_txt.get_variable_data(name)
+            traj_mat = res_mat.get_variable_data(name)
+            N.testing.assert_allclose(traj_mat.t, traj_txt.t, rtol=1e-13)
+            N.testing.assert_allclose(traj_mat.x, traj_txt.x, rtol=1e-13)
+        # The variables are rescaled
+        N.testing.assert_allclose(res_mat.get_variable_data('y').x, 10*t**2)
+        N.testing.assert_allclose(res_mat.get_variable_data('b').x, -10*t**2)
+        N.testing.assert_allclose(res_mat.get_variable_data('dx/dp').x, 4*t)
+        N.testing.assert_allclose(res_mat.get_variable_data('p').x, [4., 4.])
+        os.remove('sensitivity_result.txt')
+        os.remove('sensitivity_result.mat')
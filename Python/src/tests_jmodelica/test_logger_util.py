@@ -0,0 +1,181 @@
+#!/usr/bin/env python 
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 Modelon AB
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+""" Test module for testing the logger_util module
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as N
+
+from tests_jmodelica import testattr, get_files_path
+from pyjmi.logger_util import parse_fmu_log, load_fmu_log, get_structured_fmu_log
+
+path_to_fmu_logs = os.path.join(get_files_path(), 'FMU_logs')
+
+# The structured log of NLE_log.txt, as given by get_structured_fmu_log 
+# before the log was stored in columns
+_block_0_t0 = {'block_index': 0, 'names': ['x1', 'x2'],
+               'initial_residual_scaling': [1.0, 2.0],
+               'initial_residual_scaling_updated': True,
+               'max': [10.0, 10.0], 'min': [-10.0, 0.0],
+               'initial_guess': [1.0, 0.5], 'variable_nominal': [1.0, 1.0],
+               'kinsol_exit_flag': '0',
+               'iterations': [{'iteration_variables': [1.0, 0.5],
+                               'jacobian': [[2.0, 1.0], [0.0, 3.0]],
+                               'jacobian_updated': True,
+                               'residual_scaling': [1.0, 2.0],
+                               'residual_scaling_updated': False,
+                               'residuals': [0.5, -0.25],
+                               'scaled_residual_norm': 0.25,
+                               'at_bound': [('x2', 'min')]},
+                              {'iteration_variables': [0.75, 0.0],
+                               'jacobian': [[2.0, 1.0], [0.0, 3.0]],
+                               'jacobian_updated': False,
+                               'residual_scaling': [1.0, 2.0],
+                               'residual_scaling_updated': False,
+                               'residuals': [1e-10, 0.0],
+                               'scaled_residual_norm': 1e-10}]}
+_block_1_t0 = {'block_index': 1, 'names': ['y'],
+               'initial_residual_scaling': [4.0],
+               'initial_residual_scaling_updated': True,
+               'kinsol_exit_flag': '1',
+               'iterations': [{'iteration_variables': [3.0],
+                               'jacobian': [[-1.0]],
+                               'jacobian_updated': True,
+                               'residual_scaling': [4.0],
+                               'residual_scaling_updated': False,
+                               'residuals': [0.0],
+                               'scaled_residual_norm': 0.0}]}
+_block_0_t05 = {'block_index': 0, 'names': ['x1', 'x2'],
+                'initial_residual_scaling': [1.0, 2.0],
+                'initial_residual_scaling_updated': False,
+                'kinsol_exit_flag': '0',
+                'iterations': [{'iteration_variables': [0.75, 0.0],
+                                'jacobian': [[2.0, 1.0], [0.0, 3.0]],
+                                'jacobian_updated': False,
+                                'residual_scaling': [1.0, 2.0],
+                                'residual_scaling_updated': False,
+                                'residuals': [1e-12, 0.0],
+                                'scaled_residual_norm': 1e-12}]}
+_block_1_t1 = {'block_index': 1, 'names': ['y'],
+               'initial_residual_scaling': [8.0],
+               'initial_residual_scaling_updated': True,
+               'kinsol_exit_flag': '0',
+               'iterations': [{'iteration_variables': [3.0],
+                               'jacobian': [[-2.0]],
+                               'jacobian_updated': True,
+                               'residual_scaling': [8.0],
+                               'residual_scaling_updated': False,
+                               'residuals': [4.0],
+                               'scaled_residual_norm': 0.5},
+                              {'iteration_variables': [1.0],
+                               'jacobian': [[-2.0]],
+                               'jacobian_updated': False,
+                               'residual_scaling': [8.0],
+                               'residual_scaling_updated': False,
+                               'residuals': [0.0],
+                               'scaled_residual_norm': 0.0}]}
+_structured_log = [{'time': 0.0, 'block_solves': [_block_0_t0, _block_1_t0]},
+                   {'time': 0.5, 'block_solves': [_block_0_t05]},
+                   {'time': 1.0, 'block_solves': [_block_1_t1]}]
+
+class TestLoggerUtil:
+    """Tests the parsing of the nonlinear solver information in FMU logs."""
+    
+    def setUp(self):
+        """
+        Sets up the test case.
+        """
+        self.log_file = os.path.join(path_to_fmu_logs, 'NLE_log.txt')
+        self.tmp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """
+        Removes the saved logs.
+        """
+        shutil.rmtree(self.tmp_dir)
+    
+    @testattr(stddist_base = True)
+    def test_structured_log(self):
+        """
+        Test that get_structured_fmu_log gives the reference structure.
+        """
+        assert get_structured_fmu_log(self.log_file) == _structured_log
+    
+    @testattr(stddist_base = True)
+    def test_columns(self):
+        """
+        Test the columns and vectors of the parsed log.
+        """
+        log = parse_fmu_log(self.log_file)
+        
+        N.testing.assert_array_equal(log.solve_time, [0.0, 0.5, 1.0])
+        N.testing.assert_array_equal(log.solve_block_ptr, [0, 2, 3, 4])
+        N.testing.assert_array_equal(log.block_index, [0, 1, 0, 1])
+        N.testing.assert_array_equal(log.block_iteration_ptr, [0, 2, 3, 4, 6])
+        assert list(log.get_vector('names', 3)) == ['y']
+        N.testing.assert_array_equal(log.get_vector('residuals', 0), 
+                                     [0.5, -0.25])
+        N.testing.assert_array_equal(log.get_jacobian(0), [[2.0, 1.0], 
+                                                           [0.0, 3.0]])
+        # The Jacobian of block 0 is only given once
+        N.testing.assert_array_equal(log.iteration_jacobian, 
+                                     [0, 0, 1, 0, 2, 2])
+    
+    @testattr(stddist_base = True)
+    def test_save_and_load(self):
+        """
+        Test that a saved log is loaded with the same contents.
+        """
+        log = parse_fmu_log(self.log_file)
+        file_name = os.path.join(self.tmp_dir, 'NLE_log.npz')
+        log.save(file_name)
+        loaded = load_fmu_log(file_name)
+        
+        for name in log._columns():
+            N.testing.assert_array_equal(getattr(loaded, name), 
+                                         getattr(log, name))
+        assert get_structured_fmu_log(file_name) == _structured_log
+        assert (get_structured_fmu_log(file_name, blocks=1, t_start=0.25) == 
+                get_structured_fmu_log(self.log_file, blocks=1, t_start=0.25))
+    
+    @testattr(stddist_base = True)
+    def test_filter(self):
+        """
+        Test the selection of block solves by block and time.
+        """
+        log = parse_fmu_log(self.log_file)
+        N.testing.assert_array_equal(log.select_block_solves(blocks=1), [1, 3])
+        N.testing.assert_array_equal(log.select_block_solves(t_end=0.5), 
+                                     [0, 1, 2])
+        
+        def solves(**kwargs):
+            return get_structured_fmu_log(self.log_file, **kwargs)
+        
+        assert solves(blocks=[0, 1]) == _structured_log
+        assert solves(blocks=1) == [
+            {'time': 0.0, 'block_solves': [_block_1_t0]}, _structured_log[2]]
+        assert solves(blocks=0) == [
+            {'time': 0.0, 'block_solves': [_block_0_t0]}, _structured_log[1]]
+        assert solves(blocks=2) == []
+        assert solves(t_start=0.25) == _structured_log[1:]
+        assert solves(t_end=0.5) == _structured_log[:2]
+        assert solves(t_start=0.5, t_end=0.5) == [_structured_log[1]]
+        assert solves(blocks=1, t_start=0.25, t_end=0.75) == []
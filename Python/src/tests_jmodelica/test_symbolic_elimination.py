@@ -29,6 +29,7 @@ from pymodelica import compile_fmu
 
 try: 
     from pyjmi.symbolic_elimination import BLTOptimizationProblem, EliminationOptions
+    from pyjmi.symbolic_elimination import BipartiteGraph, Equation, Variable, create_edges
     from pyjmi import transfer_optimization_problem
     import casadi
     from pyjmi.optimization.casadi_collocation import ExternalData
@@ -524,3 +525,110 @@ class TestSymbolicElimination(object):
         assert_results(res_blt, cost_ref, u_norm_ref, u_norm_rtol=1e-2)
         N.testing.assert_allclose([res_dae['p1'][0], res_dae['p3'][0]], [2.022765, 0.992965], rtol=2e-3)
         N.testing.assert_allclose([res_blt['p1'][0], res_blt['p3'][0]], [2.022765, 0.992965], rtol=2e-3)
+
+    @testattr(casadi_base = True)
+    def test_incidence(self):
+        """
+        Test that the incidence from the Jacobian sparsity gives the same edges and BLT as the
+        symbolic dependency check.
+        """
+        for op in [self.op_illust_automatic, self.op_loop_automatic, self.op_der_loop_automatic]:
+            blt_op = BLTOptimizationProblem(op)
+            graph = blt_op._graph
+            sparsity_edges = [(edge.eq.string, edge.var.name) for edge in graph.edges]
+            sparsity_matches = [(eq.string, var.name) for (eq, var) in graph.matches]
+            sparsity_blt = [sorted(var.name for var in co.variables) for co in graph.components]
+
+            # Recompute the edges and the BLT with the symbolic dependency check
+            symbolic_edges = create_edges(graph.equations, graph.variables)
+            assert sparsity_edges == [(edge.eq.string, edge.var.name) for edge in symbolic_edges]
+            symbolic_graph = BipartiteGraph(graph.equations, graph.variables, symbolic_edges,
+                                            EliminationOptions())
+            symbolic_graph.maximum_match()
+            symbolic_graph.scc()
+            assert sparsity_matches == [(eq.string, var.name) for (eq, var) in symbolic_graph.matches]
+            assert sparsity_blt == [sorted(var.name for var in co.variables)
+                                    for co in symbolic_graph.components]
+
+class TestBipartiteGraph(object):
+
+    """
+    Tests the matching and BLT of pyjmi.symbolic_elimination.BipartiteGraph against the
+    layered implementation of Hopcroft-Karp, on small hand-built graphs.
+    """
+
+    def _create_graph(self, residuals):
+        """
+        Creates a graph of equations given as functions of the variables x0, x1, ...
+        """
+        n = len(residuals)
+        mx_vars = [casadi.MX.sym('x%d' % i) for i in xrange(n)]
+        variables = [Variable('x%d' % i, i, i, False, False, mx_var=mx_vars[i])
+                     for i in xrange(n)]
+        equations = [Equation('e%d' % i, i, i, False, residuals[i](*mx_vars))
+                     for i in xrange(n)]
+        edges = create_edges(equations, variables)
+        return BipartiteGraph(equations, variables, edges, EliminationOptions())
+
+    def _match_and_blt(self, residuals, layered):
+        """
+        Computes the matching, as a sorted list of (equation, variable) names, and the BLT,
+        as a list of the sorted equation and variable names of each block.
+        """
+        graph = self._create_graph(residuals)
+        if layered:
+            graph._maximum_match_layered()
+        else:
+            graph.maximum_match()
+        edges = set((edge.eq, edge.var) for edge in graph.edges)
+        assert set(graph.matches) <= edges
+        assert len(set(eq for (eq, vari) in graph.matches)) == graph.n
+        assert len(set(vari for (eq, vari) in graph.matches)) == graph.n
+        matches = sorted((eq.string, vari.name) for (eq, vari) in graph.matches)
+        graph.scc()
+        blt = [(sorted(eq.string for eq in component.equations),
+                sorted(vari.name for vari in component.variables))
+               for component in graph.components]
+        return (matches, blt)
+
+    @testattr(casadi_base = True)
+    def test_perfect(self):
+        """
+        Test a lower triangular system, which has a unique matching.
+        """
+        residuals = [lambda x0, x1, x2: x0 - 1,
+                     lambda x0, x1, x2: x0 + x1,
+                     lambda x0, x1, x2: x0 + x1 * x2]
+        (matches, blt) = self._match_and_blt(residuals, False)
+        (matches_layered, blt_layered) = self._match_and_blt(residuals, True)
+        assert matches == [('e0', 'x0'), ('e1', 'x1'), ('e2', 'x2')]
+        assert matches == matches_layered
+        assert blt == [(['e0'], ['x0']), (['e1'], ['x1']), (['e2'], ['x2'])]
+        assert blt == blt_layered
+
+    @testattr(casadi_base = True)
+    def test_cyclic(self):
+        """
+        Test a system with an algebraic loop, for which the matching is not unique but the BLT is.
+        """
+        residuals = [lambda x0, x1, x2: x2 - x0 * x0,
+                     lambda x0, x1, x2: x0 + x1 - 3,
+                     lambda x0, x1, x2: x0 - x1 * x1]
+        (matches, blt) = self._match_and_blt(residuals, False)
+        (matches_layered, blt_layered) = self._match_and_blt(residuals, True)
+        assert ('e0', 'x2') in matches
+        assert ('e0', 'x2') in matches_layered
+        assert blt == [(['e1', 'e2'], ['x0', 'x1']), (['e0'], ['x2'])]
+        assert blt == blt_layered
+
+    @testattr(casadi_base = True)
+    def test_deficient(self):
+        """
+        Test a structurally singular system, in which no equation contains x2.
+        """
+        residuals = [lambda x0, x1, x2: x0 + x1,
+                     lambda x0, x1, x2: 2 * x0,
+                     lambda x0, x1, x2: x0 - 3]
+        N.testing.assert_raises(RuntimeError, self._create_graph(residuals).maximum_match)
+        N.testing.assert_raises(RuntimeError,
+                                self._create_graph(residuals)._maximum_match_layered)
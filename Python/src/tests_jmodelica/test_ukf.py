@@ -301,3 +301,29 @@ class Test_AlgorithmMethods_UKF:
         assert N.allclose(self.ukf.K, [[0.99995099], [0.00497003]])
         assert N.allclose(self.ukf.P, [[1.00099995e-01, 4.97003235e-07],
                                        [4.97003235e-07, 1.00115269e+00]])
+    
+    def test_predict_square_root(self):
+        #Test that the square root UKF gives the same prediction
+        self.ukf.update_options(square_root=True)
+        u = (['u'], N.transpose(N.vstack((0.0,0.1))))
+        self.ukf.predict(u, {})
+        assert N.allclose(self.ukf.xp, [[1.00988634], [0.0172094]])
+        assert N.allclose(self.ukf.yp, [[1.00988634]])
+        assert N.allclose(self.ukf.K, [[0.99995099], [0.00497003]])
+        assert N.allclose(self.ukf.P, [[1.00099995e-01, 4.97003235e-07],
+                                       [4.97003235e-07, 1.00115269e+00]])
+        assert N.allclose(self.ukf.S.dot(self.ukf.S.T), self.ukf.P)
+    
+    def test_predict_parallel(self):
+        #Test that simulating the sigma points in worker processes gives the same prediction
+        self.ukf.update_options(nbr_workers=2)
+        u = (['u'], N.transpose(N.vstack((0.0,0.1))))
+        try:
+            self.ukf.predict(u, {})
+        finally:
+            self.ukf.close()
+        assert N.allclose(self.ukf.xp, [[1.00988634], [0.0172094]])
+        assert N.allclose(self.ukf.yp, [[1.00988634]])
+        assert N.allclose(self.ukf.K, [[0.99995099], [0.00497003]])
+        assert N.allclose(self.ukf.P, [[1.00099995e-01, 4.97003235e-07],
+                                       [4.97003235e-07, 1.00115269e+00]])